@@ -0,0 +1,49 @@
+import argparse
+import time
+from dotenv import load_dotenv
+from shared.database import init_database
+from shared.models import backfill_link_keys
+
+#######################
+# 既存の招待リンクのlink_key（link IDのBIGINTキー）を埋めるマイグレーション
+# - init_database()で列・変換関数・トリガー・部分インデックスを作成してから、
+#   link_keyが未設定の行をid順にバッチ単位で更新する（1バッチ1トランザクション）
+# - 新しく作成される行はトリガーで設定されるため、Botを動かしたまま実行できる
+# - 途中で止めても、再実行すれば未設定の行から続きを処理する
+# - 完了したらget_role（とBot）で LINK_KEY_LOOKUP=1 を設定する
+#
+# 使い方:
+#   python backfill_link_keys.py
+#   python backfill_link_keys.py --batch-size 2000 --sleep 0.5
+#######################
+
+
+def main():
+    parser = argparse.ArgumentParser(description='招待リンクのlink_keyをバッチ単位で埋めます')
+    parser.add_argument('--batch-size', type=int, default=5000, help='1回のトランザクションで更新する行数')
+    parser.add_argument('--sleep', type=float, default=0.1, help='バッチ間の待機秒数（DBの負荷を抑える）')
+    args = parser.parse_args()
+
+    load_dotenv()
+    init_database()
+
+    started = time.monotonic()
+    total = 0
+    last_id = 0
+    while True:
+        count, batch_last_id = backfill_link_keys(last_id, args.batch_size)
+        if count is None:
+            print(f"バックフィルを中断しました（id {last_id} まで完了、再実行すると続きから処理します）")
+            raise SystemExit(1)
+        if batch_last_id is None:
+            break
+        total += count
+        last_id = batch_last_id
+        print(f"{total:,} 行を処理しました（id {last_id} まで）")
+        time.sleep(args.sleep)
+
+    print(f"完了: {total:,} 行を {time.monotonic() - started:.1f} 秒で処理しました")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+Gatewayキャッシュ設定ごとのメモリ使用量ベンチマーク
+
+N個の合成ギルド（GUILD_CREATEペイロード）と、Intentsに応じて届くイベント
+（メッセージ・ボイス状態など）をdiscord.pyの内部状態に読み込ませ、
+キャッシュ設定（CACHE_PROFILE）ごとのメモリ使用量を比較する。
+Discordには接続しない。各プロファイルは別プロセスで計測する。
+
+使い方:
+    cd discord_bot
+    python benchmarks/cache_memory.py --guilds 2000
+    python benchmarks/cache_memory.py --guilds 500 --roles 50 --channels 80 --members 200
+
+前提（Discordの仕様に合わせた合成データ）:
+    - GUILD_CREATEのmembersには、membersのIntentが無い場合は自分（Bot）とボイス接続中のメンバーだけが含まれる
+    - voice_statesはvoice_statesのIntentがある場合のみ、presencesはpresencesのIntentがある場合のみ含まれる
+    - MESSAGE_CREATEはguild_messagesのIntentがある場合のみ届く
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discord
+from shared.cache_profile import CACHE_PROFILES, build_client_options
+
+BOT_USER_ID = 10 ** 17
+
+
+def snowflake(kind: int, guild_index: int, index: int) -> str:
+    return str((kind * 10 ** 15) + guild_index * 10 ** 5 + index + 1)
+
+
+def make_user(user_id: str) -> dict:
+    return {'id': user_id, 'username': f"user{user_id[-6:]}", 'discriminator': '0', 'avatar': None, 'global_name': None}
+
+
+def make_guild_payload(guild_index: int, args, intents: discord.Intents) -> dict:
+    """合成のGUILD_CREATEペイロードを作成"""
+    guild_id = snowflake(1, guild_index, 0)
+    roles = [{
+        'id': guild_id if i == 0 else snowflake(2, guild_index, i), 'name': '@everyone' if i == 0 else f"role-{i}",
+        'color': 0, 'hoist': False, 'position': i, 'permissions': '0', 'managed': False, 'mentionable': False,
+    } for i in range(args.roles)]
+    channels = [{
+        'id': snowflake(3, guild_index, i), 'type': 2 if i % 10 == 9 else 0, 'name': f"channel-{i}",
+        'position': i, 'permission_overwrites': [], 'nsfw': False, 'parent_id': None,
+        'bitrate': 64000, 'user_limit': 0, 'rtc_region': None,
+    } for i in range(args.channels)]
+
+    member_ids = [snowflake(4, guild_index, i) for i in range(args.members)]
+    members = [{'user': make_user(str(BOT_USER_ID)), 'roles': [], 'joined_at': '2024-01-01T00:00:00+00:00', 'deaf': False, 'mute': False, 'flags': 0}]
+    if intents.members:
+        members += [{'user': make_user(m), 'roles': [roles[1]['id']] if len(roles) > 1 else [],
+                     'joined_at': '2024-01-01T00:00:00+00:00', 'deaf': False, 'mute': False, 'flags': 0} for m in member_ids]
+
+    voice_states = []
+    if intents.voice_states:
+        # ボイス接続中のメンバーはmembersのIntentが無くてもmembersに含まれる
+        if not intents.members:
+            members += [{'user': make_user(m), 'roles': [], 'joined_at': '2024-01-01T00:00:00+00:00', 'deaf': False,
+                         'mute': False, 'flags': 0} for m in member_ids[:args.voice]]
+        voice_channel = next((c['id'] for c in channels if c['type'] == 2), None)
+        for m in member_ids[:args.voice]:
+            voice_states.append({'user_id': m, 'channel_id': voice_channel, 'session_id': 'x', 'deaf': False,
+                                 'mute': False, 'self_deaf': False, 'self_mute': False, 'self_video': False,
+                                 'suppress': False, 'request_to_speak_timestamp': None,
+                                 'member': {'user': make_user(m), 'roles': [], 'joined_at': '2024-01-01T00:00:00+00:00',
+                                            'deaf': False, 'mute': False}})
+
+    presences = []
+    if intents.presences:
+        presences = [{'user': {'id': m}, 'status': 'online', 'activities': [], 'client_status': {'desktop': 'online'}}
+                     for m in member_ids[:args.members // 2]]
+
+    return {
+        'id': guild_id, 'name': f"guild-{guild_index}", 'icon': None, 'owner_id': member_ids[0] if member_ids else str(BOT_USER_ID),
+        'roles': roles, 'channels': channels, 'members': members, 'voice_states': voice_states, 'presences': presences,
+        'emojis': [], 'stickers': [], 'features': [], 'member_count': args.members + 1, 'threads': [],
+        'stage_instances': [], 'guild_scheduled_events': [], 'large': args.members > 250, 'unavailable': False,
+    }
+
+
+def make_message_payload(guild_payload: dict, index: int) -> dict:
+    channel = guild_payload['channels'][0]
+    author_id = guild_payload['owner_id']
+    return {
+        'id': str(10 ** 18 + index), 'channel_id': channel['id'], 'guild_id': guild_payload['id'],
+        'author': make_user(author_id), 'member': {'roles': [], 'joined_at': '2024-01-01T00:00:00+00:00', 'deaf': False, 'mute': False, 'flags': 0},
+        'content': '', 'timestamp': '2024-01-01T00:00:00+00:00', 'edited_timestamp': None, 'tts': False,
+        'mention_everyone': False, 'mentions': [], 'mention_roles': [], 'attachments': [], 'embeds': [],
+        'pinned': False, 'type': 0,
+    }
+
+
+def read_rss_kb() -> int:
+    """現在のRSS（KB）"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_profile(profile: str, args) -> dict:
+    """1つのプロファイルでギルドとイベントを読み込み、メモリ使用量を返す"""
+    options = build_client_options(profile)
+    client = discord.Client(**options)
+    state = client._connection
+    state.user = discord.ClientUser(state=state, data=make_user(str(BOT_USER_ID)) | {'bot': True})
+    intents = options['intents']
+
+    payloads = (make_guild_payload(i, args, intents) for i in range(args.guilds))
+    rss_before = read_rss_kb()
+    tracemalloc.start()
+    started = time.perf_counter()
+
+    messages = 0
+    for i, payload in enumerate(payloads):
+        state._add_guild_from_data(payload)
+        if intents.guild_messages:
+            for j in range(args.messages_per_guild):
+                state.parse_message_create(make_message_payload(payload, i * args.messages_per_guild + j))
+                messages += 1
+
+    elapsed = time.perf_counter() - started
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    guilds = list(client.guilds)
+    return {
+        'profile': profile,
+        'guilds': len(guilds),
+        'cached_members': sum(len(g._members) for g in guilds),
+        'cached_messages': len(state._messages) if state._messages is not None else 0,
+        'messages_received': messages,
+        'traced_mb': current / 1024 / 1024,
+        'rss_delta_mb': (read_rss_kb() - rss_before) / 1024,
+        'load_seconds': elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gatewayキャッシュ設定ごとのメモリ使用量を比較します")
+    parser.add_argument('--guilds', type=int, default=1000)
+    parser.add_argument('--roles', type=int, default=30)
+    parser.add_argument('--channels', type=int, default=40)
+    parser.add_argument('--members', type=int, default=100, help="ギルドごとのメンバー数（membersのIntentがある場合のみ届く）")
+    parser.add_argument('--voice', type=int, default=5, help="ギルドごとのボイス接続中のメンバー数")
+    parser.add_argument('--messages-per-guild', type=int, default=5)
+    parser.add_argument('--profiles', default=','.join(CACHE_PROFILES))
+    parser.add_argument('--run-profile', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # 子プロセスとして1つのプロファイルを計測
+    if args.run_profile:
+        print(json.dumps(run_profile(args.run_profile, args)))
+        return
+
+    passthrough = [a for a in sys.argv[1:] if not a.startswith('--profiles')]
+    results = []
+    for profile in args.profiles.split(','):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), *passthrough, '--run-profile', profile],
+                                capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"guilds={args.guilds} roles={args.roles} channels={args.channels} members={args.members} "
+          f"voice={args.voice} messages/guild={args.messages_per_guild}")
+    print(f"{'profile':<10}{'members':>10}{'messages':>10}{'traced MB':>12}{'RSS +MB':>10}{'load s':>8}")
+    for r in results:
+        print(f"{r['profile']:<10}{r['cached_members']:>10}{r['cached_messages']:>10}"
+              f"{r['traced_mb']:>12.1f}{r['rss_delta_mb']:>10.1f}{r['load_seconds']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+link IDの生成速度と衝突確率のベンチマーク
+
+- 以前の実装（1文字ずつsecrets.choice）と、shared/link_id.py の実装（randbelowを1回）の生成速度を比較する
+- 現在のテーブル件数（DATABASE_URLがあればrole_invite_linksのCOUNT、無ければ--rows）での
+  文字種・桁数ごとの衝突確率を表示する
+
+使い方:
+    cd discord_bot
+    python benchmarks/link_ids.py
+    python benchmarks/link_ids.py --rows 1000000 --iterations 200000
+"""
+import argparse
+import os
+import secrets
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.link_id import LINK_ID_ALPHABETS, LINK_ID_MAX_ATTEMPTS, collision_probability, generate_link_id
+
+LEGACY_CHARS = string.ascii_lowercase + string.digits
+
+
+def legacy_generate_link_id() -> str:
+    return ''.join(secrets.choice(LEGACY_CHARS) for _ in range(10))
+
+
+def count_table_rows() -> int:
+    """role_invite_linksの件数（DBに接続できない場合はNone）"""
+    if not os.getenv('DATABASE_URL'):
+        return None
+    try:
+        from shared.database import get_db_cursor
+        with get_db_cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) AS count FROM role_invite_links")
+            return cursor.fetchone()['count']
+    except Exception as e:
+        print(f"DBから件数を取得できませんでした（--rowsを使います）: {e}")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=100000, help='生成速度の計測回数')
+    parser.add_argument('--rows', type=int, default=100000, help='DBに接続できない場合に仮定するテーブル件数')
+    parser.add_argument('--lengths', default='8,10,12', help='衝突確率を表示する桁数（カンマ区切り）')
+    args = parser.parse_args()
+
+    print(f"生成速度（{args.iterations:,}回）")
+    base36, base62 = LINK_ID_ALPHABETS['base36'], LINK_ID_ALPHABETS['base62']
+    candidates = [
+        ('legacy secrets.choice x10', legacy_generate_link_id),
+        ('randbelow base36 x10', lambda: generate_link_id(10, base36)),
+        ('randbelow base62 x10', lambda: generate_link_id(10, base62)),
+    ]
+    baseline = None
+    for name, func in candidates:
+        seconds = timeit.timeit(func, number=args.iterations)
+        per_id = seconds / args.iterations * 1e6
+        baseline = baseline or per_id
+        print(f"  {name:<28} {per_id:7.3f} µs/ID  (x{baseline / per_id:.1f})")
+
+    rows = count_table_rows()
+    source = 'role_invite_links'
+    if rows is None:
+        rows, source = args.rows, '--rows'
+    print(f"\n衝突確率（テーブル件数 {rows:,} 件, {source}）")
+    print(f"  {'文字種':<8}{'桁数':>4}  {'1件生成時':>12}  {'再試行{}回でも失敗'.format(LINK_ID_MAX_ATTEMPTS):>18}  {'全件の中に衝突がある':>18}")
+    for alphabet_name, alphabet in LINK_ID_ALPHABETS.items():
+        for length in (int(value) for value in args.lengths.split(',')):
+            single = collision_probability(rows, 1, length, alphabet)
+            exhausted = single ** LINK_ID_MAX_ATTEMPTS
+            table = collision_probability(0, rows, length, alphabet)
+            print(f"  {alphabet_name:<8}{length:>6}  {single:>14.3e}  {exhausted:>22.3e}  {table:>20.3e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,30 @@
 import os
-import time
+import io
+import sys
+import re
+import csv
+import json
+import asyncio
+import tempfile
 import discord
 from discord.ext import commands
 from dotenv import load_dotenv
-import string
-import secrets
-from datetime import datetime, timedelta, timezone
-from shared.models import save_invite_link, get_guild_invite_links, get_user_invite_links, delete_invite_link
+from datetime import datetime, timedelta
+from shared.models import create_invite_link, save_invite_links_bulk, count_invite_links, get_guild_invite_links_page, get_user_invite_links_page, delete_invite_link, get_guild_usage_rollups, get_invite_link_version, iter_guild_invite_links_for_export, import_guild_invite_links, INVITE_LINK_TRANSFER_COLUMNS
 from shared.database import init_database
+from shared.render_cache import VersionedRenderCache
+from shared.cache_profile import build_client_options
+from shared.link_id import generate_link_id
+from shared.expiry import JST, CREATED_FORMAT, parse_expiry, format_jst
+from command_sync import CommandSyncManager
+from premium_members import PremiumMemberCache
+from monitoring import BotHealthServer, CommandMetrics
+from loop_watchdog import LoopBlockingWatchdog
+from sharding import resolve_shard_config, format_shard_ids
 
 # 環境変数を読み込み
 load_dotenv()
 
-# タイムゾーン設定（日本時間）
-JST = timezone(timedelta(hours=9))
-
 # Bot設定
 TOKEN = os.getenv('DISCORD_TOKEN')
 DEV_GUILD_ID = int(os.getenv('DISCORD_DEV_GUILD_ID', 0))
@@ -23,23 +33,85 @@ PREMIUM_ROLE_ID = int(os.getenv('PREMIUM_ROLE_ID', 0))
 FREE_USER_PERSONAL_LINK_LIMIT = int(os.getenv('FREE_USER_PERSONAL_LINK_LIMIT', 3))
 FREE_USER_SERVER_LINK_LIMIT = int(os.getenv('FREE_USER_SERVER_LINK_LIMIT', 10))
 
-# Intentsの設定
-intents = discord.Intents.default()
+# プレミアムサポートサーバーのメンバーをキャッシュしてプレミアム判定する（要: members特権Intent）
+PREMIUM_MEMBER_CACHE = os.getenv('PREMIUM_MEMBER_CACHE', '0') == '1' and bool(PREMIUM_ROLE_ID and DEV_GUILD_ID)
+
+# Intents・キャッシュの設定（環境変数CACHE_PROFILE、詳細はshared/cache_profile.py）
+client_options = build_client_options(premium_members=PREMIUM_MEMBER_CACHE)
+
+# シャード設定（環境変数SHARD_COUNT / SHARD_IDSなど、詳細はsharding.py）
+SHARD_COUNT, SHARD_IDS = resolve_shard_config()
+SHARD_LABEL = format_shard_ids(SHARD_IDS) if SHARD_IDS is not None else 'all'
+
+# シャードIDの0を担当するプロセスだけがスラッシュコマンドを同期する
+IS_PRIMARY_SHARD_PROCESS = SHARD_IDS is None or 0 in SHARD_IDS
+
+# DBの接続にどのシャードのプロセスかを表示する（pg_stat_activityで確認できる）
+os.environ.setdefault('DB_APPLICATION_NAME', f"discord_bot shards={SHARD_LABEL}")
+
+# Botインスタンス作成（自動シャーディング）
+bot = commands.AutoShardedBot(command_prefix=None, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS, **client_options)
+
+# スラッシュコマンドの同期管理（--sync-commands で起動した場合は起動時に強制同期）
+COMMAND_SYNC = CommandSyncManager(bot.tree)
+FORCE_COMMAND_SYNC = False
+
+#######################
+# 監視用HTTPサーバーとメトリクス（詳細はmonitoring.py）
+# - METRICS_PORTを設定した場合のみ起動する（shard_launcher.pyはプロセスごとに+1したポートを渡す）
+# - /metrics はMETRICS_TOKENのBearerトークンで保護する
+#######################
+
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+HEALTH_SERVER = BotHealthServer(bot, METRICS_PORT, token=os.getenv('METRICS_TOKEN', '')) if METRICS_PORT else None
+COMMAND_METRICS = CommandMetrics()
 
-# Botインスタンス作成
-bot = commands.Bot(command_prefix=None, intents=intents)
+# イベントループのブロッキング検出（LOOP_WATCHDOG=1、詳細はloop_watchdog.py）
+LOOP_WATCHDOG = LoopBlockingWatchdog(
+    threshold=float(os.getenv('LOOP_BLOCK_THRESHOLD_MS', 100)) / 1000,
+    log_path=os.getenv('LOOP_WATCHDOG_LOG') or None
+) if os.getenv('LOOP_WATCHDOG', '0') == '1' else None
+
+@bot.event
+async def setup_hook():
+    if HEALTH_SERVER:
+        await HEALTH_SERVER.start()
+    if LOOP_WATCHDOG:
+        LOOP_WATCHDOG.start()
+
+@bot.listen('on_interaction')
+async def metrics_on_interaction(interaction: discord.Interaction):
+    COMMAND_METRICS.start(interaction)
+
+@bot.listen('on_app_command_completion')
+async def metrics_on_app_command_completion(interaction: discord.Interaction, command):
+    COMMAND_METRICS.finish(interaction)
+
+@bot.tree.error
+async def on_app_command_error(interaction: discord.Interaction, error: discord.app_commands.AppCommandError):
+    COMMAND_METRICS.finish(interaction, error)
+    # メトリクスを記録した後は、discord.pyの既定の処理でトレースバック付きのログを出す
+    await discord.app_commands.CommandTree.on_error(bot.tree, interaction, error)
 
 @bot.event
 async def on_ready():
     """Bot起動時の処理"""
     print(f'{bot.user} がログインしました!')
     print(f'Bot ID: {bot.user.id}')
+    print(f'シャード: {format_shard_ids(bot.shards.keys())} / 全{bot.shard_count}シャード, サーバー数: {len(bot.guilds)}')
     
-    # スラッシュコマンドをグローバルに同期
+    # スラッシュコマンドをグローバルに同期（前回の同期からコマンド定義が変わった場合のみ）
+    # コマンドはグローバルなので、複数プロセスで動かす場合はシャード0を担当するプロセスだけが行う
     try:
-        synced = await bot.tree.sync()
-        print(f'グローバルに {len(synced)} 個のスラッシュコマンドを同期しました')
-        print('注意: グローバルコマンドの反映には最大1時間かかる場合があります')
+        if IS_PRIMARY_SHARD_PROCESS:
+            synced, count = await COMMAND_SYNC.sync_if_changed(bot.application_id, force=FORCE_COMMAND_SYNC)
+        else:
+            synced, count = False, 0
+        if synced:
+            print(f'グローバルに {count} 個のスラッシュコマンドを同期しました')
+            print('注意: グローバルコマンドの反映には最大1時間かかる場合があります')
+        elif IS_PRIMARY_SHARD_PROCESS:
+            print('スラッシュコマンドに変更がないため、同期をスキップしました')
     except Exception as e:
         print(f'スラッシュコマンドの同期に失敗しました: {e}')
     
@@ -58,6 +130,60 @@ async def on_ready():
 # - ユーザー情報はfetchで取得します。
 #######################
 
+#######################
+# プレミアムメンバーのキャッシュ（PREMIUM_MEMBER_CACHE=1、詳細はpremium_members.py）
+# - 他のイベントハンドラを上書きしないよう、bot.listen()で登録する
+#######################
+
+PREMIUM_MEMBERS = PremiumMemberCache(DEV_GUILD_ID, PREMIUM_ROLE_ID)
+
+async def load_premium_members(guild: discord.Guild):
+    try:
+        count = await PREMIUM_MEMBERS.load(guild)
+        print(f'プレミアムメンバーを読み込みました: {count}人（{guild.name}）')
+    except Exception as e:
+        PREMIUM_MEMBERS.reset()
+        print(f'プレミアムメンバーの読み込みに失敗しました（RESTで判定します）: {e}')
+
+if PREMIUM_MEMBER_CACHE:
+    # 接続・再接続（新しいセッション）のたびにGUILD_CREATEが届き、サーバーのオブジェクトが作り直されるため再取得する
+    @bot.listen('on_guild_available')
+    async def premium_on_guild_available(guild: discord.Guild):
+        if PREMIUM_MEMBERS.handles(guild):
+            await load_premium_members(guild)
+
+    @bot.listen('on_guild_unavailable')
+    async def premium_on_guild_unavailable(guild: discord.Guild):
+        if PREMIUM_MEMBERS.handles(guild):
+            PREMIUM_MEMBERS.reset()
+
+    # on_member_updateはキャッシュ済みのメンバーにしか届かないため、新しく参加したメンバーもキャッシュに加える
+    @bot.listen('on_member_join')
+    async def premium_on_member_join(member: discord.Member):
+        if PREMIUM_MEMBERS.handles(member.guild):
+            PREMIUM_MEMBERS.apply(member)
+            try:
+                await member.guild.query_members(user_ids=[member.id], cache=True)
+            except Exception as e:
+                print(f'参加したメンバーのキャッシュに失敗しました: {e}')
+
+    @bot.listen('on_member_update')
+    async def premium_on_member_update(before: discord.Member, after: discord.Member):
+        if PREMIUM_MEMBERS.handles(after.guild):
+            PREMIUM_MEMBERS.apply(after)
+
+    # ロールが削除されてもメンバーの更新イベントは届かないため、集合を空にする
+    @bot.listen('on_guild_role_delete')
+    async def premium_on_guild_role_delete(role: discord.Role):
+        if role.id == PREMIUM_MEMBERS.role_id:
+            PREMIUM_MEMBERS.user_ids.clear()
+
+    # キャッシュに無いメンバーが抜けた場合も届くよう、raw イベントで受け取る
+    @bot.listen('on_raw_member_remove')
+    async def premium_on_raw_member_remove(payload: discord.RawMemberRemoveEvent):
+        if payload.guild_id == PREMIUM_MEMBERS.guild_id:
+            PREMIUM_MEMBERS.discard(payload.user.id)
+
 async def has_premium_role(user: discord.User) -> bool:
     """
     ユーザーがプレミアムロールを持っているかどうかをチェック
@@ -73,6 +199,12 @@ async def has_premium_role(user: discord.User) -> bool:
         if not PREMIUM_ROLE_ID or not DEV_GUILD_ID:
             return False
         
+        # プレミアムメンバーのキャッシュが使える場合はRESTを呼ばずに判定する
+        if PREMIUM_MEMBER_CACHE:
+            cached = PREMIUM_MEMBERS.lookup(user.id)
+            if cached is not None:
+                return cached
+        
         # 開発用ギルドを取得
         guild = bot.get_guild(DEV_GUILD_ID)
         if not guild:
@@ -100,13 +232,14 @@ async def has_premium_role(user: discord.User) -> bool:
         print(f"プレミアムロールのチェック中にエラーが発生しました: {e}")
         return False
 
-async def check_invite_link_limits(user: discord.User, guild_id: int) -> tuple[bool, str]:
+async def check_invite_link_limits(user: discord.User, guild_id: int, count: int = 1) -> tuple[bool, str]:
     """
     招待リンク作成制限をチェック
     
     Args:
         user: チェック対象のDiscordユーザー
         guild_id: 対象のギルドID
+        count: これから作成する招待リンクの数
         
     Returns:
         tuple[bool, str]: (制限内かどうか, エラーメッセージ)
@@ -116,18 +249,19 @@ async def check_invite_link_limits(user: discord.User, guild_id: int) -> tuple[b
         if await has_premium_role(user):
             return True, ""
         
-        # フリーユーザーの制限チェック
-        from shared.models import get_user_invite_links, get_guild_invite_links
+        # フリーユーザーの制限チェック（個人とサーバーのリンク数を1回のクエリで取得）
+        counts = count_invite_links(user.id, guild_id)
+        if counts is None:
+            return False, "制限チェック中にエラーが発生しました。"
+        user_link_count, guild_link_count = counts
         
         # 個人の招待リンク数をチェック
-        user_links = get_user_invite_links(user.id)
-        if len(user_links) >= FREE_USER_PERSONAL_LINK_LIMIT:
-            return False, f"フリープランでは個人の招待リンクは最大{FREE_USER_PERSONAL_LINK_LIMIT}個までです。プレミアムプランへのアップグレードや既存リンクの削除方法については、こちらをご確認ください: {os.getenv('OFFICIAL_WEBSITE_URL', 'https://discord-invitation-and-rol-bote.kei31.com/')}"
+        if user_link_count + count > FREE_USER_PERSONAL_LINK_LIMIT:
+            return False, f"フリープランでは個人の招待リンクは最大{FREE_USER_PERSONAL_LINK_LIMIT}個までです（現在{user_link_count}個）。プレミアムプランへのアップグレードや既存リンクの削除方法については、こちらをご確認ください: {os.getenv('OFFICIAL_WEBSITE_URL', 'https://discord-invitation-and-rol-bote.kei31.com/')}"
         
         # サーバーの招待リンク数をチェック
-        guild_links = get_guild_invite_links(guild_id)
-        if len(guild_links) >= FREE_USER_SERVER_LINK_LIMIT:
-            return False, f"フリープランでは1サーバーあたりの招待リンクは最大{FREE_USER_SERVER_LINK_LIMIT}個までです。プレミアムプランへのアップグレードや既存リンクの削除方法については、こちらをご確認ください: {os.getenv('OFFICIAL_WEBSITE_URL', 'https://discord-invitation-and-rol-bote.kei31.com/')}"
+        if guild_link_count + count > FREE_USER_SERVER_LINK_LIMIT:
+            return False, f"フリープランでは1サーバーあたりの招待リンクは最大{FREE_USER_SERVER_LINK_LIMIT}個までです（現在{guild_link_count}個）。プレミアムプランへのアップグレードや既存リンクの削除方法については、こちらをご確認ください: {os.getenv('OFFICIAL_WEBSITE_URL', 'https://discord-invitation-and-rol-bote.kei31.com/')}"
         
         return True, ""
         
@@ -149,59 +283,19 @@ async def check_invite_link_limits(user: discord.User, guild_id: int) -> tuple[b
 # - ユーザーがプレミアムロールを持っていない場合、
 #   - 個人用の招待リンクは最大FREE_USER_PERSONAL_LINK_LIMIT個以上は作成できない
 #   - サーバー用の招待リンクは最大FREE_USER_SERVER_LINK_LIMIT個以上は作成できない
-# - 10桁のランダムな半角小文字の英数字を生成してlink IDとする
-# - これをデータベースに保存する
+# - ランダムなlink ID（既定は10桁の半角小文字の英数字、shared/link_id.py）を生成してデータベースに保存する
+# - link IDが既存のものと衝突した場合は作り直して再試行する
 # - 生成した招待リンクを返す
 #######################
 
-def generate_link_id() -> str:
-    """10桁のランダムな半角小文字の英数字を生成"""
-    chars = string.ascii_lowercase + string.digits
-    return ''.join(secrets.choice(chars) for _ in range(10))
-
 def parse_expires_at(expires_str: str) -> tuple:
     """日付文字列をパースして(表示用JST文字列, Unixタイムスタンプ)のタプルを返す"""
     if not expires_str:
         return None, None
     
-    # 現在の日本時間を取得
-    now_jst = datetime.now(JST)
-    
-    # 相対時間の処理（例：1d, 2h, 30m）
-    if expires_str.endswith('d'):
-        days = int(expires_str[:-1])
-        future_time = now_jst + timedelta(days=days)
-    elif expires_str.endswith('h'):
-        hours = int(expires_str[:-1])
-        future_time = now_jst + timedelta(hours=hours)
-    elif expires_str.endswith('m'):
-        minutes = int(expires_str[:-1])
-        future_time = now_jst + timedelta(minutes=minutes)
-    else:
-        # 絶対時間の処理（例：2024-12-31, 2024-12-31 23:59）
-        # 日本時間として解釈
-        try:
-            # YYYY-MM-DD HH:MM 形式
-            if len(expires_str) == 16:
-                parsed_time = datetime.strptime(expires_str, '%Y-%m-%d %H:%M')
-            # YYYY-MM-DD 形式（時刻は23:59に設定）
-            elif len(expires_str) == 10:
-                parsed_time = datetime.strptime(expires_str + ' 23:59', '%Y-%m-%d %H:%M')
-            else:
-                raise ValueError("Invalid date format")
-            
-            # JSTタイムゾーンを設定
-            future_time = parsed_time.replace(tzinfo=JST)
-        except ValueError:
-            raise ValueError(f"無効な日付形式です: {expires_str}")
-    
-    # 表示用JST文字列
-    display_str = future_time.strftime('%Y-%m-%d %H:%M JST')
-    
-    # Unixタイムスタンプ
-    unix_timestamp = int(future_time.timestamp())
-    
-    return display_str, unix_timestamp
+    # 解析はshared/expiry.pyのparse_expiry()に一本化（日本時間として解釈）
+    unix_timestamp = parse_expiry(expires_str)
+    return format_jst(unix_timestamp), unix_timestamp
 
 @bot.tree.command(name="generate_invite_link", description="ロール招待リンクを生成します")
 @discord.app_commands.describe(
@@ -233,26 +327,23 @@ async def generate_invite_link(interaction: discord.Interaction, role: discord.R
         await interaction.response.send_message(f"❌ {str(e)}", ephemeral=True)
         return
     
-    # 10桁のランダムなlink IDを生成
-    link_id = generate_link_id()
-    
     # 作成日時を生成（JST）
     now_jst = datetime.now(JST)
-    created_at_display = now_jst.strftime('%Y-%m-%d %H:%M:%S JST')
     created_at_unix = int(now_jst.timestamp())
+    created_at_display = format_jst(created_at_unix, CREATED_FORMAT)
     
-    # データベースに保存
-    if not save_invite_link(
+    # link IDを生成してデータベースに保存（IDが衝突した場合は作り直して再試行）
+    link_id = create_invite_link(
         guild_id=interaction.guild.id, 
         role_id=role.id, 
-        link_id=link_id, 
         created_by_user_id=interaction.user.id, 
         max_uses=max_uses, 
         expires_at=expires_display, 
         expires_at_unix=expires_unix,
         created_at=created_at_display,
         created_at_unix=created_at_unix
-    ):
+    )
+    if not link_id:
         await interaction.response.send_message("❌ データベースへの保存に失敗しました。", ephemeral=True)
         return
     
@@ -289,6 +380,121 @@ async def generate_invite_link(interaction: discord.Interaction, role: discord.R
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
 
+#######################
+# 招待リンクをまとめて生成するスラッシュコマンド
+# - /generate_invite_links_bulk
+# - 引数: role, count, max_uses(optional), expires_at(optional)
+# - イベントなどで1つのロールに対して多数のリンクが必要な場合に使う
+# - 権限・制限の考え方は/generate_invite_linkと同じ（作成数countを含めて制限をチェック）
+# - 制限チェックは1回のCOUNTクエリ、保存は1回の複数行INSERTで行う
+# - link IDが既存のものと衝突した分だけ、IDを作り直して再度保存する
+# - 生成したリンクはCSVファイルとして添付して返す
+#######################
+
+BULK_LINK_MAX_COUNT = 100
+BULK_LINK_MAX_ATTEMPTS = 3
+
+@bot.tree.command(name="generate_invite_links_bulk", description="ロール招待リンクをまとめて生成し、CSVファイルで返します")
+@discord.app_commands.describe(
+    role="招待リンクを生成するロール",
+    count=f"生成するリンクの数（1〜{BULK_LINK_MAX_COUNT}）",
+    max_uses="各リンクの最大使用回数（例：5）",
+    expires_at="有効期限・日本時間（例：7d, 24h, 2024-12-31, 2024-12-31 23:59）"
+)
+async def generate_invite_links_bulk(interaction: discord.Interaction, role: discord.Role,
+                                     count: discord.app_commands.Range[int, 1, BULK_LINK_MAX_COUNT],
+                                     max_uses: int = None, expires_at: str = None):
+    """ロール招待リンクをまとめて生成するスラッシュコマンド"""
+    
+    # 管理権限チェック
+    if not interaction.user.guild_permissions.manage_guild:
+        await interaction.response.send_message("❌ このコマンドを使用するには「サーバー管理」権限が必要です。", ephemeral=True)
+        return
+    
+    # 日付文字列をパース
+    try:
+        if expires_at:
+            expires_display, expires_unix = parse_expires_at(expires_at)
+        else:
+            expires_display, expires_unix = None, None
+    except ValueError as e:
+        await interaction.response.send_message(f"❌ {str(e)}", ephemeral=True)
+        return
+    
+    await interaction.response.defer(ephemeral=True)
+    
+    # 招待リンク制限チェック（今回作成する数を含める）
+    can_create, error_message = await check_invite_link_limits(interaction.user, interaction.guild.id, count)
+    if not can_create:
+        await interaction.followup.send(f"❌ {error_message}", ephemeral=True)
+        return
+    
+    # 作成日時を生成（JST）
+    now_jst = datetime.now(JST)
+    created_at_unix = int(now_jst.timestamp())
+    created_at_display = format_jst(created_at_unix, CREATED_FORMAT)
+    
+    # 複数行INSERTで保存（link IDが衝突した分だけ作り直す）
+    saved_link_ids = []
+    for _ in range(BULK_LINK_MAX_ATTEMPTS):
+        remaining = count - len(saved_link_ids)
+        if remaining <= 0:
+            break
+        link_ids = {generate_link_id() for _ in range(remaining)}
+        rows = [
+            (interaction.guild.id, role.id, link_id, interaction.user.id, max_uses,
+             expires_display, expires_unix, created_at_display, created_at_unix)
+            for link_id in link_ids
+        ]
+        saved_link_ids.extend(save_invite_links_bulk(rows))
+    
+    if not saved_link_ids:
+        await interaction.followup.send("❌ データベースへの保存に失敗しました。", ephemeral=True)
+        return
+    
+    # CSVファイルを作成（Excelで文字化けしないようBOM付きUTF-8）
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['link_id', 'url', 'role_id', 'role_name', 'max_uses', 'expires_at'])
+    for link_id in saved_link_ids:
+        writer.writerow([link_id, f"{BASE_URL}/join/{link_id}", role.id, role.name,
+                         max_uses or '', expires_display or ''])
+    csv_file = discord.File(
+        io.BytesIO(buffer.getvalue().encode('utf-8-sig')),
+        filename=f"invite_links_{interaction.guild.id}_{now_jst.strftime('%Y%m%d%H%M%S')}.csv"
+    )
+    
+    # 結果を返す
+    embed = discord.Embed(
+        title="🎉 招待リンクをまとめて生成しました",
+        description=f"{len(saved_link_ids)}個の招待リンクを添付のCSVファイルに出力しました。",
+        color=0x00ff00
+    )
+    embed.add_field(name="サーバー", value=interaction.guild.name, inline=True)
+    embed.add_field(name="対象ロール", value=role.mention, inline=True)
+    embed.add_field(name="作成者", value=interaction.user.mention, inline=True)
+    if max_uses:
+        embed.add_field(name="最大使用回数（各リンク）", value=str(max_uses), inline=True)
+    if expires_display:
+        embed.add_field(name="有効期限（日本時間）", value=expires_display, inline=True)
+    if len(saved_link_ids) < count:
+        embed.add_field(
+            name="⚠️ 一部のリンクを作成できませんでした",
+            value=f"{count}個中{len(saved_link_ids)}個のみ作成されました。",
+            inline=False
+        )
+    
+    # セキュリティ注意書きを追加
+    embed.add_field(
+        name="⚠️ 重要な注意事項",
+        value="**このリンクを知っている人は誰でもサーバーに参加してロールを取得できます。リンクの管理を厳重に行い、信頼できる人にのみ共有してください。**",
+        inline=False
+    )
+    embed.set_footer(text=f"生成日時: {created_at_display}")
+    
+    await interaction.followup.send(embed=embed, file=csv_file, ephemeral=True)
+
+
 #################
 # そのサーバー内でロールを付与するためのリンクを一覧表示して削除するスラッシュコマンド
 # - /list_server_invite_links
@@ -307,64 +513,50 @@ async def generate_invite_link(interaction: discord.Interaction, role: discord.R
 # - プルダウンメニューから選んでdeleteボタンを押すと、その行をデータベースから削除する
 #################
 
+def build_invite_link_options(invite_links: list, guild: discord.Guild = None, is_user_view: bool = False) -> list:
+    """招待リンクのプルダウンメニューの選択肢を作成"""
+    select_options = []
+    for link in invite_links[:25]:  # Discordの制限で最大25個
+        if is_user_view:
+            # ユーザー用：ギルド名とロール名を取得
+            guild = bot.get_guild(link.guild_id)
+            guild_name = guild.name if guild else f"不明サーバー({link.guild_id})"
+            
+            if guild:
+                role = guild.get_role(link.role_id)
+                role_name = role.name if role else "不明ロール"
+            else:
+                role_name = "不明ロール"
+            
+            label_text = f"{guild_name} - {role_name} ({link.link_id})"
+        else:
+            # 管理者用：ロール名のみ取得
+            role = guild.get_role(link.role_id)
+            role_name = role.name if role else "不明ロール"
+            label_text = f"{role_name} ({link.link_id})"
+        
+        select_options.append(discord.SelectOption(
+            label=f"{link.status_icon} {label_text}",
+            value=link.link_id,
+            description=f"使用: {link.uses_text}"
+        ))
+    return select_options
+
 class InviteLinkSelectView(discord.ui.View):
-    def __init__(self, invite_links: list, guild: discord.Guild = None, is_user_view: bool = False):
+    def __init__(self, invite_links: list, guild: discord.Guild = None, is_user_view: bool = False, select_options: list = None):
         super().__init__(timeout=300)
         self.invite_links = invite_links
         self.guild = guild
         self.is_user_view = is_user_view
         
-        # プルダウンメニュー作成
+        # プルダウンメニュー作成（キャッシュ済みの選択肢があればそれを使う）
         if invite_links:
-            select_options = []
-            for link in invite_links[:25]:  # Discordの制限で最大25個
-                if self.is_user_view:
-                    # ユーザー用：ギルド名とロール名を取得
-                    guild = bot.get_guild(link['guild_id'])
-                    guild_name = guild.name if guild else f"不明サーバー({link['guild_id']})"
-                    
-                    if guild:
-                        role = guild.get_role(link['role_id'])
-                        role_name = role.name if role else "不明ロール"
-                    else:
-                        role_name = "不明ロール"
-                    
-                    label_text = f"{guild_name} - {role_name} ({link['link_id']})"
-                else:
-                    # 管理者用：ロール名のみ取得
-                    role = self.guild.get_role(link['role_id'])
-                    role_name = role.name if role else "不明ロール"
-                    label_text = f"{role_name} ({link['link_id']})"
-                
-                # 使用可能かどうかをチェック
-                is_expired = False
-                is_usage_exceeded = False
-                
-                # 有効期限チェック（Unixタイムスタンプで比較）
-                if link['expires_at_unix']:
-                    now_unix = int(time.time())
-                    if now_unix > link['expires_at_unix']:
-                        is_expired = True
-                
-                # 使用回数チェック
-                if link['max_uses'] and link['current_uses'] >= link['max_uses']:
-                    is_usage_exceeded = True
-                
-                # アイコン決定
-                if is_expired or is_usage_exceeded:
-                    icon = "❌"
-                else:
-                    icon = "✅"
-                
-                select_options.append(discord.SelectOption(
-                    label=f"{icon} {label_text}",
-                    value=link['link_id'],
-                    description=f"使用: {link['current_uses']}/{link['max_uses'] or '無制限'}"
-                ))
+            if select_options is None:
+                select_options = build_invite_link_options(invite_links, guild, is_user_view)
             
             self.select_menu = discord.ui.Select(
                 placeholder="削除する招待リンクを選択してください",
-                options=select_options
+                options=list(select_options)
             )
             self.select_menu.callback = self.select_callback
             self.add_item(self.select_menu)
@@ -374,18 +566,18 @@ class InviteLinkSelectView(discord.ui.View):
         selected_link_id = interaction.data['values'][0]
         
         # 選択されたリンクの情報を取得
-        selected_link = next((link for link in self.invite_links if link['link_id'] == selected_link_id), None)
+        selected_link = next((link for link in self.invite_links if link.link_id == selected_link_id), None)
         if not selected_link:
             await interaction.response.send_message("❌ 選択されたリンクが見つかりません。", ephemeral=True)
             return
         
         if self.is_user_view:
             # ユーザー用：ギルド名とロール名を取得
-            guild = bot.get_guild(selected_link['guild_id'])
-            guild_name = guild.name if guild else f"不明サーバー({selected_link['guild_id']})"
+            guild = bot.get_guild(selected_link.guild_id)
+            guild_name = guild.name if guild else f"不明サーバー({selected_link.guild_id})"
             
             if guild:
-                role = guild.get_role(selected_link['role_id'])
+                role = guild.get_role(selected_link.role_id)
                 role_name = role.name if role else "不明ロール"
             else:
                 role_name = "不明ロール"
@@ -399,12 +591,12 @@ class InviteLinkSelectView(discord.ui.View):
             embed.add_field(name="サーバー", value=guild_name, inline=True)
             embed.add_field(name="ロール", value=role_name, inline=True)
             embed.add_field(name="リンクID", value=selected_link_id, inline=True)
-            embed.add_field(name="使用回数", value=f"{selected_link['current_uses']}/{selected_link['max_uses'] or '無制限'}", inline=True)
+            embed.add_field(name="使用回数", value=selected_link.uses_text, inline=True)
             
             confirm_view = ConfirmDeleteView(selected_link_id, f"{guild_name} - {role_name}")
         else:
             # 管理者用：ロール名のみ取得
-            role = self.guild.get_role(selected_link['role_id'])
+            role = self.guild.get_role(selected_link.role_id)
             role_name = role.name if role else "不明ロール"
             
             # 確認メッセージ
@@ -415,7 +607,7 @@ class InviteLinkSelectView(discord.ui.View):
             )
             embed.add_field(name="ロール", value=role_name, inline=True)
             embed.add_field(name="リンクID", value=selected_link_id, inline=True)
-            embed.add_field(name="使用回数", value=f"{selected_link['current_uses']}/{selected_link['max_uses'] or '無制限'}", inline=True)
+            embed.add_field(name="使用回数", value=selected_link.uses_text, inline=True)
             
             confirm_view = ConfirmDeleteView(selected_link_id, role_name)
         
@@ -445,103 +637,116 @@ class ConfirmDeleteView(discord.ui.View):
         """削除キャンセルボタンの処理"""
         await interaction.response.edit_message(content="削除をキャンセルしました。", embed=None, view=None)
 
-@bot.tree.command(name="list_server_invite_links", description="サーバーのロール招待リンクの一覧表示と削除")
-async def list_server_invite_links(interaction: discord.Interaction):
-    """ロール招待リンクの一覧表示と削除管理"""
-    
-    # 管理権限チェック
-    if not interaction.user.guild_permissions.manage_guild:
-        await interaction.response.send_message("❌ このコマンドを使用するには「サーバー管理」権限が必要です。", ephemeral=True)
-        return
-    
-    # 処理時間がかかる可能性があるため、先にdeferする
-    await interaction.response.defer(ephemeral=True)
-    
-    # データベースから招待リンク一覧を取得
-    invite_links = get_guild_invite_links(interaction.guild.id)
-    
-    if not invite_links:
-        await interaction.followup.send("📝 このサーバーには招待リンクがありません.", ephemeral=True)
-        return
-    
+#################
+# 一覧表示の描画キャッシュ
+# - /list_server_invite_links はサーバー単位、/list_my_invite_links は作成者単位でEmbedとプルダウンの選択肢を保持する
+# - キーはDBのバージョン番号（招待リンクの作成・削除・使用回数の変更でトリガーが上げる）
+# - 表示中のリンクの有効期限が来たら、状態表示が変わるため作り直す
+# - ロールの変更・削除、サーバー名の変更ではそのサーバーに関係するキャッシュを破棄する
+#################
+
+LIST_RENDER_CACHE_TTL = float(os.getenv('LIST_RENDER_CACHE_TTL', 300))
+LIST_RENDER_CACHE = VersionedRenderCache(ttl=LIST_RENDER_CACHE_TTL)
+
+def next_status_change_unix(invite_links: list) -> int:
+    """表示中の有効なリンクのうち、最も早く有効期限が切れる時刻（無ければNone）"""
+    return min((link.expires_at_unix + 1 for link in invite_links
+                if link.expires_at_unix and not link.is_expired), default=None)
+
+@bot.event
+async def on_guild_role_update(before: discord.Role, after: discord.Role):
+    LIST_RENDER_CACHE.invalidate_tag(after.guild.id)
+
+@bot.event
+async def on_guild_role_delete(role: discord.Role):
+    LIST_RENDER_CACHE.invalidate_tag(role.guild.id)
+
+@bot.event
+async def on_guild_update(before: discord.Guild, after: discord.Guild):
+    if before.name != after.name:
+        LIST_RENDER_CACHE.invalidate_tag(after.id)
+
+async def render_server_invite_links_embed(guild: discord.Guild, invite_links: list, total_count: int) -> discord.Embed:
+    """サーバーの招待リンク一覧のEmbedを作成"""
     # 結果を表示
     embed = discord.Embed(
         title="📋 サーバーのロール招待リンク一覧",
-        description=f"{interaction.guild.name} の招待リンク一覧",
+        description=f"{guild.name} の招待リンク一覧",
         color=0x0099ff
     )
     
     for i, link in enumerate(invite_links[:10], 1):  # 最大10個まで表示
         # ロール名を取得
-        role = interaction.guild.get_role(link['role_id'])
+        role = guild.get_role(link.role_id)
         role_name = role.name if role else "不明ロール"
         
         # 作成者を取得
         try:
-            creator = await bot.fetch_user(link['created_by_user_id'])
+            creator = await bot.fetch_user(link.created_by_user_id)
             creator_name = creator.display_name
         except:
             creator_name = "不明ユーザー"
         
-        # 有効期限の表示（UTCから日本時間に変換して表示）
-        if link['expires_at']:
-            try:
-                expires_utc = datetime.strptime(link['expires_at'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-                expires_jst = expires_utc.astimezone(JST)
-                expires_text = expires_jst.strftime('%Y-%m-%d %H:%M JST')
-            except:
-                expires_text = link['expires_at']
-        else:
-            expires_text = "無期限"
-        
-        # 使用可能かどうかをチェック
-        is_expired = False
-        is_usage_exceeded = False
-        
-        # 有効期限チェック（Unixタイムスタンプで比較）
-        if link['expires_at_unix']:
-            now_unix = int(time.time())
-            if now_unix > link['expires_at_unix']:
-                is_expired = True
-        
-        # 使用回数チェック
-        if link['max_uses'] and link['current_uses'] >= link['max_uses']:
-            is_usage_exceeded = True
-        
-        # アイコンと状態メッセージ決定
-        if is_expired or is_usage_exceeded:
-            icon = "❌"
-            # 理由を作成
-            reasons = []
-            if is_expired:
-                reasons.append("有効期限切れ")
-            if is_usage_exceeded:
-                reasons.append("使用回数上限")
-            status_message = f"**状態:** {'/'.join(reasons)}"
-        else:
-            icon = "✅"
-            status_message = "**状態:** 有効"
+        # 有効期限の表示（Unixタイムスタンプから日本時間の文字列を作る、変換結果はキャッシュされる）
+        expires_text = link.expires_text
         
         field_value = (
-            f"**リンクID:** `{link['link_id']}`\n"
-            f"**URL:** {BASE_URL}/join/{link['link_id']}\n"
-            f"**使用回数:** {link['current_uses']}/{link['max_uses'] or '無制限'}\n"
+            f"**リンクID:** `{link.link_id}`\n"
+            f"**URL:** {link.join_url}\n"
+            f"**使用回数:** {link.uses_text}\n"
             f"**有効期限:** {expires_text}\n"
             f"**作成者:** {creator_name}\n"
-            f"{status_message}"
+            f"**状態:** {link.status}"
         )
         
         embed.add_field(
-            name=f"{icon} {i}. {role_name}",
+            name=f"{link.status_icon} {i}. {role_name}",
             value=field_value,
             inline=False
         )
     
-    if len(invite_links) > 10:
-        embed.set_footer(text=f"他に {len(invite_links) - 10} 個の招待リンクがあります")
+    if total_count > 10:
+        embed.set_footer(text=f"他に {total_count - 10} 個の招待リンクがあります")
+    
+    return embed
+
+@bot.tree.command(name="list_server_invite_links", description="サーバーのロール招待リンクの一覧表示と削除")
+async def list_server_invite_links(interaction: discord.Interaction):
+    """ロール招待リンクの一覧表示と削除管理"""
+    
+    # 管理権限チェック
+    if not interaction.user.guild_permissions.manage_guild:
+        await interaction.response.send_message("❌ このコマンドを使用するには「サーバー管理」権限が必要です。", ephemeral=True)
+        return
+    
+    # 処理時間がかかる可能性があるため、先にdeferする
+    await interaction.response.defer(ephemeral=True)
+    
+    # バージョン番号が変わっていなければ、前回の描画結果を使う
+    guild = interaction.guild
+    cache_key = ('g', guild.id)
+    version = get_invite_link_version('g', guild.id)
+    cached = LIST_RENDER_CACHE.get(cache_key, version) if version is not None else None
+    
+    if cached is None:
+        # データベースから招待リンク一覧を取得（プルダウンに表示できる25件と全体の件数だけを取得）
+        invite_links, total_count = get_guild_invite_links_page(guild.id, limit=25)
+        
+        if not invite_links:
+            await interaction.followup.send("📝 このサーバーには招待リンクがありません.", ephemeral=True)
+            return
+        
+        embed = await render_server_invite_links_embed(guild, invite_links, total_count)
+        select_options = build_invite_link_options(invite_links, guild, is_user_view=False)
+        cached = (embed, invite_links, select_options)
+        if version is not None:
+            LIST_RENDER_CACHE.put(cache_key, version, cached,
+                                  valid_until_unix=next_status_change_unix(invite_links), tags=(guild.id,))
+    
+    embed, invite_links, select_options = cached
     
     # プルダウンメニュー付きビューを作成（管理者用）
-    view = InviteLinkSelectView(invite_links, guild=interaction.guild, is_user_view=False)
+    view = InviteLinkSelectView(invite_links, guild=guild, is_user_view=False, select_options=select_options)
     await interaction.followup.send(embed=embed, view=view, ephemeral=True)
 
 
@@ -568,108 +773,509 @@ async def list_server_invite_links(interaction: discord.Interaction):
 #################
 
 
-@bot.tree.command(name="list_my_invite_links", description="自分が作成した招待リンクの一覧表示と削除")
-async def list_my_invite_links(interaction: discord.Interaction):
-    """自分が作成した招待リンクの一覧表示と削除管理"""
-    
-    # 処理時間がかかる可能性があるため、先にdeferする
-    await interaction.response.defer(ephemeral=True)
-    
-    # データベースから自分の招待リンク一覧を取得
-    invite_links = get_user_invite_links(interaction.user.id)
-    
-    if not invite_links:
-        await interaction.followup.send("📝 あなたが作成した招待リンクはありません。", ephemeral=True)
-        return
-    
+def render_my_invite_links_embed(user: discord.abc.User, invite_links: list, total_count: int) -> discord.Embed:
+    """自分が作成した招待リンク一覧のEmbedを作成"""
     # 結果を表示
     embed = discord.Embed(
         title="📋 あなたの招待リンク一覧",
-        description=f"作成者: {interaction.user.display_name}",
+        description=f"作成者: {user.display_name}",
         color=0x0099ff
     )
     
     for i, link in enumerate(invite_links[:10], 1):  # 最大10個まで表示
         # ギルド名を取得
-        guild = bot.get_guild(link['guild_id'])
-        guild_name = guild.name if guild else f"不明サーバー({link['guild_id']})"
+        guild = bot.get_guild(link.guild_id)
+        guild_name = guild.name if guild else f"不明サーバー({link.guild_id})"
         
         # ロール名を取得
         if guild:
-            role = guild.get_role(link['role_id'])
+            role = guild.get_role(link.role_id)
             role_name = role.name if role else "不明ロール"
         else:
             role_name = "不明ロール"
         
-        # 有効期限の表示（データベースから取得した文字列をそのまま表示）
-        expires_text = link['expires_at'] if link['expires_at'] else "無期限"
-        
-        # 使用可能かどうかをチェック
-        is_expired = False
-        is_usage_exceeded = False
-        
-        # 有効期限チェック（Unixタイムスタンプで比較）
-        if link['expires_at_unix']:
-            now_unix = int(time.time())
-            if now_unix > link['expires_at_unix']:
-                is_expired = True
-        
-        # 使用回数チェック
-        if link['max_uses'] and link['current_uses'] >= link['max_uses']:
-            is_usage_exceeded = True
-        
-        # アイコンと状態メッセージ決定
-        if is_expired or is_usage_exceeded:
-            icon = "❌"
-            # 理由を作成
-            reasons = []
-            if is_expired:
-                reasons.append("有効期限切れ")
-            if is_usage_exceeded:
-                reasons.append("使用回数上限")
-            status_message = f"**状態:** {'/'.join(reasons)}"
-        else:
-            icon = "✅"
-            status_message = "**状態:** 有効"
+        # 有効期限の表示（Unixタイムスタンプから日本時間の文字列を作る、変換結果はキャッシュされる）
+        expires_text = link.expires_text
         
         field_value = (
             f"**サーバー:** {guild_name}\n"
-            f"**リンクID:** `{link['link_id']}`\n"
-            f"**URL:** {BASE_URL}/join/{link['link_id']}\n"
-            f"**使用回数:** {link['current_uses']}/{link['max_uses'] or '無制限'}\n"
+            f"**リンクID:** `{link.link_id}`\n"
+            f"**URL:** {link.join_url}\n"
+            f"**使用回数:** {link.uses_text}\n"
             f"**有効期限:** {expires_text}\n"
-            f"**作成日時:** {link['created_at']}\n"
-            f"{status_message}"
+            f"**作成日時:** {link.created_at}\n"
+            f"**状態:** {link.status}"
         )
         
         embed.add_field(
-            name=f"{icon} {i}. {role_name}",
+            name=f"{link.status_icon} {i}. {role_name}",
             value=field_value,
             inline=False
         )
     
-    if len(invite_links) > 10:
-        embed.set_footer(text=f"他に {len(invite_links) - 10} 個の招待リンクがあります")
+    if total_count > 10:
+        embed.set_footer(text=f"他に {total_count - 10} 個の招待リンクがあります")
+    
+    return embed
+
+@bot.tree.command(name="list_my_invite_links", description="自分が作成した招待リンクの一覧表示と削除")
+async def list_my_invite_links(interaction: discord.Interaction):
+    """自分が作成した招待リンクの一覧表示と削除管理"""
+    
+    # 処理時間がかかる可能性があるため、先にdeferする
+    await interaction.response.defer(ephemeral=True)
+    
+    # バージョン番号が変わっていなければ、前回の描画結果を使う
+    user = interaction.user
+    cache_key = ('u', user.id)
+    version = get_invite_link_version('u', user.id)
+    cached = LIST_RENDER_CACHE.get(cache_key, version) if version is not None else None
+    
+    if cached is None:
+        # データベースから自分の招待リンク一覧を取得（プルダウンに表示できる25件と全体の件数だけを取得）
+        invite_links, total_count = get_user_invite_links_page(user.id, limit=25)
+        
+        if not invite_links:
+            await interaction.followup.send("📝 あなたが作成した招待リンクはありません。", ephemeral=True)
+            return
+        
+        embed = render_my_invite_links_embed(user, invite_links, total_count)
+        select_options = build_invite_link_options(invite_links, is_user_view=True)
+        cached = (embed, invite_links, select_options)
+        if version is not None:
+            LIST_RENDER_CACHE.put(cache_key, version, cached,
+                                  valid_until_unix=next_status_change_unix(invite_links),
+                                  tags={link.guild_id for link in invite_links})
+    
+    embed, invite_links, select_options = cached
     
     # プルダウンメニュー付きビューを作成（ユーザー用）
-    view = InviteLinkSelectView(invite_links, guild=None, is_user_view=True)
+    view = InviteLinkSelectView(invite_links, guild=None, is_user_view=True, select_options=select_options)
     await interaction.followup.send(embed=embed, view=view, ephemeral=True)
 
 
 
 
+#################
+# 招待リンクの利用状況を表示するスラッシュコマンド
+# - /invite_link_stats
+# - 管理者のみ実行できる
+# - 引数: link_id(optional), days(optional, 1〜30, デフォルト7)
+# - Webアプリがイベント書き込み時に差分更新している集計テーブルから、1回のクエリで取得する
+# - サーバー全体の直近24時間の1時間ごとの参加数と、直近days日の1日ごとの参加数を表示する
+# - リンクごとの直近24時間・直近days日の参加数を表示する（多い順に最大10個）
+# - link_idを指定した場合は、そのリンクだけを集計する
+#################
+
+STATS_HOURS = 24
+STATS_MAX_DAYS = 30
+STATS_MAX_LINKS = 10
+
+def format_usage_bars(buckets: list, label_format: str) -> str:
+    """[(バケット開始Unix時刻, 参加数)] を棒グラフ風のテキストにする"""
+    max_joins = max((joins for _, joins in buckets), default=0)
+    lines = []
+    for bucket_start, joins in buckets:
+        label = datetime.fromtimestamp(bucket_start, JST).strftime(label_format)
+        bar = "█" * round(joins / max_joins * 10) if max_joins else ""
+        lines.append(f"`{label}` {bar} {joins}")
+    return "\n".join(lines)
+
+@bot.tree.command(name="invite_link_stats", description="招待リンクの利用状況（時間別・日別の参加数）を表示します")
+@discord.app_commands.describe(
+    link_id="集計するリンクID（省略時はサーバー全体）",
+    days="日別に集計する日数（1〜30、デフォルト7）"
+)
+async def invite_link_stats(interaction: discord.Interaction, link_id: str = None, days: int = 7):
+    """招待リンクの利用状況を表示するスラッシュコマンド"""
+    
+    # 管理権限チェック
+    if not interaction.user.guild_permissions.manage_guild:
+        await interaction.response.send_message("❌ このコマンドを使用するには「サーバー管理」権限が必要です。", ephemeral=True)
+        return
+    
+    days = max(1, min(days, STATS_MAX_DAYS))
+    await interaction.response.defer(ephemeral=True)
+    
+    # 集計の開始時刻（1時間単位は直近24時間、1日単位は日本時間の0時区切りで直近days日）
+    now_jst = datetime.now(JST)
+    current_hour = now_jst.replace(minute=0, second=0, microsecond=0)
+    hourly_since = int((current_hour - timedelta(hours=STATS_HOURS - 1)).timestamp())
+    today = now_jst.replace(hour=0, minute=0, second=0, microsecond=0)
+    daily_since = int((today - timedelta(days=days - 1)).timestamp())
+    
+    rows = get_guild_usage_rollups(interaction.guild.id, hourly_since, daily_since, link_id)
+    
+    # バケットごと・リンクごとに集計
+    hourly = {int((current_hour - timedelta(hours=h)).timestamp()): 0 for h in range(STATS_HOURS - 1, -1, -1)}
+    daily = {int((today - timedelta(days=d)).timestamp()): 0 for d in range(days - 1, -1, -1)}
+    per_link = {}
+    for row in rows:
+        link_totals = per_link.setdefault(row['link_id'], {'h': 0, 'd': 0})
+        link_totals[row['granularity']] += row['joins']
+        buckets = hourly if row['granularity'] == 'h' else daily
+        if row['bucket_start_unix'] in buckets:
+            buckets[row['bucket_start_unix']] += row['joins']
+    
+    target = f"リンク `{link_id}`" if link_id else interaction.guild.name
+    embed = discord.Embed(
+        title="📊 招待リンクの利用状況",
+        description=f"{target} の参加数（日本時間）",
+        color=0x0099ff
+    )
+    embed.add_field(name=f"直近{STATS_HOURS}時間", value=f"{sum(hourly.values())} 人", inline=True)
+    embed.add_field(name=f"直近{days}日", value=f"{sum(daily.values())} 人", inline=True)
+    
+    # 直近24時間は参加があった時間帯のみ表示（Embedの文字数制限対策）
+    active_hours = [(bucket, joins) for bucket, joins in hourly.items() if joins]
+    embed.add_field(
+        name="時間別（直近24時間）",
+        value=format_usage_bars(active_hours, '%m/%d %H:00') or "参加はありません",
+        inline=False
+    )
+    embed.add_field(
+        name=f"日別（直近{days}日）",
+        value=format_usage_bars(list(daily.items()), '%m/%d'),
+        inline=False
+    )
+    
+    if not link_id and per_link:
+        ranking = sorted(per_link.items(), key=lambda item: item[1]['d'], reverse=True)[:STATS_MAX_LINKS]
+        embed.add_field(
+            name="リンク別",
+            value="\n".join(
+                f"`{lid}` 24時間: {totals['h']} / {days}日: {totals['d']}" for lid, totals in ranking
+            ),
+            inline=False
+        )
+    
+    embed.set_footer(text=f"集計日時: {now_jst.strftime('%Y-%m-%d %H:%M JST')}")
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+
+
+#######################
+# サーバーの招待リンクをエクスポート・インポートするスラッシュコマンド
+# - /export_invite_links
+#   - 引数: file_format(optional, csv/json)
+#   - サーバーサイドカーソルで少しずつ読み出し、一時ファイルに書き出して添付する
+#   - 件数が多くてもメモリ使用量は一定（一時ファイルは一定サイズを超えるとディスクに移る）
+# - /import_invite_links
+#   - 引数: file（エクスポートしたCSV/JSON、または/generate_invite_links_bulkのCSV）
+#   - 各行を検証（link IDの形式、このサーバーに存在するロールか、数値の範囲）してからCOPYでまとめて取り込む
+#   - 既に存在するlink IDはスキップする
+#   - 作成者は常にインポートした人になる（ファイルのcreated_by_user_idは使わない）
+#   - フリープランの場合は作成制限の残り数までしか取り込まない
+# - どちらも「サーバー管理」権限が必要
+#######################
+
+EXPORT_FORMATS = ('csv', 'json')
+EXPORT_SPOOL_SIZE = 1024 * 1024
+IMPORT_MAX_ROWS = int(os.getenv('IMPORT_MAX_ROWS', 50000))
+IMPORT_MAX_ERRORS_SHOWN = 10
+LINK_ID_PATTERN = re.compile(r'^[A-Za-z0-9]{6,64}$')
+# インポートする数値の上限（DBの列の型と、日本時間で表示できる最後の時刻 9999-12-31 23:59:59 JST）
+IMPORT_MAX_INTEGER = 2 ** 31 - 1
+IMPORT_MAX_BIGINT = 2 ** 63 - 1
+IMPORT_MAX_UNIX = 253402268399
+
+def write_invite_links_export(guild_id: int, file_format: str, role_names: dict, fp) -> int:
+    """
+    サーバーの招待リンクをファイルに書き出す（スレッドで実行する）
+    
+    Returns:
+        int: 書き出した行数
+    """
+    columns = ('link_id', 'url', 'role_id', 'role_name') + INVITE_LINK_TRANSFER_COLUMNS[2:]
+    text = io.TextIOWrapper(fp, encoding='utf-8-sig' if file_format == 'csv' else 'utf-8', newline='')
+    count = 0
+    try:
+        writer = csv.writer(text) if file_format == 'csv' else None
+        if writer:
+            writer.writerow(columns)
+        else:
+            text.write('[')
+        
+        for row in iter_guild_invite_links_for_export(guild_id):
+            link_id, role_id = row[0], row[1]
+            values = (link_id, f"{BASE_URL}/join/{link_id}", role_id, role_names.get(role_id)) + tuple(row[2:])
+            if writer:
+                writer.writerow(['' if v is None else v for v in values])
+            else:
+                text.write((',\n' if count else '\n') + json.dumps(dict(zip(columns, values)), ensure_ascii=False))
+            count += 1
+        
+        if not writer:
+            text.write('\n]\n')
+        text.flush()
+    finally:
+        # TextIOWrapperを閉じると元のファイルも閉じられるため切り離す
+        text.detach()
+    return count
+
+def parse_optional_int(value, name: str, minimum: int = 0, maximum: int = IMPORT_MAX_INTEGER) -> int:
+    """空ならNone、それ以外は範囲付きの整数に変換（不正な場合はValueError）"""
+    if value is None or str(value).strip() == '':
+        return None
+    try:
+        number = int(str(value).strip())
+    except ValueError:
+        raise ValueError(f"{name}が整数ではありません")
+    if number < minimum:
+        raise ValueError(f"{name}は{minimum}以上である必要があります")
+    if number > maximum:
+        raise ValueError(f"{name}は{maximum}以下である必要があります")
+    return number
+
+def validate_import_record(record: dict, guild: discord.Guild, importer_user_id: int, now: datetime) -> tuple:
+    """
+    インポートする1行を検証して、INVITE_LINK_TRANSFER_COLUMNSの順のタプルに変換
+    
+    - 作成者はインポートした人にする（他のユーザーの所有にして作成制限を回避できないよう、ファイルの値は使わない）
+    - 表示用の日時文字列はUnixタイムスタンプから作り直す
+    - expires_at_unixが無い場合は、expires_at（YYYY-MM-DD HH:MM JST形式など）から求める
+    
+    Raises:
+        ValueError: 行が不正な場合
+    """
+    link_id = str(record.get('link_id') or '').strip()
+    if not LINK_ID_PATTERN.match(link_id):
+        raise ValueError("link_idの形式が不正です")
+    
+    role_id = parse_optional_int(record.get('role_id'), 'role_id', 1, IMPORT_MAX_BIGINT)
+    if role_id is None or guild.get_role(role_id) is None:
+        raise ValueError("role_idのロールがこのサーバーに存在しません")
+    
+    created_by_user_id = importer_user_id
+    max_uses = parse_optional_int(record.get('max_uses'), 'max_uses')
+    current_uses = parse_optional_int(record.get('current_uses'), 'current_uses') or 0
+    
+    expires_unix = parse_optional_int(record.get('expires_at_unix'), 'expires_at_unix', 0, IMPORT_MAX_UNIX)
+    if expires_unix is None and record.get('expires_at'):
+        expires_unix = parse_expiry(str(record['expires_at']), int(now.timestamp()))
+    expires_display = format_jst(expires_unix) if expires_unix is not None else None
+    
+    created_unix = parse_optional_int(record.get('created_at_unix'), 'created_at_unix', 0, IMPORT_MAX_UNIX) or int(now.timestamp())
+    created_display = format_jst(created_unix, CREATED_FORMAT)
+    
+    return (link_id, role_id, created_by_user_id, max_uses, current_uses,
+            expires_display, expires_unix, created_display, created_unix)
+
+def load_import_records(data: bytes, filename: str) -> list:
+    """
+    添付ファイルの内容を行（辞書）のリストに変換
+    
+    Raises:
+        ValueError: ファイル形式が不正な場合
+    """
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise ValueError("ファイルはUTF-8である必要があります")
+    
+    if filename.lower().endswith('.json'):
+        try:
+            records = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"JSONの形式が不正です: {e}")
+        if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+            raise ValueError("JSONはオブジェクトの配列である必要があります")
+        return records
+    
+    reader = csv.DictReader(io.StringIO(text, newline=''))
+    if not reader.fieldnames or 'link_id' not in reader.fieldnames or 'role_id' not in reader.fieldnames:
+        raise ValueError("CSVにはlink_id列とrole_id列が必要です")
+    return list(reader)
+
+@bot.tree.command(name="export_invite_links", description="サーバーの招待リンクをCSV/JSONファイルでエクスポートします")
+@discord.app_commands.describe(file_format="出力形式（省略時はCSV）")
+@discord.app_commands.choices(file_format=[
+    discord.app_commands.Choice(name="CSV", value="csv"),
+    discord.app_commands.Choice(name="JSON", value="json"),
+])
+async def export_invite_links(interaction: discord.Interaction, file_format: discord.app_commands.Choice[str] = None):
+    """サーバーの招待リンクをエクスポートするスラッシュコマンド"""
+    
+    # 管理権限チェック
+    if not interaction.user.guild_permissions.manage_guild:
+        await interaction.response.send_message("❌ このコマンドを使用するには「サーバー管理」権限が必要です。", ephemeral=True)
+        return
+    
+    await interaction.response.defer(ephemeral=True)
+    
+    file_format = file_format.value if file_format else 'csv'
+    guild = interaction.guild
+    role_names = {role.id: role.name for role in guild.roles}
+    fp = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+    try:
+        # DBの読み出しとファイル書き込みはイベントループを止めないようスレッドで行う
+        try:
+            count = await asyncio.to_thread(write_invite_links_export, guild.id, file_format, role_names, fp)
+        except Exception as e:
+            print(f"招待リンクのエクスポート中にエラーが発生しました: {e}")
+            await interaction.followup.send("❌ エクスポート中にエラーが発生しました。", ephemeral=True)
+            return
+        
+        if count == 0:
+            await interaction.followup.send("📝 このサーバーには招待リンクがありません。", ephemeral=True)
+            return
+        
+        size = fp.tell()
+        if size > guild.filesize_limit:
+            await interaction.followup.send(
+                f"❌ エクスポートファイルが大きすぎます（{size // 1024} KB）。Discordの添付ファイルの上限を超えています。",
+                ephemeral=True
+            )
+            return
+        
+        fp.seek(0)
+        now_jst = datetime.now(JST)
+        filename = f"invite_links_{guild.id}_{now_jst.strftime('%Y%m%d%H%M%S')}.{file_format}"
+        await interaction.followup.send(
+            f"📦 {count}件の招待リンクをエクスポートしました。",
+            file=discord.File(fp, filename=filename),
+            ephemeral=True
+        )
+    finally:
+        fp.close()
+
+@bot.tree.command(name="import_invite_links", description="CSV/JSONファイルから招待リンクをインポートします")
+@discord.app_commands.describe(file="/export_invite_linksまたは/generate_invite_links_bulkで出力したCSV/JSONファイル")
+async def import_invite_links(interaction: discord.Interaction, file: discord.Attachment):
+    """招待リンクをインポートするスラッシュコマンド"""
+    
+    # 管理権限チェック
+    if not interaction.user.guild_permissions.manage_guild:
+        await interaction.response.send_message("❌ このコマンドを使用するには「サーバー管理」権限が必要です。", ephemeral=True)
+        return
+    
+    if not file.filename.lower().endswith(('.csv', '.json')):
+        await interaction.response.send_message("❌ CSV（.csv）またはJSON（.json）ファイルを添付してください。", ephemeral=True)
+        return
+    
+    await interaction.response.defer(ephemeral=True)
+    
+    guild = interaction.guild
+    try:
+        data = await file.read()
+        records = await asyncio.to_thread(load_import_records, data, file.filename)
+    except ValueError as e:
+        await interaction.followup.send(f"❌ {str(e)}", ephemeral=True)
+        return
+    except discord.HTTPException as e:
+        print(f"添付ファイルの取得に失敗しました: {e}")
+        await interaction.followup.send("❌ 添付ファイルの取得に失敗しました。", ephemeral=True)
+        return
+    
+    if len(records) > IMPORT_MAX_ROWS:
+        await interaction.followup.send(f"❌ 一度にインポートできるのは{IMPORT_MAX_ROWS}件までです（{len(records)}件）。", ephemeral=True)
+        return
+    
+    # 各行を検証（ファイル内で重複したlink IDは最初の行だけを使う）
+    now_jst = datetime.now(JST)
+    rows = []
+    errors = []
+    seen_link_ids = set()
+    for line, record in enumerate(records, start=2 if file.filename.lower().endswith('.csv') else 1):
+        try:
+            row = validate_import_record(record, guild, interaction.user.id, now_jst)
+        except ValueError as e:
+            errors.append(f"{line}行目: {e}")
+            continue
+        if row[0] in seen_link_ids:
+            errors.append(f"{line}行目: link_idがファイル内で重複しています")
+            continue
+        seen_link_ids.add(row[0])
+        rows.append(row)
+    
+    if not rows:
+        await interaction.followup.send("❌ インポートできる行がありません。\n" + "\n".join(errors[:IMPORT_MAX_ERRORS_SHOWN]), ephemeral=True)
+        return
+    
+    # フリープランの場合は作成制限の残り数までに制限する
+    limited = 0
+    if not await has_premium_role(interaction.user):
+        counts = count_invite_links(interaction.user.id, guild.id)
+        if counts is None:
+            await interaction.followup.send("❌ 制限チェック中にエラーが発生しました。", ephemeral=True)
+            return
+        allowed = max(0, min(FREE_USER_PERSONAL_LINK_LIMIT - counts[0], FREE_USER_SERVER_LINK_LIMIT - counts[1]))
+        if len(rows) > allowed:
+            limited = len(rows) - allowed
+            rows = rows[:allowed]
+        if not rows:
+            await interaction.followup.send(
+                f"❌ フリープランの招待リンク作成制限に達しているため、インポートできません。プレミアムプランへのアップグレードについては、こちらをご確認ください: {os.getenv('OFFICIAL_WEBSITE_URL', 'https://discord-invitation-and-rol-bote.kei31.com/')}",
+                ephemeral=True
+            )
+            return
+    
+    imported = await asyncio.to_thread(import_guild_invite_links, guild.id, rows)
+    if imported is None:
+        await interaction.followup.send("❌ データベースへの保存に失敗しました。何もインポートされていません。", ephemeral=True)
+        return
+    
+    embed = discord.Embed(
+        title="📥 招待リンクをインポートしました",
+        color=0x00ff00 if not errors and not limited else 0xffa500
+    )
+    embed.add_field(name="ファイル", value=file.filename, inline=False)
+    embed.add_field(name="インポート", value=f"{imported}件", inline=True)
+    embed.add_field(name="既存のためスキップ", value=f"{len(rows) - imported}件", inline=True)
+    embed.add_field(name="エラー", value=f"{len(errors)}件", inline=True)
+    if limited:
+        embed.add_field(name="フリープランの制限によりスキップ", value=f"{limited}件", inline=True)
+    if errors:
+        shown = "\n".join(errors[:IMPORT_MAX_ERRORS_SHOWN])
+        if len(errors) > IMPORT_MAX_ERRORS_SHOWN:
+            shown += f"\n…ほか{len(errors) - IMPORT_MAX_ERRORS_SHOWN}件"
+        embed.add_field(name="エラーの内容", value=shown[:1024], inline=False)
+    
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+
+#################
+# スラッシュコマンドを強制的に同期するスラッシュコマンド
+# - /sync_commands
+# - Botのオーナーのみ実行できる
+# - 通常は起動時にコマンド定義の変更を検知して自動で同期するため、
+#   反映されない場合などの手動の再同期に使う
+#################
+
+@bot.tree.command(name="sync_commands", description="スラッシュコマンドを強制的に再同期します（Botオーナー専用）")
+@discord.app_commands.default_permissions(administrator=True)
+async def sync_commands(interaction: discord.Interaction):
+    """スラッシュコマンドを強制的に同期するスラッシュコマンド"""
+    if not await bot.is_owner(interaction.user):
+        await interaction.response.send_message("❌ このコマンドはBotのオーナーのみ使用できます。", ephemeral=True)
+        return
+    
+    await interaction.response.defer(ephemeral=True)
+    try:
+        _, count = await COMMAND_SYNC.sync_if_changed(bot.application_id, force=True)
+    except Exception as e:
+        print(f'スラッシュコマンドの同期に失敗しました: {e}')
+        await interaction.followup.send("❌ スラッシュコマンドの同期に失敗しました。", ephemeral=True)
+        return
+    await interaction.followup.send(f"✅ {count} 個のスラッシュコマンドを同期しました。反映には最大1時間かかる場合があります。", ephemeral=True)
+
+
 if __name__ == "__main__":
     if not TOKEN:
         print("エラー: DISCORD_TOKENが設定されていません")
         exit(1)
     
-    # データベースを初期化
-    try:
-        print("データベースを初期化しています...")
-        init_database()
-    except Exception as e:
-        print(f"データベース初期化エラー: {e}")
-        exit(1)
+    # --sync-commands: コマンド定義の変更に関わらず起動時に同期する
+    FORCE_COMMAND_SYNC = '--sync-commands' in sys.argv[1:]
+    
+    # データベースを初期化（shard_launcher.pyから起動された場合はランチャーが初期化済み）
+    if os.getenv('SKIP_DATABASE_INIT') != '1':
+        try:
+            print("データベースを初期化しています...")
+            init_database()
+        except Exception as e:
+            print(f"データベース初期化エラー: {e}")
+            exit(1)
     
     try:
         bot.run(TOKEN)
@@ -0,0 +1,58 @@
+import hashlib
+import json
+from discord import app_commands
+from shared.models import get_bot_state, set_bot_state
+
+
+class CommandSyncManager:
+    """
+    スラッシュコマンドの同期を必要なときだけ行うマネージャー
+
+    - ローカルのコマンド定義（to_dict()の結果）のハッシュを計算する
+    - 最後に同期したときのハッシュをDBに保存しておき、変わったときだけtree.sync()を呼ぶ
+    - 再接続で何度on_readyが呼ばれても、確認が成功した後は行わない（同期に失敗した場合は次のon_readyで再試行する）
+    - force=Trueで強制的に同期できる（--sync-commands や /sync_commands 用）
+    """
+
+    def __init__(self, tree: app_commands.CommandTree):
+        self.tree = tree
+        self._checked = False
+
+    def compute_hash(self) -> str:
+        """グローバルコマンドの定義からハッシュを計算"""
+        payload = sorted(
+            (command.to_dict() for command in self.tree.get_commands()),
+            key=lambda command: (command.get('type', 1), command['name'])
+        )
+        encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+    def state_key(self, application_id: int) -> str:
+        # 開発用と本番用のBotが同じDBを使う場合に備えて、アプリケーションごとに保存する
+        return f"command_tree_hash:{application_id}"
+
+    async def sync_if_changed(self, application_id: int, force: bool = False) -> tuple:
+        """
+        コマンド定義が前回の同期から変わっていれば同期する
+
+        Args:
+            application_id: BotのアプリケーションID
+            force: Trueの場合はハッシュに関わらず同期する
+
+        Returns:
+            tuple: (同期したかどうか, 同期したコマンド数)
+        """
+        if self._checked and not force:
+            return False, 0
+
+        key = self.state_key(application_id)
+        current_hash = self.compute_hash()
+        if not force and get_bot_state(key) == current_hash:
+            self._checked = True
+            return False, 0
+
+        # 同期またはハッシュの保存に失敗した場合は、次のon_readyで再度確認する
+        synced = await self.tree.sync()
+        if set_bot_state(key, current_hash):
+            self._checked = True
+        return True, len(synced)
@@ -0,0 +1,187 @@
+import asyncio
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter as TallyCounter
+from functools import lru_cache
+from shared.metrics import REGISTRY
+
+#######################
+# イベントループのブロッキング検出（環境変数LOOP_WATCHDOG=1 の場合のみ有効）
+# - ループ上でinterval秒ごとにハートビートを打ち、予定より遅れた時間（ループの遅延）を計測する
+# - 別スレッドがハートビートの遅れを監視し、threshold秒を超えて遅れている間は
+#   sys._current_frames()でループのスレッドのスタックを繰り返しサンプリングする
+# - ブロックが終わったら、サンプルの中で最も多かった
+#   「コルーチン（このリポジトリ内の最も外側のasync関数）」と「関数（このリポジトリ内の最も内側の関数）」、
+#   「実際に止まっていた呼び出し（スタックの最も内側）」を報告する
+# - 報告はprintのほか、LOOP_WATCHDOG_LOGを設定した場合はJSON Linesで追記し（負荷試験の集計用）、
+#   メトリクス（event_loop_blocks_total など）にも記録する
+#######################
+
+LOOP_BLOCKS = REGISTRY.counter(
+    'event_loop_blocks_total', 'Event loop stalls longer than the watchdog threshold', ('coroutine', 'function')
+)
+LOOP_BLOCK_SECONDS = REGISTRY.histogram(
+    'event_loop_block_duration_seconds', 'Duration of event loop stalls detected by the watchdog',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+WATCHDOG_FILE = os.path.abspath(__file__)
+MAX_STACK_DEPTH = 64
+
+
+@lru_cache(maxsize=1024)
+def _normalize(filename: str) -> str:
+    return os.path.abspath(filename) if not filename.startswith('<') else filename
+
+
+class StackSample:
+    """ブロック中に取得した1回分のスタックの要約"""
+
+    __slots__ = ('coroutine', 'function', 'blocking_call', 'stack')
+
+    def __init__(self, frame):
+        stack = []
+        project_frames = []
+        while frame is not None and len(stack) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            entry = (_normalize(code.co_filename), frame.f_lineno, code.co_name, bool(code.co_flags & inspect.CO_COROUTINE))
+            stack.append(entry)
+            if entry[0].startswith(PROJECT_ROOT) and entry[0] != WATCHDOG_FILE:
+                project_frames.append(entry)
+            frame = frame.f_back
+
+        # stackは内側から外側の順
+        coroutines = [entry for entry in project_frames if entry[3]] or [entry for entry in stack if entry[3]]
+        self.coroutine = _describe(coroutines[-1]) if coroutines else 'unknown'
+        self.function = _describe(project_frames[0]) if project_frames else 'unknown'
+        self.blocking_call = _describe(stack[0]) if stack else 'unknown'
+        self.stack = [_describe(entry) for entry in stack]
+
+    @property
+    def key(self) -> tuple:
+        return self.coroutine, self.function, self.blocking_call
+
+
+def _describe(entry: tuple) -> str:
+    filename, lineno, name, _ = entry
+    if filename.startswith(PROJECT_ROOT):
+        filename = os.path.relpath(filename, PROJECT_ROOT)
+    else:
+        filename = os.path.basename(filename)
+    return f"{name} ({filename}:{lineno})"
+
+
+class LoopBlockingWatchdog:
+    """
+    イベントループを止めている処理を検出するウォッチドッグ
+
+    Args:
+        threshold: この秒数を超えてハートビートが遅れたらブロックとみなす
+        interval: ハートビートの間隔（秒）
+        sample_interval: ブロック中にスタックを取得する間隔（秒）
+        log_path: 報告をJSON Linesで追記するファイル（省略時はprintのみ）
+    """
+
+    def __init__(self, threshold: float = 0.1, interval: float = 0.05, sample_interval: float = 0.01,
+                 log_path: str = None, max_samples: int = 500):
+        self.threshold = threshold
+        self.interval = interval
+        self.sample_interval = sample_interval
+        self.log_path = log_path
+        self.max_samples = max_samples
+        self.max_lag = 0.0
+        self.reports = 0
+        self._loop = None
+        self._loop_thread_id = None
+        self._expected_beat = None
+        self._samples = []
+        self._finished = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, loop: asyncio.AbstractEventLoop = None):
+        """実行中のループ（ループのスレッドから呼ぶ）の監視を開始"""
+        self._loop = loop or asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._expected_beat = time.monotonic() + self.interval
+        self._loop.call_later(self.interval, self._beat)
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+        print(f'イベントループの監視を開始しました（しきい値 {self.threshold * 1000:.0f}ms）')
+
+    def stop(self):
+        self._stop.set()
+
+    def _beat(self):
+        """ループ上で動くハートビート（遅れた時間を記録して次を予約する）"""
+        now = time.monotonic()
+        lag = now - self._expected_beat
+        if lag > self.max_lag:
+            self.max_lag = lag
+        if lag > self.threshold:
+            with self._lock:
+                self._finished.append((lag, self._samples))
+                self._samples = []
+        self._expected_beat = now + self.interval
+        if not self._stop.is_set():
+            self._loop.call_later(self.interval, self._beat)
+
+    def _watch(self):
+        """別スレッドでハートビートの遅れを監視し、ブロック中はスタックをサンプリングする"""
+        while not self._stop.wait(self.sample_interval):
+            if self._loop.is_closed():
+                return
+            if time.monotonic() - self._expected_beat > self.threshold:
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is not None:
+                    sample = StackSample(frame)
+                    with self._lock:
+                        if len(self._samples) < self.max_samples:
+                            self._samples.append(sample)
+                del frame
+
+            with self._lock:
+                finished, self._finished = self._finished, []
+            for duration, samples in finished:
+                self._report(duration, samples)
+
+    def _report(self, duration: float, samples: list):
+        """1回のブロックについて、最も多く観測された箇所を報告"""
+        self.reports += 1
+        if samples:
+            key, count = TallyCounter(sample.key for sample in samples).most_common(1)[0]
+            coroutine, function, blocking_call = key
+            stack = next(sample.stack for sample in samples if sample.key == key)
+        else:
+            # サンプリングの間隔より短いブロックでは箇所が分からない
+            coroutine = function = blocking_call = 'unknown'
+            count = 0
+            stack = []
+
+        LOOP_BLOCKS.inc(coroutine=coroutine, function=function)
+        LOOP_BLOCK_SECONDS.observe(duration)
+        print(f'イベントループが {duration * 1000:.0f}ms ブロックされました: '
+              f'{coroutine} -> {function} -> {blocking_call}（{count}/{len(samples)} サンプル）')
+
+        if self.log_path:
+            record = {
+                'at_unix': round(time.time(), 3),
+                'duration_ms': round(duration * 1000, 1),
+                'coroutine': coroutine,
+                'function': function,
+                'blocking_call': blocking_call,
+                'samples': len(samples),
+                'matching_samples': count,
+                'stack': stack,
+            }
+            try:
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            except OSError as e:
+                print(f'ブロッキングの記録の書き込みに失敗しました: {e}')
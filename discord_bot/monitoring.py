@@ -0,0 +1,153 @@
+import asyncio
+import math
+import time
+import discord
+from aiohttp import web
+from shared.metrics import REGISTRY, CONTENT_TYPE, is_authorized
+from shared.database import check_database
+
+#######################
+# Botプロセスの監視用HTTPサーバー（環境変数METRICS_PORTを設定した場合のみ起動）
+# - /metrics: Prometheus形式のメトリクス（METRICS_TOKENのBearerトークンが必要、未設定なら404）
+# - /healthz: プロセスとイベントループが応答しているか（応答できれば常に200）
+# - /readyz : Gatewayの準備完了・全シャード接続中・DBに接続できる場合は200、それ以外は503
+# - Botと同じイベントループ上で動かすため、ループが詰まるとこのサーバーの応答も遅れる
+#   （ループの遅延はevent_loop_lag_secondsで計測する）
+# - aiohttpはdiscord.pyの依存関係なので追加のインストールは不要
+#######################
+
+GATEWAY_LATENCY = REGISTRY.gauge(
+    'discord_gateway_latency_seconds', 'Gateway heartbeat latency by shard', ('shard',)
+)
+BOT_READY = REGISTRY.gauge('discord_bot_ready', 'Whether the bot has finished connecting (1) or not (0)')
+BOT_GUILDS = REGISTRY.gauge('discord_bot_guilds', 'Guilds cached by this process')
+EVENT_LOOP_LAG = REGISTRY.histogram(
+    'event_loop_lag_seconds', 'How late the event loop wakes up a periodic timer',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+EVENT_LOOP_LAG_LAST = REGISTRY.gauge('event_loop_lag_last_seconds', 'Most recent event loop lag sample')
+COMMAND_SECONDS = REGISTRY.histogram(
+    'discord_command_duration_seconds', 'Slash command latency from dispatch to completion', ('command', 'outcome')
+)
+COMMAND_ERRORS = REGISTRY.counter(
+    'discord_command_errors_total', 'Slash commands that raised an error', ('command', 'error')
+)
+
+
+class CommandMetrics:
+    """
+    スラッシュコマンドの所要時間とエラーを記録
+
+    - on_interactionで開始時刻を記録し、on_app_command_completion / CommandTreeのon_errorで終了する
+    - 終了イベントが来なかったものは一定時間後に破棄する
+    """
+
+    def __init__(self, stale_after: float = 900, max_pending: int = 1000):
+        self.stale_after = stale_after
+        self.max_pending = max_pending
+        self._pending = {}
+
+    def start(self, interaction: discord.Interaction):
+        if interaction.type is not discord.InteractionType.application_command:
+            return
+        if len(self._pending) >= self.max_pending:
+            self._prune(time.perf_counter())
+        self._pending[interaction.id] = time.perf_counter()
+
+    def finish(self, interaction: discord.Interaction, error: Exception = None):
+        started = self._pending.pop(interaction.id, None)
+        command = interaction.command.qualified_name if interaction.command else 'unknown'
+        if error is not None:
+            if isinstance(error, discord.app_commands.CommandInvokeError):
+                error = error.original
+            COMMAND_ERRORS.inc(command=command, error=type(error).__name__)
+        if started is not None:
+            COMMAND_SECONDS.observe(time.perf_counter() - started, command=command,
+                                    outcome='error' if error is not None else 'ok')
+
+    def _prune(self, now: float):
+        for interaction_id in [key for key, started in self._pending.items() if now - started > self.stale_after]:
+            del self._pending[interaction_id]
+
+
+class BotHealthServer:
+    """Botと同じイベントループで動く /metrics・/healthz・/readyz のHTTPサーバー"""
+
+    def __init__(self, bot: discord.Client, port: int, host: str = '0.0.0.0', token: str = '',
+                 db_check_ttl: float = 10, lag_interval: float = 0.5):
+        self.bot = bot
+        self.port = port
+        self.host = host
+        self.token = token
+        self.db_check_ttl = db_check_ttl
+        self.lag_interval = lag_interval
+        self._runner = None
+        self._lag_task = None
+        self._db_checked_at = None
+        self._db_ok = False
+
+        BOT_READY.set_function(lambda: int(bot.is_ready()))
+        BOT_GUILDS.set_function(lambda: len(bot.guilds))
+
+    async def start(self):
+        """HTTPサーバーとイベントループの遅延計測を開始"""
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle_metrics)
+        app.router.add_get('/healthz', self.handle_healthz)
+        app.router.add_get('/readyz', self.handle_readyz)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self._lag_task = asyncio.create_task(self._measure_loop_lag())
+        print(f'監視用HTTPサーバーを起動しました: http://{self.host}:{self.port} (/metrics, /healthz, /readyz)')
+
+    async def close(self):
+        if self._lag_task:
+            self._lag_task.cancel()
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def _measure_loop_lag(self):
+        """一定間隔でsleepし、予定より遅れて起きた時間をループの遅延として記録"""
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time() + self.lag_interval
+            await asyncio.sleep(self.lag_interval)
+            lag = max(0.0, loop.time() - scheduled)
+            EVENT_LOOP_LAG.observe(lag)
+            EVENT_LOOP_LAG_LAST.set(lag)
+
+    def _update_gateway_latency(self):
+        for shard_id, latency in self.bot.latencies:
+            if math.isfinite(latency):
+                GATEWAY_LATENCY.set(latency, shard=shard_id)
+
+    async def _database_ok(self) -> bool:
+        """DBに接続できるか（結果はdb_check_ttl秒キャッシュする）"""
+        now = time.monotonic()
+        if self._db_checked_at is None or now - self._db_checked_at >= self.db_check_ttl:
+            self._db_ok = await asyncio.to_thread(check_database)
+            self._db_checked_at = now
+        return self._db_ok
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        if not self.token:
+            raise web.HTTPNotFound()
+        if not is_authorized(request.headers.get('Authorization'), self.token):
+            raise web.HTTPUnauthorized(headers={'WWW-Authenticate': 'Bearer'})
+        self._update_gateway_latency()
+        body = REGISTRY.render()
+        return web.Response(body=body.encode('utf-8'), headers={'Content-Type': CONTENT_TYPE, 'Cache-Control': 'no-store'})
+
+    async def handle_healthz(self, request: web.Request) -> web.Response:
+        return web.json_response({'status': 'ok'})
+
+    async def handle_readyz(self, request: web.Request) -> web.Response:
+        checks = {
+            'gateway': self.bot.is_ready() and not self.bot.is_closed(),
+            'shards': bool(self.bot.shards) and all(not shard.is_closed() for shard in self.bot.shards.values()),
+            'database': await self._database_ok(),
+        }
+        ready = all(checks.values())
+        return web.json_response({'status': 'ok' if ready else 'unavailable', 'checks': checks},
+                                 status=200 if ready else 503)
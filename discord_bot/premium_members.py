@@ -0,0 +1,73 @@
+import discord
+
+#######################
+# プレミアムメンバーのキャッシュ（PREMIUM_MEMBER_CACHE=1 の場合のみ使用）
+# - プレミアムサポートサーバー（DISCORD_DEV_GUILD_ID）だけを起動時にチャンク取得し、
+#   PREMIUM_ROLE_IDを持つユーザーIDの集合をメモリに保持する
+# - 以降はon_member_update / on_member_remove / on_member_join で集合を更新する
+# - プレミアム判定は集合の参照だけで済み、RESTのfetch_memberを呼ばない
+# - 他のサーバーのメンバーはキャッシュしない（メンバーキャッシュ自体はCACHE_PROFILEの設定のまま）
+# - 準備ができていない間（起動直後・再接続中・このプロセスがサーバーのシャードを担当していない場合）は
+#   lookup()がNoneを返すので、呼び出し側はRESTにフォールバックする
+#######################
+
+
+class PremiumMemberCache:
+    """プレミアムロールを持つユーザーIDの集合"""
+
+    def __init__(self, guild_id: int, role_id: int):
+        self.guild_id = guild_id
+        self.role_id = role_id
+        self.user_ids = set()
+        self.ready = False
+        self.hits = 0
+        self.fallbacks = 0
+
+    def handles(self, guild: discord.Guild) -> bool:
+        """プレミアムサポートサーバーかどうか"""
+        return guild is not None and guild.id == self.guild_id
+
+    async def load(self, guild: discord.Guild) -> int:
+        """
+        サーバーのメンバーをチャンク取得して集合を作り直す
+
+        - Guild.chunk(cache=True)で取得したメンバーはメンバーキャッシュが無効でもキャッシュされるため、
+          このサーバーのメンバーについてだけon_member_updateが届くようになる
+
+        Returns:
+            int: プレミアムロールを持つユーザー数
+        """
+        self.ready = False
+        members = await guild.chunk(cache=True)
+        self.user_ids = {member.id for member in members if member.get_role(self.role_id) is not None}
+        self.ready = True
+        return len(self.user_ids)
+
+    def apply(self, member: discord.Member):
+        """メンバーの現在のロールを集合に反映"""
+        if member.get_role(self.role_id) is not None:
+            self.user_ids.add(member.id)
+        else:
+            self.user_ids.discard(member.id)
+
+    def discard(self, user_id: int):
+        """サーバーから抜けたユーザーを集合から外す"""
+        self.user_ids.discard(user_id)
+
+    def reset(self):
+        """集合を破棄し、再取得するまでRESTにフォールバックさせる"""
+        self.ready = False
+        self.user_ids = set()
+
+    def lookup(self, user_id: int):
+        """
+        ユーザーがプレミアムロールを持っているか
+
+        Returns:
+            bool: 持っている場合True、準備ができていない場合はNone
+        """
+        if not self.ready:
+            self.fallbacks += 1
+            return None
+        self.hits += 1
+        return user_id in self.user_ids
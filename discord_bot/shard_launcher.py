@@ -0,0 +1,166 @@
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+from dotenv import load_dotenv
+from sharding import parse_shard_ids, format_shard_ids, split_shards
+
+#######################
+# 複数プロセスでBotを起動するシャードランチャー
+# - 担当するシャードIDを連続した範囲に分けて、プロセスごとにbot.pyを起動する
+#   （各プロセスには SHARD_COUNT と SHARD_IDS を環境変数で渡す）
+# - 全体のシャード数は --shard-count / SHARD_COUNT、未指定ならDiscordの推奨数を使う
+# - 複数台で動かす場合は、マシンごとに --shard-ids で担当範囲を指定する
+#   （例: 1台目 --shard-count 16 --shard-ids 0-7、2台目 --shard-count 16 --shard-ids 8-15）
+# - データベースの初期化はランチャーで1回だけ行う
+# - 異常終了したプロセスは待機時間を延ばしながら再起動する
+# - SIGINT / SIGTERM を受けたら全プロセスを終了させる
+# - METRICS_PORTを設定した場合、監視用HTTPサーバーのポートはプロセスごとに METRICS_PORT, +1, +2 ... とする
+#
+# 使い方:
+#   python shard_launcher.py --processes 4
+#   python shard_launcher.py --processes 2 --shard-count 16 --shard-ids 0-7
+#######################
+
+RESTART_DELAY_MIN = 5
+RESTART_DELAY_MAX = 300
+# これより長く動いていたプロセスは、異常終了しても待機時間をリセットする
+STABLE_RUN_SECONDS = 600
+
+
+def fetch_recommended_shard_count(token: str) -> int:
+    """Discordの推奨シャード数を取得（GET /gateway/bot）"""
+    api_base = os.getenv('DISCORD_API_BASE', 'https://discord.com/api/v10')
+    request = urllib.request.Request(
+        f"{api_base}/gateway/bot",
+        headers={'Authorization': f'Bot {token}', 'User-Agent': 'DiscordBot (shard_launcher, 1.0)'}
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return int(json.loads(response.read())['shards'])
+
+
+class ShardProcess:
+    """1つのbot.pyプロセスとその再起動状態"""
+
+    def __init__(self, shard_count: int, shard_ids: list, extra_args: list, metrics_port: int = None):
+        self.shard_count = shard_count
+        self.shard_ids = shard_ids
+        self.extra_args = extra_args
+        self.metrics_port = metrics_port
+        self.label = format_shard_ids(shard_ids)
+        self.process = None
+        self.started_at = 0
+        self.restart_at = 0
+        self.restart_delay = RESTART_DELAY_MIN
+
+    def start(self):
+        env = dict(os.environ)
+        env.update({
+            'SHARD_COUNT': str(self.shard_count),
+            'SHARD_IDS': self.label,
+            'SKIP_DATABASE_INIT': '1',
+        })
+        env.pop('SHARD_PROCESS_INDEX', None)
+        env.pop('SHARD_PROCESS_COUNT', None)
+        if self.metrics_port:
+            env['METRICS_PORT'] = str(self.metrics_port)
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bot.py')
+        self.process = subprocess.Popen([sys.executable, script] + self.extra_args, env=env)
+        self.started_at = time.monotonic()
+        print(f"[launcher] shards {self.label} started (pid={self.process.pid})")
+
+    def check(self, now: float, stopping: bool):
+        """終了していれば再起動を予約し、予約時刻になったら再起動する"""
+        if self.process is None:
+            if not stopping and now >= self.restart_at:
+                self.start()
+            return
+
+        code = self.process.poll()
+        if code is None:
+            return
+
+        self.process = None
+        if stopping:
+            return
+        if now - self.started_at >= STABLE_RUN_SECONDS:
+            self.restart_delay = RESTART_DELAY_MIN
+        self.restart_at = now + self.restart_delay
+        print(f"[launcher] shards {self.label} exited with code {code}, restarting in {self.restart_delay}s")
+        self.restart_delay = min(self.restart_delay * 2, RESTART_DELAY_MAX)
+
+    def terminate(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Discord Botを複数プロセスのシャードで起動します")
+    parser.add_argument('--processes', type=int, default=int(os.getenv('SHARD_PROCESSES', 1)),
+                        help="起動するプロセス数")
+    parser.add_argument('--shard-count', type=int, default=int(os.getenv('SHARD_COUNT', 0)) or None,
+                        help="全体のシャード数（省略時はDiscordの推奨数）")
+    parser.add_argument('--shard-ids', default=os.getenv('SHARD_IDS'),
+                        help="このマシンで担当するシャードID（例: 0-7）。省略時は全シャード")
+    parser.add_argument('--sync-commands', action='store_true',
+                        help="シャード0を担当するプロセスでスラッシュコマンドを強制同期する")
+    args = parser.parse_args()
+
+    token = os.getenv('DISCORD_TOKEN')
+    if not token:
+        print("エラー: DISCORD_TOKENが設定されていません")
+        sys.exit(1)
+
+    shard_count = args.shard_count or fetch_recommended_shard_count(token)
+    shard_ids = parse_shard_ids(args.shard_ids) if args.shard_ids else list(range(shard_count))
+    if not shard_ids or shard_ids[-1] >= shard_count:
+        print(f"エラー: シャードIDは0-{shard_count - 1}の範囲で指定してください")
+        sys.exit(1)
+
+    # データベースの初期化は1回だけ行う（各プロセスが同時にCREATEしないように）
+    from shared.database import init_database
+    init_database()
+
+    groups = split_shards(shard_ids, max(1, min(args.processes, len(shard_ids))))
+    # 監視用HTTPサーバーのポートはプロセスごとにMETRICS_PORTから順に割り当てる
+    metrics_port = int(os.getenv('METRICS_PORT', 0))
+    processes = [
+        ShardProcess(shard_count, group, ['--sync-commands'] if args.sync_commands and 0 in group else [],
+                     metrics_port + index if metrics_port else None)
+        for index, group in enumerate(groups)
+    ]
+    print(f"[launcher] {shard_count} shards total, running {format_shard_ids(shard_ids)} in {len(processes)} processes")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for shard_process in processes:
+            shard_process.terminate()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for shard_process in processes:
+        shard_process.start()
+
+    while True:
+        now = time.monotonic()
+        for shard_process in processes:
+            shard_process.check(now, stopping)
+        if stopping and all(p.process is None for p in processes):
+            break
+        time.sleep(1)
+
+    print("[launcher] all shard processes stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import math
+import os
+
+#######################
+# シャード設定
+# - SHARD_COUNT: 全体のシャード数（未設定の場合はDiscordの推奨数を自動で使う）
+# - SHARD_IDS: このプロセスが担当するシャードID（例: "0,1,2" / "0-3" / "0-3,8-11"）
+# - SHARD_IDSの代わりに SHARD_PROCESS_INDEX と SHARD_PROCESS_COUNT を指定すると、
+#   SHARD_COUNT個のシャードを連続した範囲に分けたうちINDEX番目を担当する
+# - 何も設定しない場合は、1プロセスで全シャードを担当する
+#######################
+
+
+def parse_shard_ids(value: str) -> list:
+    """
+    "0,1,2" や "0-3,8-11" 形式の文字列をシャードIDのリストにする
+
+    Raises:
+        ValueError: 形式が不正な場合
+    """
+    shard_ids = []
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition('-')
+        start = int(start)
+        end = int(end) if end else start
+        if start < 0 or end < start:
+            raise ValueError(f"Invalid shard range: {part}")
+        shard_ids.extend(range(start, end + 1))
+    return sorted(set(shard_ids))
+
+
+def format_shard_ids(shard_ids: list) -> str:
+    """シャードIDのリストを "0-3,8" 形式の文字列にする"""
+    ranges = []
+    for shard_id in sorted(shard_ids):
+        if ranges and ranges[-1][1] == shard_id - 1:
+            ranges[-1][1] = shard_id
+        else:
+            ranges.append([shard_id, shard_id])
+    return ','.join(f"{start}-{end}" if start != end else str(start) for start, end in ranges)
+
+
+def split_shards(shard_ids: list, processes: int) -> list:
+    """シャードIDを、プロセスごとの連続した範囲に分ける"""
+    shard_ids = sorted(shard_ids)
+    per_process = math.ceil(len(shard_ids) / processes) if shard_ids else 0
+    return [shard_ids[i:i + per_process] for i in range(0, len(shard_ids), per_process)] if per_process else []
+
+
+def resolve_shard_config(environ=os.environ) -> tuple:
+    """
+    環境変数からこのプロセスのシャード設定を決める
+
+    Returns:
+        tuple: (shard_count, shard_ids)。どちらもNoneの場合は自動（全シャードを担当）
+
+    Raises:
+        ValueError: 設定が矛盾している場合
+    """
+    shard_count = int(environ['SHARD_COUNT']) if environ.get('SHARD_COUNT') else None
+
+    if environ.get('SHARD_IDS'):
+        shard_ids = parse_shard_ids(environ['SHARD_IDS'])
+    elif environ.get('SHARD_PROCESS_INDEX') and environ.get('SHARD_PROCESS_COUNT'):
+        if shard_count is None:
+            raise ValueError("SHARD_PROCESS_INDEX requires SHARD_COUNT")
+        index = int(environ['SHARD_PROCESS_INDEX'])
+        groups = split_shards(list(range(shard_count)), int(environ['SHARD_PROCESS_COUNT']))
+        if not 0 <= index < len(groups):
+            raise ValueError(f"SHARD_PROCESS_INDEX out of range: {index}")
+        shard_ids = groups[index]
+    else:
+        shard_ids = None
+
+    if shard_ids is not None:
+        if shard_count is None:
+            raise ValueError("SHARD_IDS requires SHARD_COUNT")
+        if not shard_ids or shard_ids[-1] >= shard_count:
+            raise ValueError(f"Shard IDs must be within 0-{shard_count - 1}")
+    return shard_count, shard_ids
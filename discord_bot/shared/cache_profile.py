@@ -0,0 +1,48 @@
+import os
+import discord
+
+#######################
+# Gatewayのキャッシュ設定（CACHE_PROFILE）
+# - minimal（既定）: ギルド・ロール・チャンネルのみ受信してキャッシュする
+#   - Intentsはguildsのみ（スラッシュコマンドのINTERACTION_CREATEはIntentsに関係なく届く）
+#   - メッセージキャッシュ無効、メンバーキャッシュ無効、起動時のチャンク取得なし
+#   - プレミアムロールの確認はREST（fetch_member）で行うため、メンバーのキャッシュは不要
+#   - premium_members=True の場合のみmembers Intent（特権Intent）を有効にする
+#     （プレミアムサポートサーバーのメンバーだけをチャンク取得してキャッシュするため）
+# - default: 以前の discord.Intents.default() の挙動（比較・切り戻し用）
+#######################
+
+CACHE_PROFILES = ('minimal', 'default')
+DEFAULT_CACHE_PROFILE = 'minimal'
+
+
+def build_client_options(profile: str = None, premium_members: bool = False) -> dict:
+    """
+    discord.Client / commands.Bot に渡すキャッシュ関連の引数を作成
+
+    Args:
+        profile: 'minimal' または 'default'（省略時は環境変数CACHE_PROFILE）
+        premium_members: プレミアムサポートサーバーのメンバーを受信する場合True
+
+    Returns:
+        dict: intents, member_cache_flags, max_messages, chunk_guilds_at_startup
+    """
+    profile = (profile or os.getenv('CACHE_PROFILE', DEFAULT_CACHE_PROFILE)).lower()
+    if profile not in CACHE_PROFILES:
+        raise ValueError(f"Unknown CACHE_PROFILE: {profile} (expected one of {', '.join(CACHE_PROFILES)})")
+
+    if profile == 'default':
+        intents = discord.Intents.default()
+        intents.members = premium_members
+        return {'intents': intents}
+
+    intents = discord.Intents.none()
+    intents.guilds = True
+    # メンバーキャッシュは無効のまま、Guild.chunk()で取得したサーバーのメンバーだけがキャッシュされる
+    intents.members = premium_members
+    return {
+        'intents': intents,
+        'member_cache_flags': discord.MemberCacheFlags.none(),
+        'max_messages': None,
+        'chunk_guilds_at_startup': False,
+    }
@@ -1,19 +1,65 @@
 import os
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, NamedTupleCursor
 from contextlib import contextmanager
 import logging
+import threading
+import time
+import uuid
+from .link_id import LINK_KEY_ALPHABET, LINK_KEY_MAX_LENGTH
+from .metrics import REGISTRY
 
 logger = logging.getLogger(__name__)
 
+#######################
+# 接続の統計（コネクションプールは使わず、処理ごとに接続するため、その接続単位で数える）
+# - db_connect_duration_seconds: 接続にかかった時間（_countが接続した回数）
+# - db_connection_failures_total: 接続に失敗した回数
+# - db_connections_in_use: 現在開いている接続の数
+#######################
+
+DB_CONNECT_SECONDS = REGISTRY.histogram(
+    'db_connect_duration_seconds', 'Time to open a database connection'
+)
+DB_CONNECTION_FAILURES = REGISTRY.counter(
+    'db_connection_failures_total', 'Failed attempts to open a database connection'
+)
+DB_CONNECTIONS_IN_USE = REGISTRY.gauge(
+    'db_connections_in_use', 'Database connections currently open in this process'
+)
+
+_connections_in_use = 0
+_connections_lock = threading.Lock()
+DB_CONNECTIONS_IN_USE.set_function(lambda: _connections_in_use)
+
+def _track_connection(delta: int):
+    global _connections_in_use
+    with _connections_lock:
+        _connections_in_use += delta
+
+def _connect():
+    """データベースに接続（接続時間と開いている接続数を記録する）"""
+    started = time.perf_counter()
+    try:
+        conn = psycopg2.connect(os.getenv('DATABASE_URL'), sslmode='prefer', application_name=os.getenv('DB_APPLICATION_NAME', 'discord_bot'))
+    except Exception:
+        DB_CONNECTION_FAILURES.inc()
+        raise
+    DB_CONNECT_SECONDS.observe(time.perf_counter() - started)
+    _track_connection(1)
+    return conn
+
+def _close(conn):
+    conn.close()
+    _track_connection(-1)
+
 @contextmanager
 def get_db_cursor():
     """データベースカーソルのコンテキストマネージャー"""
     conn = None
     cursor = None
     try:
-        DATABASE_URL = os.getenv('DATABASE_URL')
-        conn = psycopg2.connect(DATABASE_URL, sslmode='prefer')
+        conn = _connect()
         conn.autocommit = True
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         yield cursor
@@ -26,7 +72,61 @@ def get_db_cursor():
         if cursor:
             cursor.close()
         if conn:
-            conn.close()
+            _close(conn)
+
+@contextmanager
+def get_db_connection():
+    """
+    トランザクション用のデータベース接続のコンテキストマネージャー
+    
+    - autocommitは無効（正常終了でcommit、例外でrollback）
+    - サーバーサイドカーソル（名前付きカーソル）やCOPYなど、トランザクションが必要な処理に使う
+    """
+    conn = None
+    try:
+        conn = _connect()
+        yield conn
+        conn.commit()
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        print(f"Database transaction failed: {e}")
+        raise
+    finally:
+        if conn:
+            _close(conn)
+
+def stream_rows(query: str, params=None, itersize: int = 1000, cursor_factory=NamedTupleCursor):
+    """
+    サーバーサイドカーソル（名前付きカーソル）で結果を少しずつ取得するジェネレーター
+    
+    - itersize行ずつDBから受け取るため、メモリ使用量は結果の件数ではなくitersizeに比例する
+    - 行はnamedtuple（row.link_id のように属性で参照、タプルとしても扱える）
+    - 途中でループを抜けた場合も、ジェネレーターが破棄された時点で接続を閉じる
+    
+    Args:
+        query: 実行するSELECT文
+        params: クエリのパラメータ
+        itersize: 1回のFETCHで受け取る行数
+        cursor_factory: 行の型を決めるカーソルクラス
+        
+    Yields:
+        行
+    """
+    with get_db_connection() as conn:
+        with conn.cursor(name=f"stream_{uuid.uuid4().hex}", cursor_factory=cursor_factory) as cursor:
+            cursor.itersize = itersize
+            cursor.execute(query, params)
+            yield from cursor
+
+def check_database() -> bool:
+    """データベースに接続してクエリを実行できるか（readinessチェック用）"""
+    try:
+        with get_db_cursor() as cursor:
+            cursor.execute("SELECT 1")
+            return True
+    except Exception:
+        return False
 
 def init_database():
     """データベーステーブルを初期化"""
@@ -70,6 +170,102 @@ def init_database():
                 ON role_invite_links(created_by_user_id)
             """)
             
+            # link IDのBIGINTキー（変換はshared/link_id.pyのlink_key_for()と同じ）
+            # - 列の追加はNULL許可なのでテーブルの書き換えは発生しない
+            # - 既存の行はbackfill_link_keys.pyでバッチ単位で埋める
+            cursor.execute("""
+                ALTER TABLE role_invite_links ADD COLUMN IF NOT EXISTS link_key BIGINT NULL
+            """)
+            
+            cursor.execute(f"""
+                CREATE OR REPLACE FUNCTION role_invite_link_key(link_id TEXT) RETURNS BIGINT AS $$
+                DECLARE
+                    key BIGINT := 0;
+                    digit INTEGER;
+                BEGIN
+                    IF length(link_id) > {LINK_KEY_MAX_LENGTH} THEN
+                        RETURN NULL;
+                    END IF;
+                    FOR i IN 1..length(link_id) LOOP
+                        digit := strpos('{LINK_KEY_ALPHABET}', substr(link_id, i, 1));
+                        IF digit = 0 THEN
+                            RETURN NULL;
+                        END IF;
+                        key := key * {len(LINK_KEY_ALPHABET)} + digit;
+                    END LOOP;
+                    RETURN key;
+                END
+                $$ LANGUAGE plpgsql IMMUTABLE STRICT
+            """)
+            
+            # 新しく作成・インポートされた行はトリガーでlink_keyを設定する
+            cursor.execute("""
+                CREATE OR REPLACE FUNCTION set_role_invite_link_key() RETURNS trigger AS $$
+                BEGIN
+                    NEW.link_key := role_invite_link_key(NEW.link_id);
+                    RETURN NEW;
+                END
+                $$ LANGUAGE plpgsql
+            """)
+            cursor.execute("DROP TRIGGER IF EXISTS trg_role_invite_links_link_key ON role_invite_links")
+            cursor.execute("""
+                CREATE TRIGGER trg_role_invite_links_link_key
+                BEFORE INSERT OR UPDATE OF link_id ON role_invite_links
+                FOR EACH ROW EXECUTE FUNCTION set_role_invite_link_key()
+            """)
+            
+            # キーを持つ行だけの部分インデックス（バックフィル中も増分で更新される）
+            cursor.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS uq_role_invite_links_link_key
+                ON role_invite_links(link_key) WHERE link_key IS NOT NULL
+            """)
+            
+            # Botの状態（最後に同期したコマンド定義のハッシュなど）
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS bot_state (
+                    key VARCHAR(255) PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    updated_at_unix BIGINT NOT NULL
+                )
+            """)
+            
+            # 一覧表示のキャッシュ用のバージョン番号（サーバー単位・作成者単位）
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS role_invite_link_versions (
+                    scope CHAR(1) NOT NULL,
+                    scope_id BIGINT NOT NULL,
+                    version BIGINT NOT NULL DEFAULT 0,
+                    PRIMARY KEY (scope, scope_id)
+                )
+            """)
+            
+            # role_invite_linksの作成・更新・削除でバージョン番号を上げるトリガー
+            # - 'g'はguild_id、'u'はcreated_by_user_id単位
+            # - 文単位のトリガーなので、一括作成・インポートでも1文につき1回だけ更新する
+            # - guild_idとcreated_by_user_idは更新されないため、UPDATEは更新前の行だけを見る
+            cursor.execute("""
+                CREATE OR REPLACE FUNCTION bump_role_invite_link_versions() RETURNS trigger AS $$
+                BEGIN
+                    INSERT INTO role_invite_link_versions (scope, scope_id, version)
+                    SELECT DISTINCT s.scope, s.scope_id, 1
+                    FROM changed_rows r
+                    CROSS JOIN LATERAL (VALUES ('g', r.guild_id), ('u', r.created_by_user_id)) AS s(scope, scope_id)
+                    ON CONFLICT (scope, scope_id)
+                    DO UPDATE SET version = role_invite_link_versions.version + 1;
+                    RETURN NULL;
+                END
+                $$ LANGUAGE plpgsql
+            """)
+            for operation, transition in (('INSERT', 'NEW'), ('UPDATE', 'OLD'), ('DELETE', 'OLD')):
+                trigger_name = f"trg_role_invite_links_version_{operation.lower()}"
+                cursor.execute(f"DROP TRIGGER IF EXISTS {trigger_name} ON role_invite_links")
+                cursor.execute(f"""
+                    CREATE TRIGGER {trigger_name}
+                    AFTER {operation} ON role_invite_links
+                    REFERENCING {transition} TABLE AS changed_rows
+                    FOR EACH STATEMENT EXECUTE FUNCTION bump_role_invite_link_versions()
+                """)
+            
             logger.info("Database tables initialized successfully")
             print("Database tables initialized successfully")
             
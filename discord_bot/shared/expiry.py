@@ -0,0 +1,74 @@
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+#######################
+# 有効期限・作成日時の扱い
+# - 正とするのはUnixタイムスタンプ（expires_at_unix / created_at_unix）
+#   表示用の文字列（expires_at / created_at）は保存時に作る表示キャッシュで、解析し直さない
+# - 入力の解析はparse_expiry()の1か所だけで行う（日時は日本時間として解釈する）
+# - 表示用の日本時間の文字列はformat_jst()がタイムスタンプごとにキャッシュする
+#   （一括作成したリンクは同じ有効期限を持つため、一覧表示ではほぼキャッシュから返る）
+#######################
+
+JST = timezone(timedelta(hours=9))
+
+EXPIRES_FORMAT = '%Y-%m-%d %H:%M JST'
+CREATED_FORMAT = '%Y-%m-%d %H:%M:%S JST'
+
+# 相対時間（例: 7d, 24h, 30m）
+_RELATIVE_PATTERN = re.compile(r'^(\d{1,6})\s*([dhm])$')
+_RELATIVE_SECONDS = {'d': 86400, 'h': 3600, 'm': 60}
+
+# 絶対時間（例: 2024-12-31, 2024-12-31 23:59, 2024-12-31 23:59:00 JST）
+_ABSOLUTE_PATTERN = re.compile(
+    r'^(\d{4})-(\d{1,2})-(\d{1,2})(?:[ T](\d{1,2}):(\d{2})(?::(\d{2}))?)?(?:\s*JST)?$'
+)
+
+
+def parse_expiry(text: str, now: int = None) -> int:
+    """
+    有効期限の入力をUnixタイムスタンプに変換
+
+    - 相対時間（7d / 24h / 30m）は現在時刻からの経過時間
+    - 日付のみ（YYYY-MM-DD）の場合は日本時間の23:59
+    - 末尾の「JST」は省略可能（エクスポートした表示用の文字列もそのまま受け付ける）
+
+    Args:
+        text: 入力文字列
+        now: 現在のUnix時間（省略時は現在時刻）
+
+    Returns:
+        int: Unixタイムスタンプ
+
+    Raises:
+        ValueError: 形式が不正な場合
+    """
+    text = text.strip()
+    match = _RELATIVE_PATTERN.match(text)
+    if match:
+        if now is None:
+            now = int(time.time())
+        return now + int(match.group(1)) * _RELATIVE_SECONDS[match.group(2)]
+
+    match = _ABSOLUTE_PATTERN.match(text)
+    if match:
+        year, month, day, hour, minute, second = match.groups()
+        try:
+            if hour is None:
+                parsed = datetime(int(year), int(month), int(day), 23, 59, tzinfo=JST)
+            else:
+                parsed = datetime(int(year), int(month), int(day), int(hour), int(minute), int(second or 0), tzinfo=JST)
+        except ValueError:
+            pass
+        else:
+            return int(parsed.timestamp())
+
+    raise ValueError(f"無効な日付形式です: {text}")
+
+
+@lru_cache(maxsize=4096)
+def format_jst(unix: int, fmt: str = EXPIRES_FORMAT) -> str:
+    """Unixタイムスタンプを日本時間の表示用文字列に変換（結果はキャッシュする）"""
+    return datetime.fromtimestamp(unix, JST).strftime(fmt)
@@ -0,0 +1,259 @@
+import functools
+import hmac
+import os
+import threading
+import time
+
+#######################
+# Prometheus形式のメトリクス
+# - 外部ライブラリを使わず、カウンター・ヒストグラム・ゲージをプロセス内に保持する
+# - render()でPrometheusのテキスト形式（version 0.0.4）に変換して /metrics で返す
+# - /metrics は環境変数METRICS_TOKENのBearerトークンで保護する（未設定の場合は無効）
+# - ラベルの値はルートのテンプレートや関数名など種類が限られるものだけにする（IDなどは入れない）
+#######################
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# レイテンシ用のバケット（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _render_values(name: str, labelnames: tuple, items: list) -> list:
+    """カウンター・ゲージの値を出力（関数が登録されている場合は呼び出し、Noneなら出力しない）"""
+    lines = []
+    for key, value in items:
+        if callable(value):
+            value = value()
+            if value is None:
+                continue
+        lines.append(f"{name}{_format_labels(labelnames, key)} {_format_value(value)}")
+    return lines
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """
+    単調増加するカウンター
+
+    - inc()で加算するほか、set_function()で出力時に値を取得する関数を登録できる
+      （既存のキャッシュのhits/missesなど、他のオブジェクトが数えている累計値をそのまま公開する場合）
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_function(self, func, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = func
+
+    def samples(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        return _render_values(self.name, self.labelnames, items)
+
+
+class Gauge(_Metric):
+    """
+    現在値を表すゲージ
+
+    - set()で値を設定するほか、set_function()で出力時に値を取得する関数を登録できる
+      （既存のキャッシュのhits/missesなど、他のオブジェクトが持つ値をそのまま公開する場合）
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, func, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = func
+
+    def samples(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        return _render_values(self.name, self.labelnames, items)
+
+
+class Histogram(_Metric):
+    """累積バケット付きのヒストグラム"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._values = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = entry[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, **labels):
+        """withブロックの経過時間を記録するコンテキストマネージャー"""
+        return _Timer(self, labels)
+
+    def samples(self) -> list:
+        with self._lock:
+            items = sorted((key, ([*entry[0]], entry[1], entry[2])) for key, entry in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{float(bound)!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """メトリクスを名前順に保持してまとめて出力する"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} is already registered with a different definition")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """全メトリクスをPrometheusのテキスト形式で出力"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+# プロセス全体で共有するレジストリ
+REGISTRY = MetricsRegistry()
+
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    'db_query_duration_seconds', 'Time spent in database model functions', ('function',)
+)
+
+
+def observe_db(func):
+    """モデル関数の実行時間をdb_query_duration_secondsに記録するデコレーター"""
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with DB_QUERY_SECONDS.time(function=name):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def is_authorized(authorization: str, token: str = None) -> bool:
+    """
+    Authorizationヘッダーが「Bearer <METRICS_TOKEN>」と一致するか
+
+    - METRICS_TOKENが未設定の場合は常にFalse（/metricsは無効）
+    """
+    token = token if token is not None else os.getenv('METRICS_TOKEN', '')
+    if not token or not authorization:
+        return False
+    scheme, _, credentials = authorization.partition(' ')
+    if scheme.lower() != 'bearer':
+        return False
+    return hmac.compare_digest(credentials.strip().encode(), token.encode())
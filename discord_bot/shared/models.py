@@ -1,88 +1,219 @@
-from .database import get_db_cursor
+import csv
+import io
+import time
+from psycopg2.extras import execute_values
+from .database import get_db_cursor, get_db_connection, stream_rows
+from .invite_link import InviteLink
+from .link_status import LINK_STATUS_SQL
+from .link_id import generate_link_id, link_lookup_condition, LINK_ID_MAX_ATTEMPTS
 
-def save_invite_link(guild_id: int, role_id: int, link_id: str, created_by_user_id: int, max_uses: int = None, expires_at: str = None, expires_at_unix: int = None, created_at: str = None, created_at_unix: int = None) -> bool:
-    """招待リンクをデータベースに保存"""
+def create_invite_link(guild_id: int, role_id: int, created_by_user_id: int, max_uses: int = None, expires_at: str = None, expires_at_unix: int = None, created_at: str = None, created_at_unix: int = None, max_attempts: int = LINK_ID_MAX_ATTEMPTS) -> str:
+    """
+    新しいlink IDを生成して招待リンクをデータベースに保存
+    
+    - link IDが既存のものと衝突した場合はON CONFLICT DO NOTHINGで何も挿入されないので、IDを作り直して再試行する
+    
+    Returns:
+        str: 保存したlink ID（保存できなかった場合はNone）
+    """
     try:
         with get_db_cursor() as cursor:
             query = """
                 INSERT INTO role_invite_links (guild_id, role_id, link_id, created_by_user_id, max_uses, current_uses, expires_at, expires_at_unix, created_at, created_at_unix)
                 VALUES (%s, %s, %s, %s, %s, 0, %s, %s, %s, %s)
+                ON CONFLICT (link_id) DO NOTHING
+                RETURNING link_id
             """
-            cursor.execute(query, (guild_id, role_id, link_id, created_by_user_id, max_uses, expires_at, expires_at_unix, created_at, created_at_unix))
-            return True
+            for attempt in range(1, max_attempts + 1):
+                link_id = generate_link_id()
+                cursor.execute(query, (guild_id, role_id, link_id, created_by_user_id, max_uses, expires_at, expires_at_unix, created_at, created_at_unix))
+                if cursor.fetchone():
+                    return link_id
+                print(f"Link ID collision, regenerating (attempt {attempt}/{max_attempts})")
+            return None
     except Exception as e:
         print(f"Failed to save invite link: {e}")
-        return False
+        return None
+
+def save_invite_links_bulk(rows: list) -> list:
+    """
+    複数の招待リンクを1回の複数行INSERTでデータベースに保存
+    
+    Args:
+        rows: (guild_id, role_id, link_id, created_by_user_id, max_uses, expires_at, expires_at_unix, created_at, created_at_unix) のリスト
+        
+    Returns:
+        list: 保存できたlink_idのリスト（link_idが重複した行は含まれない）
+    """
+    try:
+        with get_db_cursor() as cursor:
+            query = """
+                INSERT INTO role_invite_links (guild_id, role_id, link_id, created_by_user_id, max_uses, expires_at, expires_at_unix, created_at, created_at_unix)
+                VALUES %s
+                ON CONFLICT (link_id) DO NOTHING
+                RETURNING link_id
+            """
+            results = execute_values(cursor, query, rows, page_size=len(rows), fetch=True)
+            return [row['link_id'] for row in results]
+    except Exception as e:
+        print(f"Failed to save invite links in bulk: {e}")
+        return []
+
+def count_invite_links(user_id: int, guild_id: int) -> tuple:
+    """
+    指定ユーザーが作成した招待リンク数と、指定サーバーの招待リンク数を1回のクエリで取得
+    
+    Returns:
+        tuple: (ユーザーのリンク数, サーバーのリンク数)。取得に失敗した場合はNone
+    """
+    try:
+        with get_db_cursor() as cursor:
+            query = """
+                SELECT COUNT(*) FILTER (WHERE created_by_user_id = %s) AS user_links,
+                       COUNT(*) FILTER (WHERE guild_id = %s) AS guild_links
+                FROM role_invite_links
+                WHERE created_by_user_id = %s OR guild_id = %s
+            """
+            cursor.execute(query, (user_id, guild_id, user_id, guild_id))
+            result = cursor.fetchone()
+            return result['user_links'], result['guild_links']
+    except Exception as e:
+        print(f"Failed to count invite links: {e}")
+        return None
 
 def increment_invite_usage(link_id: str) -> bool:
     """招待リンクの使用回数をインクリメント"""
     try:
         with get_db_cursor() as cursor:
-            query = """
+            condition, params = link_lookup_condition(link_id)
+            query = f"""
                 UPDATE role_invite_links 
                 SET current_uses = current_uses + 1
-                WHERE link_id = %s
+                WHERE {condition}
             """
-            cursor.execute(query, (link_id,))
+            cursor.execute(query, params)
             return cursor.rowcount > 0
     except Exception as e:
         print(f"Failed to increment invite usage: {e}")
         return False
 
-def get_invite_link_info(link_id: str) -> dict:
+def get_invite_link_info(link_id: str) -> InviteLink:
     """招待リンクの情報を取得"""
     try:
         with get_db_cursor() as cursor:
-            query = """
-                SELECT guild_id, role_id, link_id, created_by_user_id, max_uses, current_uses, expires_at, expires_at_unix, created_at, created_at_unix
+            condition, params = link_lookup_condition(link_id)
+            query = f"""
+                SELECT guild_id, role_id, link_id, created_by_user_id, max_uses, current_uses, expires_at, expires_at_unix, created_at, created_at_unix,
+                       {LINK_STATUS_SQL} AS status_flags
                 FROM role_invite_links
-                WHERE link_id = %s
+                WHERE {condition}
             """
-            cursor.execute(query, (link_id,))
+            cursor.execute(query, (int(time.time()),) + params)
             result = cursor.fetchone()
             
             if result:
-                return dict(result)
+                return InviteLink.from_row(result)
             return None
     except Exception as e:
         print(f"Failed to get invite link info: {e}")
         return None
 
-def get_guild_invite_links(guild_id: int) -> list:
-    """指定サーバーの招待リンク一覧を取得"""
+# 一覧表示で取得する列
+INVITE_LINK_COLUMNS = "id, guild_id, role_id, link_id, created_by_user_id, max_uses, current_uses, expires_at, expires_at_unix, created_at, created_at_unix"
+
+def _get_invite_links_page(column: str, value: int, limit: int) -> tuple:
+    """
+    指定した列の値に一致する招待リンクを新しい順にlimit件だけ取得し、全体の件数も返す
+    
+    Returns:
+        tuple: (InviteLinkのリスト, 全体の件数)
+    """
+    # 状態はSQLの計算列として、1つの現在時刻でまとめて判定する
+    query = f"""
+        SELECT {INVITE_LINK_COLUMNS}, {LINK_STATUS_SQL} AS status_flags, COUNT(*) OVER () AS total_count
+        FROM role_invite_links
+        WHERE {column} = %s
+        ORDER BY created_at_unix DESC
+        LIMIT %s
+    """
+    # 1ページ分の少ない件数なので、サーバーサイドカーソルは使わずに通常のカーソルでまとめて取得する
+    with get_db_cursor() as cursor:
+        cursor.execute(query, (int(time.time()), value, limit))
+        rows = cursor.fetchall()
+    total = rows[0]['total_count'] if rows else 0
+    return [InviteLink.from_row(row) for row in rows], total
+
+def get_guild_invite_links_page(guild_id: int, limit: int = 25) -> tuple:
+    """指定サーバーの招待リンクを新しい順にlimit件取得（(行のリスト, 全体の件数)を返す）"""
     try:
-        with get_db_cursor() as cursor:
-            query = """
-                SELECT id, guild_id, role_id, link_id, created_by_user_id, max_uses, current_uses, expires_at, expires_at_unix, created_at, created_at_unix
-                FROM role_invite_links
-                WHERE guild_id = %s
-                ORDER BY created_at_unix DESC
-            """
-            cursor.execute(query, (guild_id,))
-            results = cursor.fetchall()
-            
-            return [dict(row) for row in results]
+        return _get_invite_links_page('guild_id', guild_id, limit)
     except Exception as e:
         print(f"Failed to get guild invite links: {e}")
-        return []
+        return [], 0
+
+def get_user_invite_links_page(user_id: int, limit: int = 25) -> tuple:
+    """指定ユーザーが作成した招待リンクを新しい順にlimit件取得（(行のリスト, 全体の件数)を返す）"""
+    try:
+        return _get_invite_links_page('created_by_user_id', user_id, limit)
+    except Exception as e:
+        print(f"Failed to get user invite links: {e}")
+        return [], 0
 
-def get_user_invite_links(user_id: int) -> list:
-    """指定ユーザーが作成した招待リンク一覧を取得"""
+def get_invite_link_version(scope: str, scope_id: int) -> int:
+    """
+    一覧表示のキャッシュ用のバージョン番号を取得（トリガーで作成・更新・削除のたびに上がる）
+    
+    Args:
+        scope: 'g'（サーバー単位）または 'u'（作成者単位）
+        scope_id: ギルドIDまたはユーザーID
+        
+    Returns:
+        int: バージョン番号（一度も変更が無い場合は0、取得に失敗した場合はNone）
+    """
     try:
         with get_db_cursor() as cursor:
-            query = """
-                SELECT id, guild_id, role_id, link_id, created_by_user_id, max_uses, current_uses, expires_at, expires_at_unix, created_at, created_at_unix
-                FROM role_invite_links
-                WHERE created_by_user_id = %s
-                ORDER BY created_at_unix DESC
-            """
-            cursor.execute(query, (user_id,))
-            results = cursor.fetchall()
+            query = "SELECT version FROM role_invite_link_versions WHERE scope = %s AND scope_id = %s"
+            cursor.execute(query, (scope, scope_id))
+            result = cursor.fetchone()
+            return result['version'] if result else 0
+    except Exception as e:
+        print(f"Failed to get invite link version: {e}")
+        return None
+
+def backfill_link_keys(after_id: int = 0, batch_size: int = 5000) -> tuple:
+    """
+    idがafter_idより後の行をbatch_size件の範囲だけ処理し、link_keyが未設定の行を埋める
+    
+    - 主キーの範囲で更新するため、統計情報に関係なくインデックスの範囲スキャンになる
+    - キーを持たないlink ID（11文字以上など）はNULLのまま残るため、呼び出し側はidで続きから処理する
+    
+    Args:
+        after_id: このidより後の行から処理する
+        batch_size: 1回で処理する行数（範囲の大きさ）
+        
+    Returns:
+        tuple: (更新した行数, 範囲の最後のid)（全て処理済みならidはNone、失敗した場合は(None, after_id)）
+    """
+    try:
+        with get_db_cursor() as cursor:
+            cursor.execute("""
+                SELECT MAX(id) AS last_id FROM (
+                    SELECT id FROM role_invite_links WHERE id > %s ORDER BY id LIMIT %s
+                ) batch
+            """, (after_id, batch_size))
+            last_id = cursor.fetchone()['last_id']
+            if last_id is None:
+                return 0, None
             
-            return [dict(row) for row in results]
+            cursor.execute("""
+                UPDATE role_invite_links
+                SET link_key = role_invite_link_key(link_id)
+                WHERE id > %s AND id <= %s AND link_key IS NULL
+            """, (after_id, last_id))
+            return cursor.rowcount, last_id
     except Exception as e:
-        print(f"Failed to get user invite links: {e}")
-        return []
+        print(f"Failed to backfill link keys: {e}")
+        return None, after_id
 
 def delete_invite_link(link_id: str) -> bool:
     """招待リンクをデータベースから削除"""
@@ -93,4 +224,133 @@ def delete_invite_link(link_id: str) -> bool:
             return cursor.rowcount > 0
     except Exception as e:
         print(f"Failed to delete invite link: {e}")
-        return False
\ No newline at end of file
+        return False
+
+def get_guild_usage_rollups(guild_id: int, hourly_since_unix: int, daily_since_unix: int, link_id: str = None) -> list:
+    """指定サーバーの招待リンク利用数の集計（1時間単位・1日単位）を取得"""
+    try:
+        with get_db_cursor() as cursor:
+            query = """
+                SELECT granularity, link_id, bucket_start_unix, joins
+                FROM role_invite_link_usage_rollups
+                WHERE guild_id = %s
+                  AND ((granularity = 'h' AND bucket_start_unix >= %s)
+                    OR (granularity = 'd' AND bucket_start_unix >= %s))
+            """
+            params = [guild_id, hourly_since_unix, daily_since_unix]
+            if link_id:
+                query += " AND link_id = %s"
+                params.append(link_id)
+            cursor.execute(query, params)
+            results = cursor.fetchall()
+            
+            return [dict(row) for row in results]
+    except Exception as e:
+        print(f"Failed to get guild usage rollups: {e}")
+        return []
+
+# エクスポート・インポートで扱う列（guild_idは対象サーバーで固定するため含めない）
+INVITE_LINK_TRANSFER_COLUMNS = (
+    'link_id', 'role_id', 'created_by_user_id', 'max_uses', 'current_uses',
+    'expires_at', 'expires_at_unix', 'created_at', 'created_at_unix'
+)
+
+def iter_guild_invite_links_for_export(guild_id: int, batch_size: int = 2000):
+    """
+    指定サーバーの招待リンクをサーバーサイドカーソルで少しずつ取得するジェネレーター
+    
+    - 一度に全件を読み込まないため、件数が多くてもメモリ使用量は一定
+    
+    Yields:
+        tuple: INVITE_LINK_TRANSFER_COLUMNSの順の値
+    """
+    columns = ', '.join(INVITE_LINK_TRANSFER_COLUMNS)
+    query = f"SELECT {columns} FROM role_invite_links WHERE guild_id = %s ORDER BY id"
+    return stream_rows(query, (guild_id,), itersize=batch_size)
+
+def import_guild_invite_links(guild_id: int, rows, batch_size: int = 5000) -> int:
+    """
+    招待リンクをCOPYでまとめて取り込む
+    
+    - 一時テーブルへバッチ単位でCOPYしたあと、1回のINSERT ... SELECTで本テーブルに反映する
+    - link_idが既に存在する行（他のサーバーのものを含む）はスキップする
+    - 全体を1トランザクションで行うため、途中で失敗した場合は何も取り込まれない
+    
+    Args:
+        guild_id: 取り込み先のギルドID
+        rows: INVITE_LINK_TRANSFER_COLUMNSの順の値のタプルのイテラブル（検証済みであること）
+        batch_size: 1回のCOPYで送る行数
+        
+    Returns:
+        int: 取り込んだ行数（失敗した場合はNone）
+    """
+    columns = ', '.join(INVITE_LINK_TRANSFER_COLUMNS)
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    CREATE TEMP TABLE import_invite_links (
+                        link_id VARCHAR(255) NOT NULL,
+                        role_id BIGINT NOT NULL,
+                        created_by_user_id BIGINT NOT NULL,
+                        max_uses INTEGER NULL,
+                        current_uses INTEGER NOT NULL,
+                        expires_at VARCHAR(255) NULL,
+                        expires_at_unix BIGINT NULL,
+                        created_at VARCHAR(255) NOT NULL,
+                        created_at_unix BIGINT NOT NULL
+                    ) ON COMMIT DROP
+                """)
+                
+                copy_sql = f"COPY import_invite_links ({columns}) FROM STDIN WITH (FORMAT csv)"
+                batch = []
+                for row in rows:
+                    batch.append(row)
+                    if len(batch) >= batch_size:
+                        _copy_rows(cursor, copy_sql, batch)
+                        batch = []
+                if batch:
+                    _copy_rows(cursor, copy_sql, batch)
+                
+                cursor.execute(f"""
+                    INSERT INTO role_invite_links (guild_id, {columns})
+                    SELECT %s, {columns} FROM import_invite_links
+                    ON CONFLICT (link_id) DO NOTHING
+                """, (guild_id,))
+                return cursor.rowcount
+    except Exception as e:
+        print(f"Failed to import invite links: {e}")
+        return None
+
+def _copy_rows(cursor, copy_sql: str, rows: list):
+    """行のリストをCSVとしてCOPYで送る（NoneはNULLになる）"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(copy_sql, buffer)
+
+def get_bot_state(key: str) -> str:
+    """Botの状態を取得（無い場合・取得に失敗した場合はNone）"""
+    try:
+        with get_db_cursor() as cursor:
+            cursor.execute("SELECT value FROM bot_state WHERE key = %s", (key,))
+            result = cursor.fetchone()
+            return result['value'] if result else None
+    except Exception as e:
+        print(f"Failed to get bot state: {e}")
+        return None
+
+def set_bot_state(key: str, value: str) -> bool:
+    """Botの状態を保存"""
+    try:
+        with get_db_cursor() as cursor:
+            query = """
+                INSERT INTO bot_state (key, value, updated_at_unix)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, updated_at_unix = EXCLUDED.updated_at_unix
+            """
+            cursor.execute(query, (key, value, int(time.time())))
+            return True
+    except Exception as e:
+        print(f"Failed to set bot state: {e}")
+        return False
@@ -0,0 +1,62 @@
+import time
+
+
+class VersionedRenderCache:
+    """
+    一覧表示などの描画結果を、データのバージョン番号と一緒に保持するキャッシュ
+
+    次のいずれかで無効になる
+    - 保存時と現在のバージョン番号が異なる（DBのトリガーが作成・削除・使用回数の変更で更新する）
+    - valid_until_unix（次にリンクの有効期限が切れる時刻など）を過ぎた
+    - ttl秒が経過した（ロール名やサーバー名の変更など、バージョンに現れない変化への保険）
+    - invalidate()/invalidate_tag()で明示的に破棄された
+    """
+
+    def __init__(self, ttl: float = 300, max_entries: int = 1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        """
+        キャッシュ済みの描画結果を取得
+
+        Returns:
+            保存した値（無い・無効な場合はNone）
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry_version, expires, valid_until_unix, _, value = entry
+            if (entry_version == version and time.monotonic() < expires
+                    and (valid_until_unix is None or time.time() < valid_until_unix)):
+                self.hits += 1
+                return value
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, version, value, valid_until_unix: int = None, tags=()):
+        """
+        描画結果を保存
+
+        Args:
+            key: キャッシュのキー
+            version: 描画に使ったデータのバージョン番号
+            value: 保存する値
+            valid_until_unix: この時刻以降は無効（Unix時刻）
+            tags: invalidate_tag()で一括破棄するためのタグ（ギルドIDなど）
+        """
+        if key not in self._entries and len(self._entries) >= self.max_entries:
+            self._entries.pop(next(iter(self._entries)))
+        self._entries[key] = (version, time.monotonic() + self.ttl, valid_until_unix, frozenset(tags), value)
+
+    def invalidate(self, key):
+        """指定キーのキャッシュを破棄"""
+        self._entries.pop(key, None)
+
+    def invalidate_tag(self, tag):
+        """指定タグを持つキャッシュをすべて破棄"""
+        for key in [k for k, entry in self._entries.items() if tag in entry[3]]:
+            del self._entries[key]
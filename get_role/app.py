@@ -1,19 +1,40 @@
 import os
+import sys
+import signal
 import asyncio
-import threading
+import math
+import random
 import discord
-import requests
 import time
 import secrets
+import threading
 from collections import defaultdict, deque
-from flask import Flask, request, redirect, session
+from flask import Flask, request, redirect, session, Response, jsonify, g
 from urllib.parse import quote
 from dotenv import load_dotenv
 
 load_dotenv()
 
 # 同じディレクトリのsharedモジュールをインポート
-from shared.models import get_role_id_by_link_id, get_invite_link_full_info, increment_invite_link_usage
+from shared.models import (
+    get_role_id_by_link_id, get_invite_link_full_info,
+    enqueue_role_assignment_job, claim_role_assignment_jobs, complete_role_assignment_job,
+    mark_role_assignment_job_joined, retry_role_assignment_job, fail_role_assignment_job, get_role_assignment_job,
+    has_redeemed_invite_link, reserve_invite_link_use, confirm_invite_link_redemption,
+    release_invite_link_use,
+)
+from shared.database import init_web_tables
+from shared.event_log import RedemptionEventWriter, EVENT_JOINED, EVENT_ROLE_ADDED, EVENT_REPEAT
+from shared.compression import (
+    StaticAssetStore, PrerenderedPageCache, choose_encoding, compress_bytes,
+    is_compressible, record_compression, get_compression_stats, MIN_COMPRESS_SIZE,
+)
+from shared.async_runtime import start_background_loop, submit, run_coroutine, run_blocking
+from shared.discord_http import DiscordHTTPClient, TRANSPORT_ERRORS
+from shared.guild_info import GuildInfoProvider, parse_guild_id
+from shared.cache_profile import build_client_options
+from shared.metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE, is_authorized
+from shared.tracing import begin_span, start_span, traced, current_trace_id, new_trace_id
 
 # 環境変数から設定を読み込み
 GUILD_ID = int(os.getenv('DISCORD_GUILD_ID', 0))
@@ -23,28 +44,197 @@ DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
 DISCORD_CLIENT_ID = os.getenv('DISCORD_CLIENT_ID')
 DISCORD_CLIENT_SECRET = os.getenv('DISCORD_CLIENT_SECRET')
 REDIRECT_URI = os.getenv('REDIRECT_URI', 'http://localhost:5000/callback')
+# Bot導入URLのredirect_uri（導入完了時の認証コードの交換に使う）
+BOT_INSTALL_REDIRECT_URI = os.getenv('BOT_INSTALL_REDIRECT_URI', REDIRECT_URI.rsplit('/', 1)[0] + '/bot-install')
 SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key-here')
 OFFICIAL_WEBSITE_URL = os.getenv('OFFICIAL_WEBSITE_URL', 'https://discord-invitation-and-role.kei31.com')
 DISCORD_SUPPORT_SERVER_URL = os.getenv('DISCORD_SUPPORT_SERVER_URL', 'https://discord.gg/7b5g3RbjYv')
 DEFAULT_TIMEOUT = float(os.getenv("REQ_TIMEOUT", 5))
+DISCORD_API_BASE = os.getenv('DISCORD_API_BASE', 'https://discord.com/api/v10')
+# Gatewayに接続しない場合（負荷試験など）はギルド・ロールの情報をDiscord APIから取得する
+DISCORD_GATEWAY_ENABLED = os.getenv('DISCORD_GATEWAY_ENABLED', '1') == '1'
+
+# ギルド情報キャッシュ設定
+GUILD_INFO_TTL = float(os.getenv('GUILD_INFO_TTL', 300))
+GUILD_INFO_NEGATIVE_TTL = float(os.getenv('GUILD_INFO_NEGATIVE_TTL', 30))
+GUILD_INFO_TIMEOUT = float(os.getenv('GUILD_INFO_TIMEOUT', 2))
+
+# OAuthコールバック全体の待ち時間の上限（Discord API呼び出し2回分＋DB）
+CALLBACK_TIMEOUT = float(os.getenv('CALLBACK_TIMEOUT', DEFAULT_TIMEOUT * 3))
+# 同時に処理するOAuthコールバックの上限
+# - 処理はバックグラウンドループ上で行うが、FlaskのスレッドはCALLBACK_TIMEOUTまで結果を待って占有される
+# - 上限を超えた分は待たせずに503を返し、待機するスレッド数（メモリ）が際限なく増えないようにする
+CALLBACK_MAX_CONCURRENCY = int(os.getenv('CALLBACK_MAX_CONCURRENCY', 64))
+CALLBACK_SLOTS = threading.BoundedSemaphore(CALLBACK_MAX_CONCURRENCY)
+
+# ロール付与ジョブ設定
+JOB_WORKER_CONCURRENCY = int(os.getenv('JOB_WORKER_CONCURRENCY', 4))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 6))
+JOB_RETRY_BASE_SECONDS = float(os.getenv('JOB_RETRY_BASE_SECONDS', 2))
+JOB_RETRY_MAX_SECONDS = float(os.getenv('JOB_RETRY_MAX_SECONDS', 300))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1))
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 60))
+# ジョブにアクセストークンを保持する上限（登録からの秒数、過ぎたジョブは参加前なら失敗にする）
+JOB_TOKEN_TTL = int(os.getenv('JOB_TOKEN_TTL', 900))
+
+# 利用イベントログの書き込み設定
+EVENT_BATCH_SIZE = int(os.getenv('EVENT_BATCH_SIZE', 500))
+EVENT_FLUSH_INTERVAL = float(os.getenv('EVENT_FLUSH_INTERVAL', 2))
+EVENT_QUEUE_SIZE = int(os.getenv('EVENT_QUEUE_SIZE', 10000))
+# 1時間単位の利用数の集計を残す日数（0で削除しない）
+ROLLUP_HOURLY_RETENTION_DAYS = float(os.getenv('ROLLUP_HOURLY_RETENTION_DAYS', 7))
 
 # 簡易レート制限（メモリベース）
 ACCESS_LOG = defaultdict(deque)
-RATE_WINDOW = 60  # 60秒
-MAX_REQUESTS = 20  # 最大20リクエスト
+RATE_WINDOW = int(os.getenv('RATE_LIMIT_WINDOW', 60))  # 60秒
+MAX_REQUESTS = int(os.getenv('RATE_LIMIT_MAX_REQUESTS', 20))  # 最大20リクエスト
+# 処理中ページからのステータス確認と、トークンで保護されたメトリクスはレート制限の対象外
+RATE_LIMIT_EXEMPT_ENDPOINTS = {'join_status', 'metrics'}
+
+# /metrics のBearerトークン（未設定の場合は /metrics を無効にする）
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
 
-# Discord Bot
-bot = discord.Client(intents=discord.Intents.default())
-app = Flask(__name__)
+# HTTPキャッシュ設定
+STATIC_CACHE_CONTROL = os.getenv('STATIC_CACHE_CONTROL', 'public, max-age=86400')
+INVALID_LINK_CACHE_CONTROL = os.getenv('INVALID_LINK_CACHE_CONTROL', 'public, max-age=60')
+INVALID_LINK_MESSAGE = "無効な招待リンクです。"
+SERVER_ERROR_MESSAGE = "エラーが発生しました。時間をおいて再度お試しください。"
+
+# Discord Bot（Intents・キャッシュの設定は環境変数CACHE_PROFILE、詳細はshared/cache_profile.py）
+bot = discord.Client(**build_client_options())
+# 静的ファイルは事前圧縮したものを自前のルートで返すため、Flask標準のstaticは無効化
+app = Flask(__name__, static_folder=None)
 app.secret_key = SECRET_KEY
 
+# 事前圧縮済みの静的ファイルと固定ページ
+STATIC_ASSETS = StaticAssetStore(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
+PRERENDERED_PAGES = PrerenderedPageCache()
+
+# Discord APIクライアント（バックグラウンドループ上で使い回す）
+DISCORD_HTTP = DiscordHTTPClient(DISCORD_API_BASE, timeout=DEFAULT_TIMEOUT)
+# 招待リンク利用イベントのバッファ付きライター
+REDEMPTION_EVENTS = RedemptionEventWriter(
+    batch_size=EVENT_BATCH_SIZE, flush_interval=EVENT_FLUSH_INTERVAL, max_queue=EVENT_QUEUE_SIZE,
+    hourly_retention=ROLLUP_HOURLY_RETENTION_DAYS * 86400
+)
+# ギルド情報のキャッシュ（DBの招待リンクに登録済みのギルドIDに対してだけ使い、クエリのIDでは取得しない）
+GUILD_INFO = GuildInfoProvider(
+    DISCORD_HTTP, DISCORD_TOKEN,
+    ttl=GUILD_INFO_TTL, negative_ttl=GUILD_INFO_NEGATIVE_TTL, timeout=GUILD_INFO_TIMEOUT
+)
+
+#######################
+# メトリクス（Prometheus形式、詳細はshared/metrics.py）
+# - ルートごとのレイテンシ・ステータス、レート制限で拒否した数
+# - Discord APIの呼び出し（shared/discord_http.py）とDBのモデル関数（shared/models.py）の所要時間は各モジュールで記録する
+# - キャッシュのヒット率などは出力時に各オブジェクトの値を読む（累計値はcounterとして出力する）
+#######################
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'http_request_duration_seconds', 'Request latency by route', ('method', 'route')
+)
+HTTP_REQUESTS = REGISTRY.counter(
+    'http_requests_total', 'Requests by route and status', ('method', 'route', 'status')
+)
+RATE_LIMIT_REJECTIONS = REGISTRY.counter(
+    'rate_limit_rejections_total', 'Requests rejected by the in-memory rate limiter', ('route',)
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    'cache_lookups_total', 'Cache lookups since start by result', ('cache', 'result')
+)
+CACHE_HIT_RATIO = REGISTRY.gauge(
+    'cache_hit_ratio', 'Cache hit ratio since start', ('cache',)
+)
+COMPRESSION_BYTES = REGISTRY.counter(
+    'compression_bytes_total', 'Response bytes before and after compression since start', ('kind',)
+)
+REDEMPTION_EVENTS_STATS = REGISTRY.counter(
+    'redemption_events_total', 'Redemption event writer counters since start', ('result',)
+)
+
+def hit_ratio(cache):
+    total = cache.hits + cache.misses
+    return cache.hits / total if total else None
+
+for cache_name, cache in (('guild_info', GUILD_INFO), ('prerendered_pages', PRERENDERED_PAGES)):
+    CACHE_LOOKUPS.set_function(lambda cache=cache: cache.hits, cache=cache_name, result='hit')
+    CACHE_LOOKUPS.set_function(lambda cache=cache: cache.misses, cache=cache_name, result='miss')
+    CACHE_HIT_RATIO.set_function(lambda cache=cache: hit_ratio(cache), cache=cache_name)
+for kind in ('original_bytes', 'sent_bytes'):
+    COMPRESSION_BYTES.set_function(lambda kind=kind: get_compression_stats()[kind], kind=kind.replace('_bytes', ''))
+for result in ('recorded', 'written', 'dropped', 'failures', 'pruned'):
+    REDEMPTION_EVENTS_STATS.set_function(lambda result=result: REDEMPTION_EVENTS.stats[result], result=result)
+
+def request_route() -> str:
+    """メトリクスのラベル用のルート（/join/<link_id> のようなテンプレート）"""
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        route = request_route()
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method, route=route)
+        HTTP_REQUESTS.inc(method=request.method, route=route, status=response.status_code)
+    return response
+
+#######################
+# トレース（詳細はshared/tracing.py、出力先は環境変数TRACE_EXPORTER）
+# - /join/<link_id> で新しい相関ID（trace_id）を発行してセッションに保存し、/callback で引き継ぐ
+# - リクエスト全体を1つのspanとし、Discord API・DBのモデル関数・ロール付与ジョブの処理はその子のspanになる
+# - 相関IDはレスポンスヘッダーX-Correlation-IDでも返す
+#######################
+
+TRACED_ENDPOINTS = {'join_with_link', 'callback'}
+
+@app.before_request
+def start_trace():
+    if request.endpoint not in TRACED_ENDPOINTS:
+        return
+    # 参加ページの表示で新しいフローを開始し、callbackではセッションの相関IDを引き継ぐ
+    trace_id = new_trace_id() if request.endpoint == 'join_with_link' else session.get('trace_id')
+    g.trace_span = begin_span(request.endpoint, trace_id, **{
+        'http.method': request.method, 'http.route': request_route(),
+        'link_id': (request.view_args or {}).get('link_id') or session.get('link_id'),
+    })
+
+@app.after_request
+def add_correlation_id(response):
+    span = g.get('trace_span')
+    if span is not None:
+        span.set_attribute('http.status_code', response.status_code)
+        if response.status_code >= 500:
+            span.status = 'error'
+        response.headers['X-Correlation-ID'] = span.trace_id
+    return response
+
+@app.teardown_request
+def end_trace(error=None):
+    span = g.pop('trace_span', None)
+    if span is not None:
+        span.end(error)
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus形式のメトリクス（Authorization: Bearer <METRICS_TOKEN> が必要）"""
+    if not METRICS_TOKEN:
+        return "Not found", 404
+    if not is_authorized(request.headers.get('Authorization'), METRICS_TOKEN):
+        return Response("Unauthorized", status=401, headers={'WWW-Authenticate': 'Bearer'})
+    response = Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
 # Bot用グローバル変数
 
-def discord_api(method, url, **kwargs):
+async def discord_api(method, url, **kwargs):
     """外部API呼び出しの共通ヘルパー（タイムアウトとエラーハンドリング）"""
-    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
     try:
-        r = requests.request(method, url, **kwargs)
+        r = await DISCORD_HTTP.request(method, url, **kwargs)
         if r.ok:
             return r
         else:
@@ -55,13 +245,16 @@ def discord_api(method, url, **kwargs):
             except:
                 app.logger.error(f"Discord API HTTP {r.status_code} error: {r.text} url={url}")
             return None
-    except requests.RequestException as e:
-        app.logger.error(f"Discord API connection error: {e} url={url}")
+    except TRANSPORT_ERRORS as e:
+        app.logger.error(f"Discord API connection error: {e!r} url={url}")
         return None
 
 @app.before_request
 def rate_limit():
     """簡易レート制限（メモリベース）"""
+    if request.endpoint in RATE_LIMIT_EXEMPT_ENDPOINTS:
+        return
+    
     ip = request.remote_addr or 'unknown'
     now = time.time()
     q = ACCESS_LOG[ip]
@@ -73,11 +266,90 @@ def rate_limit():
     # レート制限チェック
     if len(q) >= MAX_REQUESTS:
         app.logger.warning(f"Rate limit exceeded ip={ip} path={request.path}")
+        RATE_LIMIT_REJECTIONS.inc(route=request_route())
         return "Too many requests", 429
     
     # 現在のアクセスを記録
     q.append(now)
 
+@app.after_request
+def compress_response(response):
+    """動的レスポンスをgzip/brotliで圧縮"""
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or not is_compressible(response.mimetype)):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if not encoding:
+        return response
+    
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return response
+    
+    compressed = compress_bytes(data, encoding)
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    record_compression(len(data), len(compressed))
+    return response
+
+def precompressed_response(body, status: int = 200, mimetype: str = 'text/html', cache_control: str = None):
+    """
+    事前圧縮済みボディからレスポンスを作成
+    
+    - 200の場合のみETagを付け、If-None-Matchが一致すれば304を返す
+    - エラーのステータスでは条件付きリクエストを無視する（RFC 9110 13.2.1）ため、本文とCache-Controlだけを返す
+    """
+    encoding, data = body.select(request.headers.get('Accept-Encoding'))
+    etag = body.etag(encoding) if status == 200 else None
+    
+    # If-None-Matchが一致すれば本文を返さない
+    if etag and request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = Response(data, status=status, mimetype=mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+            record_compression(len(body.identity), len(data))
+    
+    if etag:
+        response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    if cache_control:
+        response.headers['Cache-Control'] = cache_control
+    return response
+
+def prerendered_response(key, render, status: int = 200, cache_control: str = 'no-cache'):
+    """内容が固定のページを一度だけレンダリング・圧縮して返す"""
+    return precompressed_response(PRERENDERED_PAGES.get(key, render), status, 'text/html', cache_control)
+
+def invalid_link_response(status: int = 404, cache_control: str = INVALID_LINK_CACHE_CONTROL):
+    """無効な招待リンクのページを返す（原因は表示しない）"""
+    return prerendered_response(
+        ('error', INVALID_LINK_MESSAGE),
+        lambda: render_error_page(INVALID_LINK_MESSAGE)[0],
+        status, cache_control
+    )
+
+def server_error_response(status: int = 500):
+    """汎用エラーページを返す"""
+    return prerendered_response(
+        ('error', SERVER_ERROR_MESSAGE),
+        lambda: render_error_page(SERVER_ERROR_MESSAGE)[0],
+        status, 'no-store'
+    )
+
+@app.route('/static/<path:filename>')
+def static_files(filename):
+    """事前圧縮済みの静的ファイルを返す"""
+    asset = STATIC_ASSETS.get(filename)
+    if not asset:
+        return "Not found", 404
+    return precompressed_response(asset.body, 200, asset.mimetype, STATIC_CACHE_CONTROL)
+
 @bot.event
 async def on_ready():
     print(f'Bot ready: {bot.user}')
@@ -190,39 +462,54 @@ def join_with_link(link_id):
     invite_info = get_invite_link_full_info(link_id)
     
     if not invite_info:
-        return render_error_page("無効な招待リンクです。", 404)
+        return invalid_link_response(404)
     
-    guild_id = invite_info['guild_id']
-    role_id = invite_info['role_id']
-    max_uses = invite_info['max_uses']
-    current_uses = invite_info['current_uses']
-    expires_at_unix = invite_info['expires_at_unix']
+    # 有効期限・使用回数チェック
+    if not invite_info.is_usable:
+        return invalid_link_response(404)
     
-    # 有効期限チェック
-    if expires_at_unix:
-        now_unix = int(time.time())
-        if now_unix > expires_at_unix:
-            return render_error_page("無効な招待リンクです。", 404)
+    # Botがサーバーに参加していて、ロールが存在するかチェック
+    target = get_join_target(invite_info.guild_id, invite_info.role_id)
+    if not target:
+        return invalid_link_response(404)
     
-    # 使用回数チェック
-    if max_uses and current_uses >= max_uses:
-        return render_error_page("無効な招待リンクです。", 404)
+    # セッションにlink_idと相関IDを保存
+    session['link_id'] = link_id
+    session['trace_id'] = current_trace_id()
     
-    # Botがサーバーに参加しているかチェック
-    guild = bot.get_guild(guild_id)
-    if not guild:
-        return render_error_page("無効な招待リンクです。", 404)
+    # 参加ページを表示
+    return render_join_page(*target)
+
+def get_join_target(guild_id: int, role_id: int) -> tuple:
+    """
+    参加ページに表示するサーバー名・アイコンURL・ロール名を取得
     
-    # ロールが存在するかチェック
-    role = guild.get_role(role_id)
-    if not role:
-        return render_error_page("無効な招待リンクです。", 404)
+    - Botのキャッシュにあればそれを使う
+    - Gatewayに接続していない場合（DISCORD_GATEWAY_ENABLED=0、起動直後）は
+      TTLキャッシュ付きのプロバイダ経由でDiscord APIから取得する（Botが参加していないギルドは取得できない）
     
-    # セッションにlink_idを保存
-    session['link_id'] = link_id
+    Returns:
+        tuple: (サーバー名, アイコンURL, ロール名)（サーバーまたはロールが無い場合はNone）
+    """
+    guild = bot.get_guild(guild_id)
+    if guild:
+        role = guild.get_role(role_id)
+        if not role:
+            return None
+        return guild.name, guild.icon.url if guild.icon else None, role.name
     
-    # 参加ページを表示
-    return render_join_page(guild, role)
+    if DISCORD_GATEWAY_ENABLED and bot.is_ready():
+        return None
+    
+    try:
+        info = run_coroutine(GUILD_INFO.get(guild_id), timeout=GUILD_INFO_TIMEOUT)
+    except Exception as e:
+        app.logger.error(f"Error getting guild info for {guild_id}: {e!r}")
+        return None
+    if not info or role_id not in info['roles']:
+        return None
+    icon_url = f"https://cdn.discordapp.com/icons/{guild_id}/{info['icon']}.png" if info['icon'] else None
+    return info['name'], icon_url, info['roles'][role_id]
 
 
 
@@ -253,6 +540,8 @@ def bot_install_callback():
     error = request.args.get('error')
     if error:
         app.logger.warning(f"Bot installation failed/cancelled: {error}")
+        if error == 'access_denied':
+            return prerendered_response(('bot_install_error', error), lambda: render_bot_install_error_page(error))
         return render_bot_install_error_page(error)
     
     guild_id = request.args.get('guild_id')
@@ -260,11 +549,21 @@ def bot_install_callback():
     
     if not guild_id:
         app.logger.error("Bot installation callback missing guild_id")
-        return render_bot_install_error_page("missing_guild_id")
+        return prerendered_response(('bot_install_error', 'missing_guild_id'), lambda: render_bot_install_error_page("missing_guild_id"))
     
     app.logger.info(f"Bot installed to guild {guild_id} with permissions {permissions}")
     
-    return render_bot_install_success_page(guild_id, permissions)
+    # クエリのguild_idは誰でも指定できるため、Discord APIでの取得はしない
+    # Botのキャッシュに無ければ、認証コードの交換結果に含まれるギルド情報を使う
+    guild_info = get_cached_guild_info(parse_guild_id(guild_id))
+    code = request.args.get('code')
+    if not guild_info and code:
+        try:
+            guild_info = run_coroutine(verify_bot_install(code, guild_id), timeout=CALLBACK_TIMEOUT)
+        except Exception as e:
+            app.logger.error(f"Bot install verification failed for guild {guild_id}: {e!r}")
+    
+    return render_bot_install_success_page(guild_id, permissions, guild_info)
 
 @app.route('/callback')
 def callback():
@@ -273,125 +572,362 @@ def callback():
     expected_state = session.pop('oauth_state', None)
     if not state or state != expected_state:
         app.logger.warning(f"OAuth state mismatch from {request.remote_addr}")
-        return render_error_page("無効な招待リンクです。", 400)
+        return invalid_link_response(400, 'no-store')
     
     # link_idを使い捨てにして取得
     link_id = session.pop('link_id', None)
+    # 相関IDも使い捨て（このリクエストのspanは開始済み）
+    session.pop('trace_id', None)
     if not link_id:
         app.logger.warning(f"Invalid/expired link accessed from {request.remote_addr}")
-        return render_error_page("無効な招待リンクです。", 400)
+        return invalid_link_response(400, 'no-store')
     
     code = request.args.get('code')
     if not code:
         app.logger.warning(f"Authorization failed - no code from {request.remote_addr}")
-        return render_error_page("無効な招待リンクです。", 400)
+        return invalid_link_response(400, 'no-store')
     
-    # Get token
-    token_resp = discord_api('POST', 'https://discord.com/api/oauth2/token', data={
-        'client_id': DISCORD_CLIENT_ID,
-        'client_secret': DISCORD_CLIENT_SECRET,
-        'grant_type': 'authorization_code',
-        'code': code,
-        'redirect_uri': REDIRECT_URI
-    })
+    if not CALLBACK_SLOTS.acquire(blocking=False):
+        app.logger.warning(f"Too many concurrent callbacks, rejected {request.remote_addr}")
+        response = server_error_response(503)
+        response.headers['Retry-After'] = '5'
+        return response
+    
+    # Discord APIとDBへのアクセスはバックグラウンドループ上でまとめて実行
+    try:
+        result = run_coroutine(complete_join(link_id, code, request.remote_addr), timeout=CALLBACK_TIMEOUT)
+    except Exception as e:
+        app.logger.error(f"Join flow failed for {request.remote_addr}: {e!r}")
+        return server_error_response(500)
+    finally:
+        CALLBACK_SLOTS.release()
+    
+    if result['outcome'] == 'invalid':
+        return invalid_link_response(400, 'no-store')
+    if result['outcome'] == 'error':
+        return server_error_response(500)
+    if result['outcome'] == 'redeemed':
+        return render_success_page(result['username'], result['role_name'], is_returning=True)
+    
+    # 処理中ページへリダイレクト（リロードで認証コードが再送されないようにする）
+    return redirect(f"/join/result/{result['job_token']}")
+
+@traced()
+async def complete_join(link_id: str, code: str, remote_addr: str) -> dict:
+    """
+    OAuthコールバック後の参加処理（バックグラウンドループ上で実行）
+    
+    - トークン交換と招待リンクのDB取得は互いに独立しているため並行して行う
+    - 結果は {'outcome': 'queued' | 'redeemed' | 'invalid' | 'error', ...} の辞書で返す
+    """
+    # Get token と link_idからrole_idとその他の情報を取得 を並行実行
+    token_resp, invite_info = await asyncio.gather(
+        discord_api('POST', '/oauth2/token', data={
+            'client_id': DISCORD_CLIENT_ID,
+            'client_secret': DISCORD_CLIENT_SECRET,
+            'grant_type': 'authorization_code',
+            'code': code,
+            'redirect_uri': REDIRECT_URI
+        }),
+        run_blocking(get_invite_link_full_info, link_id)
+    )
+    
+    if not invite_info:
+        app.logger.warning(f"Invalid role link_id={link_id} from {remote_addr}")
+        return {'outcome': 'invalid'}
     
     if not token_resp:
-        app.logger.error(f"Token exchange failed for {request.remote_addr}")
-        return render_error_page("エラーが発生しました。時間をおいて再度お試しください。", 500)
+        app.logger.error(f"Token exchange failed for {remote_addr}")
+        return {'outcome': 'error'}
     
     token = token_resp.json()['access_token']
     
+    guild_id = invite_info.guild_id
+    role_id = invite_info.role_id
+    
     # Get user
-    user_resp = discord_api('GET', 'https://discord.com/api/v10/users/@me', 
-                           headers={'Authorization': f'Bearer {token}'})
+    user_resp = await discord_api('GET', '/users/@me',
+                                  headers={'Authorization': f'Bearer {token}'})
     
     if not user_resp:
-        app.logger.error(f"Failed to get user info for {request.remote_addr}")
-        return render_error_page("エラーが発生しました。時間をおいて再度お試しください。", 500)
+        app.logger.error(f"Failed to get user info for {remote_addr}")
+        return {'outcome': 'error'}
     
     user_data = user_resp.json()
     user_id = int(user_data['id'])
     username = user_data.get('username', 'Unknown')
     
-
-    # link_idからrole_idとその他の情報を取得
-    invite_info = get_invite_link_full_info(link_id)
-    if not invite_info:
-        app.logger.warning(f"Invalid role link_id={link_id} from {request.remote_addr}")
-        return render_error_page("無効な招待リンクです。", 400)
-    
-    guild_id = invite_info['guild_id']
-    role_id = invite_info['role_id']
-    max_uses = invite_info['max_uses']
-    current_uses = invite_info['current_uses']
-    expires_at_unix = invite_info['expires_at_unix']
+    # 既にこのリンクでロールを取得済みなら、Discordを呼ばずに成功ページを表示
+    # （二重クリックやリロードで上限に達したリンクでも同じ結果になるよう、上限チェックより先に確認）
+    if await run_blocking(has_redeemed_invite_link, link_id, user_id):
+        app.logger.info(f"Repeat redemption link_id={link_id} user_id={user_id} from {remote_addr}")
+        REDEMPTION_EVENTS.record(EVENT_REPEAT, link_id, guild_id, role_id, user_id)
+        return {'outcome': 'redeemed', 'username': username,
+                'role_name': get_role_name(guild_id, role_id)}
     
     # 使用回数が上限に達していないかチェック
-    if max_uses and current_uses >= max_uses:
-        app.logger.warning(f"Max uses exceeded for link_id={link_id} from {request.remote_addr}")
-        return render_error_page("無効な招待リンクです。", 400)
+    if invite_info.is_exhausted:
+        app.logger.warning(f"Max uses exceeded for link_id={link_id} from {remote_addr}")
+        return {'outcome': 'invalid'}
     
     # 有効期限が切れていないかチェック
-    if expires_at_unix:
-        now_unix = int(time.time())
-        if now_unix > expires_at_unix:
-            app.logger.warning(f"Link expired for link_id={link_id} from {request.remote_addr}")
-            return render_error_page("無効な招待リンクです。", 400)
-    
-    # ユーザーをサーバーに参加させる
-    join_resp = discord_api('PUT', f'https://discord.com/api/v10/guilds/{guild_id}/members/{user_id}',
-        headers={'Authorization': f'Bot {DISCORD_TOKEN}'},
-        json={'access_token': token, 'roles': [str(role_id)]}
-    )
+    if invite_info.is_expired:
+        app.logger.warning(f"Link expired for link_id={link_id} from {remote_addr}")
+        return {'outcome': 'invalid'}
     
-    if not join_resp:
-        app.logger.error(f"Guild join API failed for {request.remote_addr}")
-        return render_error_page("エラーが発生しました。時間をおいて再度お試しください。", 500)
-        
-    if join_resp.status_code in [201, 204]:
-        # Try adding role separately if needed
-        discord_api('PUT', f'https://discord.com/api/v10/guilds/{guild_id}/members/{user_id}/roles/{role_id}',
-            headers={'Authorization': f'Bot {DISCORD_TOKEN}'}
-        )
-        
-        # データベースのcurrent_usesに+1する
-        increment_invite_link_usage(link_id)
-        
-        # Get role name for display
-        guild = bot.get_guild(guild_id)
-        role_name = "指定されたロール"
-        if guild:
-            role = guild.get_role(role_id)
-            if role:
-                role_name = role.name
-        
-        return render_success_page(username, role_name, is_returning=False)
+    # サーバー参加とロール付与はジョブとして登録し、ワーカーで実行する
+    # （同じユーザーの未完了ジョブがあればそのジョブのトークンが返る）
+    job_token = await run_blocking(enqueue_role_assignment_job, secrets.token_urlsafe(24), link_id,
+                                   guild_id, role_id, user_id, username, token, JOB_MAX_ATTEMPTS,
+                                   trace_id=current_trace_id())
+    if not job_token:
+        app.logger.error(f"Failed to enqueue role assignment for {remote_addr}")
+        return {'outcome': 'error'}
+    
+    notify_job_workers()
+    return {'outcome': 'queued', 'job_token': job_token}
+
+
+#######################
+# サーバー参加・ロール付与ジョブ
+# - callbackで登録されたジョブをワーカーが取り出して実行する
+# - ジョブはDBに保存されるため、プロセスが落ちても失われない
+# - レート制限(429)・5xx・通信エラーは指数バックオフで再試行する
+# - それ以外の4xxは再試行しても成功しないため失敗として終了する
+# - Discordを呼ぶ前に使用回数を1つ予約し（current_usesに+1）、上限を超えて付与しないようにする
+#   - 成功したら予約を確定し、失敗・断念した場合は予約を取り消す
+# - OAuthアクセストークンはサーバー参加にだけ使い、参加したらすぐに削除する
+#   （保存中はJOB_TOKEN_KEYで暗号化し、JOB_TOKEN_TTLを過ぎたら参加前でも削除する）
+#######################
+
+class RetryableJobError(Exception):
+    """時間をおけば成功する可能性があるエラー"""
+    
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class PermanentJobError(Exception):
+    """再試行しても成功しないエラー"""
+
+JOB_WAKEUP = None
+
+def notify_job_workers():
+    """待機中のワーカーを起こす（バックグラウンドループ上から呼ぶ）"""
+    if JOB_WAKEUP:
+        JOB_WAKEUP.set()
+
+def job_retry_delay(attempts: int, retry_after: float = None) -> float:
+    """再試行までの秒数（Discordの指定があればそれを優先、無ければ指数バックオフ＋ジッター）"""
+    if retry_after:
+        return retry_after
+    delay = min(JOB_RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0)), JOB_RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.5, 1.0)
+
+async def call_discord_for_job(method: str, path: str, **kwargs):
+    """ジョブ用のDiscord API呼び出し（結果に応じて再試行/失敗の例外を送出）"""
+    try:
+        resp = await DISCORD_HTTP.request(method, path, **kwargs)
+    except TRANSPORT_ERRORS as e:
+        raise RetryableJobError(f"{method} {path} connection error: {e!r}")
+    
+    if resp.status_code == 429:
+        try:
+            retry_after = float((resp.json() or {}).get('retry_after'))
+        except (TypeError, ValueError):
+            retry_after = None
+        raise RetryableJobError(f"{method} {path} rate limited", retry_after)
+    if resp.status_code >= 500:
+        raise RetryableJobError(f"{method} {path} HTTP {resp.status_code}")
+    if not resp.ok:
+        raise PermanentJobError(f"{method} {path} HTTP {resp.status_code}: {resp.text[:200]}")
+    return resp
+
+async def process_role_assignment_job(job: dict) -> bool:
+    """
+    ユーザーをサーバーに参加させてロールを付与する
+    
+    Returns:
+        bool: 既にサーバーに参加していたユーザーの場合True
+    """
+    link_id = job['link_id']
+    guild_id = job['guild_id']
+    role_id = job['role_id']
+    user_id = job['user_id']
+    
+    # 別のジョブで既に付与済みならDiscordは呼ばない
+    if await run_blocking(has_redeemed_invite_link, link_id, user_id):
+        return True
+    
+    # 待機中にリンクが削除・失効していないか再確認
+    invite_info = await run_blocking(get_invite_link_full_info, link_id)
+    if not invite_info:
+        raise PermanentJobError(f"Invite link no longer exists: link_id={link_id}")
+    if invite_info.is_expired:
+        raise PermanentJobError(f"Link expired: link_id={link_id}")
+    
+    # 使用回数を予約する（再試行の場合は前回の予約をそのまま使う）
+    reservation = await run_blocking(reserve_invite_link_use, link_id, user_id, guild_id, role_id)
+    if reservation is None:
+        raise RetryableJobError(f"Failed to reserve invite link use: link_id={link_id}")
+    if reservation == 'not_found':
+        raise PermanentJobError(f"Invite link no longer exists: link_id={link_id}")
+    if reservation == 'exhausted':
+        raise PermanentJobError(f"Max uses exceeded: link_id={link_id}")
+    
+    bot_headers = {'Authorization': f'Bot {DISCORD_TOKEN}'}
+    role_path = f'/guilds/{guild_id}/members/{user_id}/roles/{role_id}'
+    
+    if job['is_returning'] is not None:
+        # 前回の試行でサーバー参加まで済んでいる（アクセストークンは削除済み）ので、ロール付与だけ行う
+        is_returning = job['is_returning']
+        try:
+            await call_discord_for_job('PUT', role_path, headers=bot_headers)
+        except PermanentJobError as e:
+            if is_returning:
+                raise
+            app.logger.warning(f"Separate role assignment failed after join: {e}")
+    else:
+        if not job['access_token']:
+            raise PermanentJobError(f"Access token expired before joining: job_id={job['id']}")
         
-    elif join_resp.status_code == 200:
-        # User already in server, just add role
-        role_resp = discord_api('PUT', f'https://discord.com/api/v10/guilds/{guild_id}/members/{user_id}/roles/{role_id}',
-            headers={'Authorization': f'Bot {DISCORD_TOKEN}'}
+        # ユーザーをサーバーに参加させる
+        join_resp = await call_discord_for_job('PUT', f'/guilds/{guild_id}/members/{user_id}',
+            headers=bot_headers,
+            json={'access_token': job['access_token'], 'roles': [str(role_id)]}
         )
+        if join_resp.status_code not in [200, 201, 204]:
+            raise PermanentJobError(f"Unexpected join response status: {join_resp.status_code}")
         
-        if role_resp and role_resp.status_code == 204:
-            # データベースのcurrent_usesに+1する
-            increment_invite_link_usage(link_id)
-            
-            # Get role name for display
-            guild = bot.get_guild(guild_id)
-            role_name = "指定されたロール"
-            if guild:
-                role = guild.get_role(role_id)
-                if role:
-                    role_name = role.name
-            
-            return render_success_page(username, role_name, is_returning=True)
+        # 参加後はアクセストークンが不要になるため、ロール付与の前に削除する
+        is_returning = join_resp.status_code == 200
+        await run_blocking(mark_role_assignment_job_joined, job['id'], is_returning)
         
-        app.logger.error(f"Role assignment failed for {request.remote_addr}")
-        return render_error_page("エラーが発生しました。時間をおいて再度お試しください。", 500)
+        if not is_returning:
+            # 参加時にロールも指定しているため、個別の付与が失敗しても成功扱い
+            try:
+                await call_discord_for_job('PUT', role_path, headers=bot_headers)
+            except PermanentJobError as e:
+                app.logger.warning(f"Separate role assignment failed after join: {e}")
+        else:
+            # User already in server, just add role
+            await call_discord_for_job('PUT', role_path, headers=bot_headers)
+    
+    # 予約を確定する（初回の確定の場合のみイベントを記録）
+    if await run_blocking(confirm_invite_link_redemption, link_id, user_id):
+        REDEMPTION_EVENTS.record(EVENT_ROLE_ADDED if is_returning else EVENT_JOINED,
+                                 link_id, guild_id, role_id, user_id)
+    return is_returning
+
+async def give_up_role_assignment_job(job: dict, error: str):
+    """ジョブを失敗として終了し、使用回数の予約を取り消す"""
+    await run_blocking(fail_role_assignment_job, job['id'], error)
+    await run_blocking(release_invite_link_use, job['link_id'], job['user_id'])
+
+async def handle_role_assignment_job(job: dict):
+    """ジョブを実行して結果をDBに記録"""
+    if job['attempts'] > job['max_attempts']:
+        await give_up_role_assignment_job(job, job['last_error'] or "Max attempts exceeded")
+        return
+    
+    try:
+        is_returning = await process_role_assignment_job(job)
+    except PermanentJobError as e:
+        app.logger.error(f"Role assignment job {job['id']} failed: {e}")
+        await give_up_role_assignment_job(job, str(e))
+        return
+    except Exception as e:
+        # RetryableJobError以外の予期しない例外も再試行の対象とする
+        retry_after = getattr(e, 'retry_after', None)
+        if job['attempts'] >= job['max_attempts']:
+            app.logger.error(f"Role assignment job {job['id']} gave up after {job['attempts']} attempts: {e!r}")
+            await give_up_role_assignment_job(job, str(e))
+            return
+        delay = job_retry_delay(job['attempts'], retry_after)
+        app.logger.warning(f"Role assignment job {job['id']} will retry in {delay:.1f}s: {e!r}")
+        await run_blocking(retry_role_assignment_job, job['id'], math.ceil(time.time() + delay), str(e))
+        return
+    
+    await run_blocking(complete_role_assignment_job, job['id'], is_returning)
+
+async def role_assignment_worker(worker_id: int):
+    """ジョブを取り出して実行し続けるワーカー"""
+    while True:
+        try:
+            jobs = await run_blocking(claim_role_assignment_jobs, 1, JOB_LEASE_SECONDS, JOB_TOKEN_TTL)
+            if not jobs:
+                # 新しいジョブの通知か、ポーリング間隔の経過まで待つ
+                try:
+                    await asyncio.wait_for(JOB_WAKEUP.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                JOB_WAKEUP.clear()
+                continue
+            
+            for job in jobs:
+                # 参加フローの相関IDを引き継いでジョブの処理をトレースする
+                with start_span('role_assignment_job', job.get('trace_id'),
+                                **{'job.id': job['id'], 'job.attempt': job['attempts']}):
+                    await handle_role_assignment_job(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            app.logger.error(f"Role assignment worker {worker_id} error: {e!r}")
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+async def start_job_workers():
+    """バックグラウンドループ上でワーカーを起動"""
+    global JOB_WAKEUP
+    JOB_WAKEUP = asyncio.Event()
+    for worker_id in range(JOB_WORKER_CONCURRENCY):
+        asyncio.ensure_future(role_assignment_worker(worker_id))
+    app.logger.info(f"Started {JOB_WORKER_CONCURRENCY} role assignment workers")
+
+
+#######################
+# 参加処理の状態確認
+# - /join/result/<job_token>: 処理中ページ、または完了後の結果ページを表示
+# - /join/status/<job_token>: 処理中ページがポーリングするJSON
+#######################
+
+@app.route('/join/result/<job_token>')
+def join_result(job_token):
+    """ロール付与ジョブの結果ページ"""
+    job = get_role_assignment_job(job_token)
+    if not job:
+        return invalid_link_response(404, 'no-store')
+    
+    if job['status'] == 'succeeded':
+        return render_success_page(job['username'], get_role_name(job['guild_id'], job['role_id']),
+                                   is_returning=bool(job['is_returning']))
+    if job['status'] == 'failed':
+        return server_error_response(500)
     
-    app.logger.error(f"Unexpected join response status for {request.remote_addr}: {join_resp.status_code}")
-    return render_error_page("エラーが発生しました。時間をおいて再度お試しください。", 500)
+    response = Response(render_processing_page(job_token), mimetype='text/html')
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/join/status/<job_token>')
+def join_status(job_token):
+    """ロール付与ジョブの状態をJSONで返す"""
+    job = get_role_assignment_job(job_token)
+    response = jsonify({'status': job['status'] if job else 'not_found'})
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def get_role_name(guild_id: int, role_id: int) -> str:
+    """表示用のロール名を取得"""
+    guild = bot.get_guild(guild_id)
+    if guild:
+        role = guild.get_role(role_id)
+        if role:
+            return role.name
+    else:
+        # Gatewayに接続していない場合は参加ページの表示時に取得したギルド情報を使う
+        info = GUILD_INFO.peek(guild_id)
+        if info and info['roles'].get(role_id):
+            return info['roles'][role_id]
+    return "指定されたロール"
 
 def render_error_page(message: str, status: int = 500):
     """エラーページをレンダリング"""
@@ -641,11 +1177,8 @@ def render_error_page(message: str, status: int = 500):
     ''', status
 
 
-def render_join_page(guild, role):
+def render_join_page(guild_name, guild_icon_url, role_name):
     """参加ページをレンダリング"""
-    # サーバーアイコンのURL取得
-    guild_icon_url = guild.icon.url if guild.icon else None
-    
     # OAuth認証URL生成
     state = secrets.token_urlsafe(16)
     session['oauth_state'] = state
@@ -912,14 +1445,14 @@ def render_join_page(guild, role):
             
             <!-- Server Information -->
             <div class="server-info">
-                {f'<img src="{guild_icon_url}" alt="Server Icon" class="server-icon">' if guild_icon_url else f'<div class="server-icon-fallback">{guild.name[0] if guild.name else "?"}</div>'}
-                <div class="server-name">{guild.name}</div>
+                {f'<img src="{guild_icon_url}" alt="Server Icon" class="server-icon">' if guild_icon_url else f'<div class="server-icon-fallback">{guild_name[0] if guild_name else "?"}</div>'}
+                <div class="server-name">{guild_name}</div>
             </div>
             
             <!-- Role Information -->
             <div class="role-info">
                 <div class="role-label">参加時に自動で獲得できるロール</div>
-                <div class="role-name">🏷️ {role.name}</div>
+                <div class="role-name">🏷️ {role_name}</div>
             </div>
             
             <!-- Join Button -->
@@ -1105,46 +1638,49 @@ def render_bot_install_error_page(error_type):
     </html>
     '''
 
-def render_bot_install_success_page(guild_id, permissions):
-    """Bot招待成功ページをレンダリング"""
-    # Discord APIを直接呼び出してサーバー情報を取得
-    try:
-        import aiohttp
-        import asyncio
-        
-        bot_token = os.getenv('DISCORD_TOKEN')
-        app.logger.info(f"Trying to get guild: {guild_id}")
-        
-        async def fetch_guild_info():
-            headers = {'Authorization': f'Bot {bot_token}'}
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f'https://discord.com/api/v10/guilds/{guild_id}', headers=headers) as resp:
-                    if resp.status == 200:
-                        return await resp.json()
-                    else:
-                        app.logger.error(f"Discord API error: {resp.status}")
-                        return None
-        
-        # 非同期関数を実行
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        guild_data = loop.run_until_complete(fetch_guild_info())
-        loop.close()
-        
-        if guild_data:
-            guild_name = guild_data.get('name', 'サーバー')
-            icon_hash = guild_data.get('icon')
-            guild_icon_url = f"https://cdn.discordapp.com/icons/{guild_id}/{icon_hash}.png" if icon_hash else None
-            app.logger.info(f"Guild info - Name: {guild_name}, Icon: {guild_icon_url}")
-        else:
-            guild_name = "サーバー"
-            guild_icon_url = None
-            app.logger.warning(f"Could not get guild info for guild_id: {guild_id}")
-            
-    except Exception as e:
-        app.logger.error(f"Error getting guild info: {e}")
+def get_cached_guild_info(guild_id: int) -> dict:
+    """ギルド情報（名前・アイコン）をBotのキャッシュから取得（Discord APIは呼ばない）"""
+    if not guild_id:
+        return None
+    
+    guild = bot.get_guild(guild_id)
+    if guild:
+        return {'id': guild.id, 'name': guild.name, 'icon': guild.icon.key if guild.icon else None}
+    return None
+
+async def verify_bot_install(code: str, guild_id: str) -> dict:
+    """
+    Bot導入完了時の認証コードを交換し、導入先のギルド情報を取得
+    
+    - botスコープの認証ではトークンの応答に導入先のギルド（id, name, icon）が含まれる
+    - クエリのguild_idと一致した場合のみ返す（一致しない・交換に失敗した場合はNone）
+    """
+    token_resp = await discord_api('POST', '/oauth2/token', data={
+        'client_id': DISCORD_CLIENT_ID,
+        'client_secret': DISCORD_CLIENT_SECRET,
+        'grant_type': 'authorization_code',
+        'code': code,
+        'redirect_uri': BOT_INSTALL_REDIRECT_URI
+    })
+    if not token_resp:
+        return None
+    
+    guild = token_resp.json().get('guild') or {}
+    if str(guild.get('id')) != str(guild_id):
+        app.logger.warning(f"Bot install guild mismatch: query={guild_id} token={guild.get('id')}")
+        return None
+    return guild
+
+def render_bot_install_success_page(guild_id, permissions, guild_info=None):
+    """Bot招待成功ページをレンダリング（guild_infoはキャッシュまたは認証コードで確認済みのもの）"""
+    if guild_info:
+        guild_name = guild_info.get('name') or 'サーバー'
+        icon_hash = guild_info.get('icon')
+        guild_icon_url = f"https://cdn.discordapp.com/icons/{guild_id}/{icon_hash}.png" if icon_hash else None
+    else:
         guild_name = "サーバー"
         guild_icon_url = None
+        app.logger.warning(f"Could not get guild info for guild_id: {guild_id}")
     
     return f'''
     <!DOCTYPE html>
@@ -1682,6 +2218,169 @@ def render_bot_install_success_page(guild_id, permissions):
     </html>
     '''
 
+def render_processing_page(job_token: str):
+    """参加処理中ページをレンダリング（完了するまでステータスをポーリング）"""
+    return f'''
+    <!DOCTYPE html>
+    <html lang="ja">
+    <head>
+        <meta charset="UTF-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        <title>処理中 - Discord Invitation & Role Bot</title>
+        <meta name="description" content="Discordサーバーへの参加とロール付与を処理しています">
+        <link rel="preconnect" href="https://fonts.googleapis.com">
+        <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
+        <link href="https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap" rel="stylesheet">
+        <style>
+            :root {{
+                --primary-pink: #e91e63;
+                --primary-pink-light: #f48fb1;
+                --primary-orange: #ff6b35;
+                --primary-orange-light: #ff9068;
+                --warm-50: #fefbf3;
+                --gray-50: #f9fafb;
+                --gray-200: #e5e7eb;
+                --gray-600: #4b5563;
+                --gray-700: #374151;
+                --gray-900: #111827;
+                --white: #ffffff;
+                --space-3: 0.75rem;
+                --space-4: 1rem;
+                --space-6: 1.5rem;
+                --space-8: 2rem;
+                --space-12: 3rem;
+                --radius-lg: 0.5rem;
+                --radius-xl: 0.75rem;
+                --shadow-md: 0 4px 6px -1px rgba(0, 0, 0, 0.1), 0 2px 4px -1px rgba(0, 0, 0, 0.06);
+                --shadow-xl: 0 20px 25px -5px rgba(0, 0, 0, 0.1), 0 10px 10px -5px rgba(0, 0, 0, 0.04);
+                --font-weight-medium: 500;
+                --font-weight-semibold: 600;
+            }}
+            
+            * {{
+                box-sizing: border-box;
+                margin: 0;
+                padding: 0;
+            }}
+            
+            body {{
+                font-family: 'Inter', -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
+                line-height: 1.6;
+                color: var(--gray-900);
+                background: linear-gradient(135deg, var(--primary-pink-light) 0%, var(--primary-orange-light) 50%, var(--warm-50) 100%);
+                min-height: 100vh;
+                display: flex;
+                align-items: center;
+                justify-content: center;
+                padding: var(--space-4);
+            }}
+            
+            .container {{
+                background: var(--white);
+                border-radius: var(--radius-xl);
+                padding: var(--space-12);
+                box-shadow: var(--shadow-xl);
+                max-width: 500px;
+                width: 100%;
+                text-align: center;
+                border: 1px solid var(--gray-200);
+            }}
+            
+            .spinner {{
+                width: 64px;
+                height: 64px;
+                margin: 0 auto var(--space-6) auto;
+                border: 6px solid var(--gray-200);
+                border-top-color: var(--primary-pink);
+                border-radius: 50%;
+                animation: spin 1s linear infinite;
+            }}
+            
+            @keyframes spin {{
+                to {{ transform: rotate(360deg); }}
+            }}
+            
+            .page-title {{
+                font-size: 1.75rem;
+                font-weight: var(--font-weight-semibold);
+                margin-bottom: var(--space-4);
+                background: linear-gradient(135deg, var(--primary-pink) 0%, var(--primary-orange) 100%);
+                -webkit-background-clip: text;
+                -webkit-text-fill-color: transparent;
+                background-clip: text;
+            }}
+            
+            .processing-message {{
+                color: var(--gray-700);
+                margin-bottom: var(--space-8);
+            }}
+            
+            .bot-branding {{
+                display: flex;
+                align-items: center;
+                justify-content: center;
+                gap: var(--space-3);
+                padding: var(--space-4);
+                background: linear-gradient(135deg, var(--gray-50) 0%, var(--warm-50) 100%);
+                border-radius: var(--radius-lg);
+                border: 1px solid var(--gray-200);
+            }}
+            
+            .bot-icon {{
+                width: 32px;
+                height: 32px;
+                border-radius: 50%;
+                box-shadow: var(--shadow-md);
+            }}
+            
+            .bot-text {{
+                font-size: 0.875rem;
+                color: var(--gray-600);
+                font-weight: var(--font-weight-medium);
+            }}
+        </style>
+        <script>
+            // 処理が完了するまでステータスを確認し、完了したら結果ページを表示
+            (function() {{
+                var delay = 1000;
+                function poll() {{
+                    fetch('/join/status/{job_token}', {{ cache: 'no-store' }})
+                        .then(function(resp) {{ return resp.json(); }})
+                        .then(function(data) {{
+                            if (data.status === 'succeeded' || data.status === 'failed' || data.status === 'not_found') {{
+                                window.location.replace('/join/result/{job_token}');
+                                return;
+                            }}
+                            delay = Math.min(delay * 1.5, 5000);
+                            setTimeout(poll, delay);
+                        }})
+                        .catch(function() {{
+                            setTimeout(poll, 5000);
+                        }});
+                }}
+                setTimeout(poll, delay);
+            }})();
+        </script>
+    </head>
+    <body>
+        <div class="container">
+            <div class="spinner"></div>
+            <h1 class="page-title">処理しています…</h1>
+            <p class="processing-message">
+                サーバーへの参加とロールの付与を行っています。<br>
+                このままページを開いてお待ちください。
+            </p>
+            
+            <!-- Bot Branding -->
+            <div class="bot-branding">
+                <img src="/static/bot-icon.jpeg" alt="Discord Invitation & Role Bot" class="bot-icon">
+                <span class="bot-text">Discord Invitation & Role Bot</span>
+            </div>
+        </div>
+    </body>
+    </html>
+    '''
+
 def render_success_page(username, role_name, is_returning=False):
     """成功ページをレンダリング"""
     action_text = "サーバーに参加して" if not is_returning else "ロールを獲得しました"
@@ -1994,8 +2693,32 @@ def render_success_page(username, role_name, is_returning=False):
 
 
 def start_bot():
-    asyncio.run(bot.start(DISCORD_TOKEN))
+    """バックグラウンドのイベントループ上でBotを起動"""
+    start_background_loop()
+    if not DISCORD_GATEWAY_ENABLED:
+        app.logger.warning("DISCORD_GATEWAY_ENABLED=0: Discord Gatewayに接続せずに起動します")
+        return
+    future = submit(bot.start(DISCORD_TOKEN))
+    
+    def log_bot_exit(f):
+        if not f.cancelled() and f.exception():
+            app.logger.error(f"Bot stopped: {f.exception()!r}")
+    
+    future.add_done_callback(log_bot_exit)
 
 if __name__ == "__main__":
-    threading.Thread(target=start_bot, daemon=True).start()
-    app.run(host='0.0.0.0', port=int(os.getenv('PORT', 5000)))
\ No newline at end of file
+    # ジョブキューのテーブルを初期化
+    try:
+        init_web_tables()
+    except Exception as e:
+        print(f"データベース初期化エラー: {e}")
+        exit(1)
+    
+    # SIGTERMでも終了処理（イベントログの書き込みなど）が走るようにする
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    
+    REDEMPTION_EVENTS.start()
+    start_bot()
+    submit(start_job_workers())
+    # 1リクエスト1スレッド（待機中のコールバックの数はCALLBACK_MAX_CONCURRENCYで制限する）
+    app.run(host='0.0.0.0', port=int(os.getenv('PORT', 5000)), threaded=True)
\ No newline at end of file
@@ -0,0 +1,172 @@
+"""
+負荷試験用の偽のDiscord APIサーバー
+
+- 参加フローで呼ばれるエンドポイントだけを実装する
+  - POST /oauth2/token                          : 認証コードをそのままアクセストークンに埋め込んで返す
+  - GET  /users/@me                             : アクセストークンからユーザーIDを復元して返す
+  - PUT  /guilds/{guild_id}/members/{user_id}   : 初回は201、参加済みなら204
+  - PUT  /guilds/{guild_id}/members/{user_id}/roles/{role_id} : 204
+  - GET  /guilds/{guild_id}                     : 名前とロール一覧（DISCORD_GATEWAY_ENABLED=0 の参加ページ用）
+- 応答の遅延（latency ± jitter秒）と、一定の割合での429・5xxを注入できる
+  （GET /guilds はアプリ側でキャッシュされるため注入の対象外）
+- 認証コードはユーザーIDの数字の文字列とする（load_test.pyが発行する）
+
+単体で起動する場合:
+    cd get_role
+    python benchmarks/fake_discord.py --port 8765 --latency 0.05 --rate-limit-ratio 0.05
+"""
+import argparse
+import asyncio
+import random
+from collections import Counter
+from aiohttp import web
+
+TOKEN_PREFIX = 'fake-'
+
+
+class FakeDiscordServer:
+    """
+    偽のDiscord APIサーバー
+
+    Args:
+        guilds: {ギルドID: {'name': サーバー名, 'roles': {ロールID: ロール名}}}
+        latency: 応答までの平均秒数
+        jitter: latencyからのずれの最大秒数（一様分布）
+        rate_limit_ratio: 429を返す割合
+        error_ratio: 502を返す割合
+        retry_after: 429で返すretry_after（秒）
+    """
+
+    def __init__(self, guilds: dict, host: str = '127.0.0.1', port: int = 0, latency: float = 0.05,
+                 jitter: float = 0.02, rate_limit_ratio: float = 0.0, error_ratio: float = 0.0,
+                 retry_after: float = 0.5):
+        self.guilds = guilds
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_ratio = rate_limit_ratio
+        self.error_ratio = error_ratio
+        self.retry_after = retry_after
+        self.requests = Counter()
+        self._members = set()
+        self._runner = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> str:
+        """サーバーを起動してAPIのベースURLを返す（port=0の場合は空いているポートを使う）"""
+        app = web.Application(middlewares=[self._inject_faults])
+        app.router.add_post('/oauth2/token', self.handle_token)
+        app.router.add_get('/users/@me', self.handle_me)
+        app.router.add_get('/guilds/{guild_id}', self.handle_guild)
+        app.router.add_put('/guilds/{guild_id}/members/{user_id}', self.handle_add_member)
+        app.router.add_put('/guilds/{guild_id}/members/{user_id}/roles/{role_id}', self.handle_add_role)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.port = self._runner.addresses[0][1]
+        return self.base_url
+
+    async def close(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    @web.middleware
+    async def _inject_faults(self, request: web.Request, handler):
+        route = request.match_info.route.resource.canonical if request.match_info.route.resource else 'unmatched'
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        status = None
+        if not (request.method == 'GET' and route == '/guilds/{guild_id}'):
+            roll = random.random()
+            if roll < self.rate_limit_ratio:
+                status = 429
+            elif roll < self.rate_limit_ratio + self.error_ratio:
+                status = 502
+
+        if status == 429:
+            response = web.json_response({'message': 'You are being rate limited.', 'retry_after': self.retry_after,
+                                          'global': False}, status=429)
+        elif status == 502:
+            response = web.json_response({'message': 'Bad Gateway'}, status=502)
+        else:
+            response = await handler(request)
+        self.requests[(request.method, route, response.status)] += 1
+        return response
+
+    async def handle_token(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        code = form.get('code', '')
+        if not code.isdigit():
+            return web.json_response({'error': 'invalid_grant'}, status=400)
+        return web.json_response({'access_token': f"{TOKEN_PREFIX}{code}", 'token_type': 'Bearer',
+                                  'expires_in': 604800, 'scope': 'identify guilds.join'})
+
+    async def handle_me(self, request: web.Request) -> web.Response:
+        token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not token.startswith(TOKEN_PREFIX):
+            return web.json_response({'message': '401: Unauthorized'}, status=401)
+        user_id = token[len(TOKEN_PREFIX):]
+        return web.json_response({'id': user_id, 'username': f"user{user_id[-6:]}"})
+
+    async def handle_guild(self, request: web.Request) -> web.Response:
+        guild_id = int(request.match_info['guild_id'])
+        guild = self.guilds.get(guild_id)
+        if guild is None:
+            return web.json_response({'message': 'Unknown Guild'}, status=404)
+        roles = [{'id': str(role_id), 'name': name} for role_id, name in guild['roles'].items()]
+        return web.json_response({'id': str(guild_id), 'name': guild['name'], 'icon': None, 'roles': roles})
+
+    async def handle_add_member(self, request: web.Request) -> web.Response:
+        guild_id = int(request.match_info['guild_id'])
+        if guild_id not in self.guilds:
+            return web.json_response({'message': 'Unknown Guild'}, status=404)
+        key = (guild_id, int(request.match_info['user_id']))
+        if key in self._members:
+            return web.Response(status=204)
+        self._members.add(key)
+        return web.json_response({'user': {'id': request.match_info['user_id']}}, status=201)
+
+    async def handle_add_role(self, request: web.Request) -> web.Response:
+        guild = self.guilds.get(int(request.match_info['guild_id']))
+        if guild is None or int(request.match_info['role_id']) not in guild['roles']:
+            return web.json_response({'message': 'Unknown Role'}, status=404)
+        return web.Response(status=204)
+
+
+async def serve_forever(args):
+    server = FakeDiscordServer(
+        {args.guild_id: {'name': 'Load Test Server', 'roles': {args.role_id: 'Load Test Role'}}},
+        port=args.port, latency=args.latency, jitter=args.jitter,
+        rate_limit_ratio=args.rate_limit_ratio, error_ratio=args.error_ratio, retry_after=args.retry_after,
+    )
+    print(f"偽のDiscord APIサーバーを起動しました: {await server.start()}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--guild-id', type=int, default=100000000000000001)
+    parser.add_argument('--role-id', type=int, default=100000000000000002)
+    parser.add_argument('--latency', type=float, default=0.05, help='応答までの平均秒数')
+    parser.add_argument('--jitter', type=float, default=0.02, help='遅延のばらつき（秒）')
+    parser.add_argument('--rate-limit-ratio', type=float, default=0.0, help='429を返す割合')
+    parser.add_argument('--error-ratio', type=float, default=0.0, help='502を返す割合')
+    parser.add_argument('--retry-after', type=float, default=0.5, help='429で返すretry_after（秒）')
+    try:
+        asyncio.run(serve_forever(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,362 @@
+"""
+参加フロー（/join → /callback → ロール付与ジョブ）の負荷試験
+
+- 偽のDiscord APIサーバー（benchmarks/fake_discord.py）を起動し、DISCORD_API_BASEをそこに向けて
+  app.py を別プロセスで起動する（DISCORD_GATEWAY_ENABLED=0、レート制限は無効化）
+- DBはDATABASE_URLを使う。未設定の場合はPATH（またはPG_BIN）のinitdb/pg_ctlで一時的なPostgreSQLを起動する
+- 負荷試験用の招待リンクを1件作成し、N人の仮想ユーザーを指定した同時実行数で参加させる
+  1. GET /join/<link_id>（参加ページからOAuthのstateを取り出す）
+  2. GET /callback?state=...&code=<ユーザーID>（処理中ページへのリダイレクト）
+  3. GET /join/status/<job_token> をsucceeded/failedになるまでポーリング
+- 各段階と全体のp50/p95/p99、1秒あたりの参加完了数、失敗の内訳、偽のDiscord APIが受けた呼び出しを表示する
+- 終了時に作成した招待リンク・ジョブ・利用履歴を削除する（--keep-dataで残す）
+
+使い方:
+    cd get_role
+    DATABASE_URL=postgresql://... python benchmarks/load_test.py --users 500 --concurrency 50
+    python benchmarks/load_test.py --latency 0.1 --rate-limit-ratio 0.05 --error-ratio 0.01 --json result.json
+
+ジョブの設定（JOB_WORKER_CONCURRENCY、JOB_RETRY_BASE_SECONDSなど）は環境変数でそのままapp.pyに渡る。
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import secrets
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+import aiohttp
+
+GET_ROLE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, GET_ROLE_DIR)
+
+from benchmarks.fake_discord import FakeDiscordServer
+
+GUILD_ID = 100000000000000001
+ROLE_ID = 100000000000000002
+# 仮想ユーザーのID（実在のユーザーIDと重ならないよう大きな値から振る）
+USER_ID_BASE = 900000000000000000
+
+STATE_PATTERN = re.compile(r'state=([A-Za-z0-9_\-]+)')
+PHASES = ('join_page', 'callback', 'role_assignment', 'total')
+
+
+#######################
+# 一時的なPostgreSQL
+#######################
+
+def start_local_postgres() -> tuple:
+    """
+    initdb/pg_ctlで一時ディレクトリにPostgreSQLを起動
+
+    Returns:
+        tuple: (DATABASE_URL, 停止する関数)
+    """
+    bin_dir = os.getenv('PG_BIN')
+    initdb = os.path.join(bin_dir, 'initdb') if bin_dir else shutil.which('initdb')
+    pg_ctl = os.path.join(bin_dir, 'pg_ctl') if bin_dir else shutil.which('pg_ctl')
+    if not initdb or not pg_ctl or not os.path.exists(initdb):
+        raise RuntimeError("DATABASE_URLが未設定で、initdb/pg_ctlも見つかりません（PG_BINで指定できます）")
+
+    data_dir = tempfile.mkdtemp(prefix='loadtest-pg-')
+    subprocess.run([initdb, '-D', data_dir, '-U', 'postgres', '--auth=trust'], check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    subprocess.run([pg_ctl, '-D', data_dir, '-w', '-l', os.path.join(data_dir, 'server.log'),
+                    '-o', f"-c listen_addresses='' -k {data_dir} -c max_connections=200", 'start'],
+                   check=True, stdout=subprocess.DEVNULL)
+
+    def stop():
+        subprocess.run([pg_ctl, '-D', data_dir, '-m', 'fast', 'stop'], stdout=subprocess.DEVNULL)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    return f"postgresql://postgres@/postgres?host={data_dir}", stop
+
+
+#######################
+# 負荷試験用のデータ
+#######################
+
+def prepare_database() -> str:
+    """テーブルを初期化して負荷試験用の招待リンクを作成し、link_idを返す"""
+    from shared.database import init_database, init_web_tables, get_db_cursor
+    from shared.link_id import generate_link_id
+
+    init_database()
+    init_web_tables()
+    link_id = generate_link_id()
+    now = int(time.time())
+    with get_db_cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO role_invite_links (guild_id, role_id, link_id, created_by_user_id, max_uses,
+                                           created_at, created_at_unix)
+            VALUES (%s, %s, %s, %s, NULL, %s, %s)
+        """, (GUILD_ID, ROLE_ID, link_id, USER_ID_BASE, 'load test', now))
+    return link_id
+
+
+def cleanup_database(link_id: str):
+    """負荷試験で作成した行を削除"""
+    from shared.database import get_db_cursor
+
+    with get_db_cursor() as cursor:
+        for table in ('role_assignment_jobs', 'role_invite_redemptions', 'role_invite_redemption_events',
+                      'role_invite_link_usage_rollups'):
+            cursor.execute(f"DELETE FROM {table} WHERE link_id = %s", (link_id,))
+        cursor.execute("DELETE FROM role_invite_links WHERE link_id = %s", (link_id,))
+
+
+#######################
+# 偽のDiscord APIサーバー（負荷をかける側と干渉しないよう別スレッドのループで動かす）
+#######################
+
+class FakeDiscordThread:
+    def __init__(self, server: FakeDiscordServer):
+        self.server = server
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name='fake-discord', daemon=True)
+
+    def start(self) -> str:
+        self._thread.start()
+        return asyncio.run_coroutine_threadsafe(self.server.start(), self.loop).result(10)
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.server.close(), self.loop).result(10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+#######################
+# app.py
+#######################
+
+def start_app(port: int, discord_api_base: str, database_url: str, log_path: str) -> subprocess.Popen:
+    env = dict(os.environ,
+               PORT=str(port),
+               DATABASE_URL=database_url,
+               DISCORD_API_BASE=discord_api_base,
+               DISCORD_GATEWAY_ENABLED='0',
+               DISCORD_TOKEN='fake-bot-token',
+               DISCORD_CLIENT_ID='1',
+               DISCORD_CLIENT_SECRET='fake-client-secret',
+               SECRET_KEY=secrets.token_hex(32),
+               REDIRECT_URI=f"http://127.0.0.1:{port}/callback",
+               RATE_LIMIT_MAX_REQUESTS=str(10 ** 9))
+    log = open(log_path, 'w')
+    return subprocess.Popen([sys.executable, 'app.py'], cwd=GET_ROLE_DIR, env=env,
+                            stdout=log, stderr=subprocess.STDOUT)
+
+
+async def wait_for_app(base_url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"app.pyが終了しました（終了コード {process.returncode}）")
+            try:
+                # / は公式サイトへのリダイレクトなので、応答があれば起動済みとみなす
+                async with session.get(f"{base_url}/", allow_redirects=False) as resp:
+                    if resp.status < 500:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("app.pyが起動しませんでした")
+
+
+#######################
+# 仮想ユーザー
+#######################
+
+async def simulate_user(base_url: str, link_id: str, user_id: int, poll_interval: float, timeout: float) -> dict:
+    """
+    1人分の参加フローを実行
+
+    Returns:
+        dict: {'ok': bool, 'error': 失敗理由, 各段階の秒数}
+    """
+    result = {'ok': False, 'error': None}
+    jar = aiohttp.CookieJar(unsafe=True)  # 127.0.0.1 のセッションCookieを保持する
+    started = time.perf_counter()
+    try:
+        async with aiohttp.ClientSession(cookie_jar=jar, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+            async with session.get(f"{base_url}/join/{link_id}") as resp:
+                body = await resp.text()
+                if resp.status != 200:
+                    result['error'] = f"join_page HTTP {resp.status}"
+                    return result
+            match = STATE_PATTERN.search(body)
+            if not match:
+                result['error'] = 'join_page no state'
+                return result
+            joined_page = time.perf_counter()
+            result['join_page'] = joined_page - started
+
+            async with session.get(f"{base_url}/callback", params={'state': match.group(1), 'code': str(user_id)},
+                                   allow_redirects=False) as resp:
+                await resp.read()
+                location = resp.headers.get('Location', '')
+                if resp.status != 302 or '/join/result/' not in location:
+                    result['error'] = f"callback HTTP {resp.status}"
+                    return result
+            called_back = time.perf_counter()
+            result['callback'] = called_back - joined_page
+
+            job_token = location.rsplit('/', 1)[-1]
+            deadline = called_back + timeout
+            while True:
+                async with session.get(f"{base_url}/join/status/{job_token}") as resp:
+                    status = (await resp.json())['status']
+                if status in ('succeeded', 'failed', 'not_found'):
+                    break
+                if time.perf_counter() > deadline:
+                    status = 'timeout'
+                    break
+                await asyncio.sleep(poll_interval)
+            finished = time.perf_counter()
+            if status != 'succeeded':
+                result['error'] = f"job {status}"
+                return result
+            result['role_assignment'] = finished - called_back
+            result['total'] = finished - started
+            result['ok'] = True
+            return result
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        result['error'] = type(e).__name__
+        return result
+
+
+async def run_load(base_url: str, link_id: str, users: int, concurrency: int, poll_interval: float,
+                   timeout: float) -> tuple:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(index: int) -> dict:
+        async with semaphore:
+            return await simulate_user(base_url, link_id, USER_ID_BASE + index, poll_interval, timeout)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(run_one(index) for index in range(users)))
+    return results, time.perf_counter() - started
+
+
+#######################
+# 集計
+#######################
+
+def percentile(sorted_values: list, p: float) -> float:
+    """最近傍順位法によるパーセンタイル"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(results: list, elapsed: float) -> dict:
+    succeeded = [r for r in results if r['ok']]
+    summary = {
+        'users': len(results),
+        'succeeded': len(succeeded),
+        'failed': len(results) - len(succeeded),
+        'elapsed_seconds': round(elapsed, 3),
+        'joins_per_second': round(len(succeeded) / elapsed, 2) if elapsed else None,
+        'errors': dict(Counter(r['error'] for r in results if not r['ok']).most_common()),
+        'latency_ms': {},
+    }
+    for phase in PHASES:
+        values = sorted(r[phase] for r in results if phase in r)
+        if values:
+            summary['latency_ms'][phase] = {
+                'count': len(values),
+                **{f"p{p}": round(percentile(values, p) * 1000, 1) for p in (50, 95, 99)},
+                'max': round(values[-1] * 1000, 1),
+            }
+    return summary
+
+
+def print_summary(summary: dict, api_calls: Counter):
+    print()
+    print(f"参加完了: {summary['succeeded']}/{summary['users']}  "
+          f"経過時間: {summary['elapsed_seconds']:.2f}秒  スループット: {summary['joins_per_second']} joins/sec")
+    print()
+    print(f"{'段階':<18}{'件数':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}")
+    for phase, stats in summary['latency_ms'].items():
+        print(f"{phase:<18}{stats['count']:>8}{stats['p50']:>10}{stats['p95']:>10}{stats['p99']:>10}{stats['max']:>10}")
+    if summary['errors']:
+        print()
+        print("失敗の内訳:")
+        for error, count in summary['errors'].items():
+            print(f"  {error}: {count}")
+    print()
+    print("偽のDiscord APIが受けた呼び出し:")
+    for (method, route, status), count in sorted(api_calls.items()):
+        print(f"  {method:<5}{route:<58}{status:>5}{count:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200, help='参加させる仮想ユーザーの数')
+    parser.add_argument('--concurrency', type=int, default=20, help='同時に参加フローを進めるユーザー数')
+    parser.add_argument('--latency', type=float, default=0.05, help='偽のDiscord APIの平均応答秒数')
+    parser.add_argument('--jitter', type=float, default=0.02, help='偽のDiscord APIの応答秒数のばらつき')
+    parser.add_argument('--rate-limit-ratio', type=float, default=0.0, help='偽のDiscord APIが429を返す割合')
+    parser.add_argument('--error-ratio', type=float, default=0.0, help='偽のDiscord APIが502を返す割合')
+    parser.add_argument('--retry-after', type=float, default=0.5, help='429で返すretry_after（秒）')
+    parser.add_argument('--app-port', type=int, default=5055, help='app.pyを起動するポート')
+    parser.add_argument('--poll-interval', type=float, default=0.2, help='ジョブの状態を確認する間隔（秒）')
+    parser.add_argument('--timeout', type=float, default=60, help='1人分の参加フローの待ち時間の上限（秒）')
+    parser.add_argument('--json', help='集計結果をJSONで保存するファイル')
+    parser.add_argument('--keep-data', action='store_true', help='作成した招待リンク・ジョブを削除しない')
+    args = parser.parse_args()
+
+    stop_postgres = None
+    database_url = os.getenv('DATABASE_URL')
+    if not database_url:
+        database_url, stop_postgres = start_local_postgres()
+        os.environ['DATABASE_URL'] = database_url
+        print(f"一時的なPostgreSQLを起動しました: {database_url}")
+
+    fake = FakeDiscordThread(FakeDiscordServer(
+        {GUILD_ID: {'name': 'Load Test Server', 'roles': {ROLE_ID: 'Load Test Role'}}},
+        latency=args.latency, jitter=args.jitter, rate_limit_ratio=args.rate_limit_ratio,
+        error_ratio=args.error_ratio, retry_after=args.retry_after,
+    ))
+    link_id = None
+    process = None
+    log_path = os.path.join(tempfile.gettempdir(), f"loadtest-app-{args.app_port}.log")
+    try:
+        discord_api_base = fake.start()
+        link_id = prepare_database()
+        process = start_app(args.app_port, discord_api_base, database_url, log_path)
+        base_url = f"http://127.0.0.1:{args.app_port}"
+        asyncio.run(wait_for_app(base_url, process))
+        print(f"偽のDiscord API: {discord_api_base}  app.py: {base_url}（ログ: {log_path}）")
+        print(f"{args.users}人を同時実行数{args.concurrency}で参加させます...")
+
+        results, elapsed = asyncio.run(run_load(base_url, link_id, args.users, args.concurrency,
+                                                args.poll_interval, args.timeout))
+        summary = summarize(results, elapsed)
+        print_summary(summary, fake.server.requests)
+        if args.json:
+            summary['config'] = vars(args)
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(summary, f, ensure_ascii=False, indent=2)
+    finally:
+        if process:
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        fake.stop()
+        if link_id and not args.keep_data:
+            cleanup_database(link_id)
+        if stop_postgres:
+            stop_postgres()
+
+
+if __name__ == '__main__':
+    main()
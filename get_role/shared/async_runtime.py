@@ -0,0 +1,94 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+#######################
+# バックグラウンドのイベントループ
+# - Flaskのワーカースレッドとは別スレッドで1つのイベントループを常駐させる
+# - Discord Botや、長寿命のHTTPクライアントを使う非同期処理はこのループ上で実行する
+# - Flask側からはrun_coroutine()で結果を待つ
+# - 呼び出し元のcontextvars（トレースの現在のspanなど）はループ上のタスクとスレッドプールに引き継がれる
+#######################
+
+_loop = None
+_loop_lock = threading.Lock()
+
+# ブロッキングなDB呼び出し専用のスレッドプール（同時接続数の上限も兼ねる）
+_blocking_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('DB_EXECUTOR_WORKERS', 16)),
+    thread_name_prefix='db'
+)
+
+
+def start_background_loop() -> asyncio.AbstractEventLoop:
+    """バックグラウンドのイベントループを起動（起動済みならそれを返す）"""
+    global _loop
+    with _loop_lock:
+        if _loop is not None:
+            return _loop
+
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.call_soon(ready.set)
+            loop.run_forever()
+
+        threading.Thread(target=run, name='async-runtime', daemon=True).start()
+        ready.wait()
+        _loop = loop
+        logger.info("Background event loop started")
+        return loop
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """起動済みのバックグラウンドループを取得（未起動の場合はNone）"""
+    return _loop
+
+
+def submit(coro):
+    """
+    コルーチンをバックグラウンドループに投入
+
+    Returns:
+        concurrent.futures.Future: 結果を受け取るFuture
+    """
+    loop = _loop
+    if loop is None or not loop.is_running():
+        coro.close()
+        raise RuntimeError("Background event loop is not running")
+    return asyncio.run_coroutine_threadsafe(coro, loop)
+
+
+def run_coroutine(coro, timeout: float = None):
+    """
+    コルーチンをバックグラウンドループで実行して結果を待つ（Flaskのスレッドから呼ぶ）
+
+    Args:
+        coro: 実行するコルーチン
+        timeout: 待機する最大秒数
+
+    Returns:
+        コルーチンの戻り値（タイムアウト時はconcurrent.futures.TimeoutError）
+    """
+    future = submit(coro)
+    try:
+        return future.result(timeout)
+    except Exception:
+        future.cancel()
+        raise
+
+
+async def run_blocking(func, *args, **kwargs):
+    """ブロッキングな関数（DBアクセスなど）をスレッドプールで実行して待つ"""
+    loop = asyncio.get_running_loop()
+    # run_in_executorはcontextvarsを引き継がないため、呼び出し元のコンテキストで実行する
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_blocking_executor, functools.partial(context.run, func, *args, **kwargs))
@@ -0,0 +1,235 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+
+try:
+    import brotli
+except ImportError:  # brotliが無い環境ではgzipのみで動作
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# 圧縮対象とするMIMEタイプ
+COMPRESSIBLE_MIMETYPES = {
+    'text/html',
+    'text/css',
+    'text/plain',
+    'text/javascript',
+    'application/javascript',
+    'application/json',
+    'image/svg+xml',
+}
+
+# これより小さいレスポンスは圧縮しない（ヘッダー分で逆に大きくなるため）
+MIN_COMPRESS_SIZE = int(os.getenv('MIN_COMPRESS_SIZE', 512))
+
+# 動的レスポンスは速度優先、事前圧縮は圧縮率優先
+DYNAMIC_GZIP_LEVEL = 6
+DYNAMIC_BROTLI_QUALITY = 5
+STATIC_GZIP_LEVEL = 9
+STATIC_BROTLI_QUALITY = 11
+
+# 優先順位の高い順
+SUPPORTED_ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+
+def choose_encoding(accept_encoding: str, available=SUPPORTED_ENCODINGS) -> str:
+    """
+    Accept-Encodingヘッダーから使用するエンコーディングを選択
+
+    Args:
+        accept_encoding: リクエストのAccept-Encodingヘッダー
+        available: サーバー側で用意できるエンコーディング（優先順）
+
+    Returns:
+        str: 'br' / 'gzip'、圧縮できない場合はNone
+    """
+    if not accept_encoding:
+        return None
+
+    accepted = {}
+    for part in accept_encoding.split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token] = q
+
+    for encoding in available:
+        q = accepted.get(encoding, accepted.get('*', 0.0))
+        if q > 0:
+            return encoding
+    return None
+
+
+def compress_bytes(data: bytes, encoding: str, static: bool = False) -> bytes:
+    """指定エンコーディングでバイト列を圧縮"""
+    if encoding == 'br':
+        quality = STATIC_BROTLI_QUALITY if static else DYNAMIC_BROTLI_QUALITY
+        return brotli.compress(data, quality=quality)
+    if encoding == 'gzip':
+        level = STATIC_GZIP_LEVEL if static else DYNAMIC_GZIP_LEVEL
+        # mtime=0で固定し、同じ入力から常に同じ出力（=同じETag）になるようにする
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def is_compressible(mimetype: str) -> bool:
+    """MIMEタイプが圧縮対象かどうか"""
+    return mimetype in COMPRESSIBLE_MIMETYPES
+
+
+#######################
+# 圧縮による削減バイト数のカウンター
+#######################
+
+_stats_lock = threading.Lock()
+_stats = {
+    'compressed_responses': 0,
+    'original_bytes': 0,
+    'sent_bytes': 0,
+}
+
+
+def record_compression(original_size: int, sent_size: int):
+    """圧縮前後のサイズを記録"""
+    with _stats_lock:
+        _stats['compressed_responses'] += 1
+        _stats['original_bytes'] += original_size
+        _stats['sent_bytes'] += sent_size
+
+
+def get_compression_stats() -> dict:
+    """
+    圧縮統計を取得
+
+    Returns:
+        dict: compressed_responses, original_bytes, sent_bytes, saved_bytes
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['saved_bytes'] = stats['original_bytes'] - stats['sent_bytes']
+    return stats
+
+
+#######################
+# 事前圧縮済みのレスポンスボディ
+# - 静的ファイルや内容が変わらないページを起動時/初回に一度だけ圧縮して保持する
+# - エンコーディングごとにETagを持つ
+#######################
+
+class PrecompressedBody:
+    """エンコーディングごとの圧縮済みバイト列とETagを保持"""
+
+    __slots__ = ('variants', 'digest')
+
+    def __init__(self, data: bytes, compress: bool = True):
+        self.digest = hashlib.sha256(data).hexdigest()[:20]
+        self.variants = {None: data}
+        if compress:
+            for encoding in SUPPORTED_ENCODINGS:
+                compressed = compress_bytes(data, encoding, static=True)
+                # 圧縮しても小さくならない場合は保持しない
+                if len(compressed) < len(data):
+                    self.variants[encoding] = compressed
+
+    @property
+    def identity(self) -> bytes:
+        return self.variants[None]
+
+    def select(self, accept_encoding: str) -> tuple:
+        """クライアントに返すバリアントを選択して(エンコーディング, バイト列)を返す"""
+        available = tuple(e for e in SUPPORTED_ENCODINGS if e in self.variants)
+        encoding = choose_encoding(accept_encoding, available)
+        return encoding, self.variants[encoding]
+
+    def etag(self, encoding: str = None) -> str:
+        """エンコーディングごとのETag（引用符なし）"""
+        return f"{self.digest}-{encoding}" if encoding else self.digest
+
+
+class PrerenderedPageCache:
+    """内容が固定のページをキー単位で一度だけレンダリング・圧縮してキャッシュ"""
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._pages = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, render) -> PrecompressedBody:
+        """
+        キャッシュ済みのページを取得（無ければrender()を呼んで作成）
+
+        Args:
+            key: ページを識別するキー
+            render: HTML文字列を返す関数
+
+        Returns:
+            PrecompressedBody: 事前圧縮済みのページ
+        """
+        body = self._pages.get(key)
+        if body is not None:
+            self.hits += 1
+            return body
+
+        self.misses += 1
+        body = PrecompressedBody(render().encode('utf-8'))
+        with self._lock:
+            if len(self._pages) >= self.max_entries:
+                self._pages.pop(next(iter(self._pages)))
+            self._pages[key] = body
+        return body
+
+
+class StaticAsset:
+    """事前圧縮済みの静的ファイル"""
+
+    __slots__ = ('body', 'mimetype')
+
+    def __init__(self, body: PrecompressedBody, mimetype: str):
+        self.body = body
+        self.mimetype = mimetype
+
+
+class StaticAssetStore:
+    """staticディレクトリのファイルを起動時に読み込んで事前圧縮しておくストア"""
+
+    def __init__(self, directory: str):
+        self.directory = os.path.abspath(directory)
+        self._assets = {}
+        self.load()
+
+    def load(self):
+        """ディレクトリ配下のファイルを全て読み込む"""
+        assets = {}
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path, self.directory).replace(os.sep, '/')
+                mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                try:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                except OSError as e:
+                    logger.error(f"Failed to load static asset {relative}: {e}")
+                    continue
+                body = PrecompressedBody(data, compress=is_compressible(mimetype))
+                assets[relative] = StaticAsset(body, mimetype)
+        self._assets = assets
+        logger.info(f"Loaded {len(assets)} static assets from {self.directory}")
+
+    def get(self, filename: str) -> StaticAsset:
+        """ファイル名から静的ファイルを取得（存在しない場合はNone）"""
+        return self._assets.get(filename)
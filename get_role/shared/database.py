@@ -84,6 +84,115 @@ def init_database():
         logger.error(f"Failed to initialize database: {e}")
         raise
 
+def init_web_tables():
+    """Webアプリが使用するテーブルを初期化"""
+    try:
+        with get_db_cursor() as cursor:
+            # ロール付与ジョブのキュー（SKIP LOCKEDで複数ワーカーから取り出す）
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS role_assignment_jobs (
+                    id BIGSERIAL PRIMARY KEY,
+                    job_token VARCHAR(64) UNIQUE NOT NULL,
+                    link_id VARCHAR(255) NOT NULL,
+                    guild_id BIGINT NOT NULL,
+                    role_id BIGINT NOT NULL,
+                    user_id BIGINT NOT NULL,
+                    username VARCHAR(255) NOT NULL,
+                    access_token TEXT NULL,
+                    status VARCHAR(16) NOT NULL DEFAULT 'pending',
+                    is_returning BOOLEAN NULL DEFAULT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    last_error TEXT NULL DEFAULT NULL,
+                    run_after_unix BIGINT NOT NULL,
+                    locked_until_unix BIGINT NULL DEFAULT NULL,
+                    created_at_unix BIGINT NOT NULL,
+                    updated_at_unix BIGINT NOT NULL
+                )
+            """)
+            
+            # 参加フローの相関ID（shared/tracing.pyのtrace_id、ワーカーでの処理を同じトレースにつなげる）
+            cursor.execute("""
+                ALTER TABLE role_assignment_jobs ADD COLUMN IF NOT EXISTS trace_id VARCHAR(32) NULL
+            """)
+            
+            # 実行待ち・実行中のジョブだけを対象にした部分インデックス
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_role_assignment_jobs_runnable
+                ON role_assignment_jobs(run_after_unix)
+                WHERE status IN ('pending', 'running')
+            """)
+            
+            # 同じユーザーが同じリンクのジョブを重複して登録しないようにする
+            cursor.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS uq_role_assignment_jobs_active
+                ON role_assignment_jobs(link_id, user_id)
+                WHERE status IN ('pending', 'running')
+            """)
+            
+            # 招待リンクの利用履歴（リンク×ユーザーで1行）
+            # - UNIQUE制約のB-treeインデックスで重複チェックをO(log n)で行う
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS role_invite_redemptions (
+                    id BIGSERIAL PRIMARY KEY,
+                    link_id VARCHAR(255) NOT NULL,
+                    user_id BIGINT NOT NULL,
+                    guild_id BIGINT NOT NULL,
+                    role_id BIGINT NOT NULL,
+                    redeemed_at_unix BIGINT NOT NULL,
+                    CONSTRAINT uq_role_invite_redemptions_link_user UNIQUE (link_id, user_id)
+                )
+            """)
+            
+            # ロール付与前の予約（FALSE）と付与済み（TRUE）の区別
+            # - 使用回数は付与の前に予約として+1し、ジョブが失敗したら予約ごと取り消す
+            cursor.execute("""
+                ALTER TABLE role_invite_redemptions ADD COLUMN IF NOT EXISTS confirmed BOOLEAN NOT NULL DEFAULT TRUE
+            """)
+            
+            # 招待リンク利用イベントの追記専用ログ
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS role_invite_redemption_events (
+                    id BIGSERIAL PRIMARY KEY,
+                    event_type VARCHAR(32) NOT NULL,
+                    link_id VARCHAR(255) NOT NULL,
+                    guild_id BIGINT NOT NULL,
+                    role_id BIGINT NOT NULL,
+                    user_id BIGINT NOT NULL,
+                    occurred_at_unix BIGINT NOT NULL
+                )
+            """)
+            
+            # 時刻順に追記されるためBRINインデックスで十分（サイズがごく小さい）
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_role_invite_redemption_events_occurred_at
+                ON role_invite_redemption_events USING BRIN (occurred_at_unix)
+            """)
+            
+            # 招待リンクの利用数の集計（イベント書き込み時に差分で更新する）
+            # - granularity: 'h' = 1時間単位, 'd' = 1日単位（日本時間の0時区切り）
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS role_invite_link_usage_rollups (
+                    granularity CHAR(1) NOT NULL,
+                    link_id VARCHAR(255) NOT NULL,
+                    guild_id BIGINT NOT NULL,
+                    bucket_start_unix BIGINT NOT NULL,
+                    joins INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (granularity, link_id, bucket_start_unix)
+                )
+            """)
+            
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_role_invite_link_usage_rollups_guild
+                ON role_invite_link_usage_rollups(guild_id, granularity, bucket_start_unix)
+            """)
+            
+            logger.info("Web tables initialized successfully")
+            
+    except Exception as e:
+        logger.error(f"Failed to initialize web tables: {e}")
+        raise
+
 if __name__ == "__main__":
     # テスト用の初期化
     init_database()
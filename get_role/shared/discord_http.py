@@ -0,0 +1,126 @@
+import asyncio
+import json
+import logging
+import re
+import time
+from urllib.parse import urlsplit
+import aiohttp
+from .metrics import REGISTRY
+from .tracing import begin_span
+
+logger = logging.getLogger(__name__)
+
+DISCORD_API_SECONDS = REGISTRY.histogram(
+    'discord_api_request_duration_seconds', 'Discord API call latency by endpoint and status',
+    ('method', 'endpoint', 'status')
+)
+
+_API_PREFIX = re.compile(r'^/api(?:/v\d+)?')
+_ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+
+def endpoint_label(path: str) -> str:
+    """
+    メトリクスのラベル用にAPIパスを正規化（例: /guilds/123/members/456 -> /guilds/{id}/members/{id}）
+
+    - クエリ文字列・ホスト・/api/v10 の部分は取り除く
+    """
+    path = urlsplit(path).path if '://' in path else path.split('?', 1)[0]
+    path = _API_PREFIX.sub('', path)
+    return _ID_SEGMENT.sub('/{id}', path) or '/'
+
+
+class DiscordResponse:
+    """Discord APIのレスポンス（本文は読み込み済み）"""
+
+    __slots__ = ('status_code', 'headers', 'body')
+
+    def __init__(self, status_code: int, headers: dict, body: bytes):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status_code < 400
+
+    @property
+    def text(self) -> str:
+        return self.body.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.body) if self.body else None
+
+
+class DiscordHTTPClient:
+    """
+    長寿命のaiohttpセッションを使い回すDiscord API用HTTPクライアント
+
+    セッションは最初に使われたイベントループ上で作成されるため、
+    常にバックグラウンドループ（shared.async_runtime）から呼び出すこと。
+    """
+
+    def __init__(self, api_base: str, timeout: float = 5.0, max_connections: int = 100):
+        self.api_base = api_base.rstrip('/')
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._session = None
+
+    def url(self, path: str) -> str:
+        """APIパスから完全なURLを作成"""
+        if path.startswith('http://') or path.startswith('https://'):
+            return path
+        return f"{self.api_base}/{path.lstrip('/')}"
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def request(self, method: str, path: str, **kwargs) -> DiscordResponse:
+        """
+        Discord APIを呼び出す
+
+        Args:
+            method: HTTPメソッド
+            path: APIパス（例: /guilds/123）または完全なURL
+            **kwargs: aiohttpのrequestに渡す引数（headers, json, dataなど）
+
+        Returns:
+            DiscordResponse: ステータスに関わらずレスポンスを返す
+            （接続エラー・タイムアウトは例外として送出）
+        """
+        session = await self._get_session()
+        endpoint = endpoint_label(path)
+        span = begin_span('discord_api', **{'http.method': method, 'discord.endpoint': endpoint})
+        started = time.perf_counter()
+        status = 'error'
+        error = None
+        try:
+            async with session.request(method, self.url(path), **kwargs) as resp:
+                body = await resp.read()
+                status = resp.status
+                return DiscordResponse(resp.status, dict(resp.headers), body)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            DISCORD_API_SECONDS.observe(time.perf_counter() - started,
+                                        method=method, endpoint=endpoint, status=status)
+            span.set_attribute('http.status_code', status)
+            if isinstance(status, int) and status >= 400:
+                span.status = 'error'
+            span.end(error)
+
+    async def close(self):
+        """セッションを閉じる"""
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+# 呼び出し側で捕捉すべき通信系の例外
+TRANSPORT_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
@@ -0,0 +1,192 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from psycopg2.extras import execute_values
+from .database import get_db_cursor
+from .metrics import observe_db
+
+logger = logging.getLogger(__name__)
+
+# イベントの種類
+EVENT_JOINED = 'joined'          # サーバーに参加してロールを取得
+EVENT_ROLE_ADDED = 'role_added'  # 参加済みのユーザーがロールを取得
+EVENT_REPEAT = 'repeat'          # 取得済みのユーザーが再度リンクを使用
+
+# 日単位の集計は日本時間の0時で区切る
+JST_OFFSET_SECONDS = 9 * 3600
+
+
+class RedemptionEventWriter:
+    """
+    招待リンク利用イベントをバッファして、まとめてDBに書き込むライター
+
+    - record()はキューに積むだけなので、リクエスト処理側の負荷はほぼゼロ
+    - 件数（batch_size）か経過時間（flush_interval）のどちらかに達したら複数行INSERTで書き込む
+    - キューが満杯の場合は待たずに破棄して数える
+      （record()はバックグラウンドのasyncioループ上から呼ばれるため、待つとループ上の全ての処理が止まる）
+    - 1時間単位の集計はhourly_retention秒より古いものを、prune_interval秒ごとに書き込みスレッドで削除する
+      （/invite_link_statsが使うのは直近24時間分だけ。日単位の集計は削除しない）
+    - close()（プロセス終了時にも自動で呼ばれる）で残りを全て書き込む
+    """
+
+    def __init__(self, batch_size: int = 500, flush_interval: float = 2.0, max_queue: int = 10000,
+                 max_retries: int = 3, hourly_retention: float = 7 * 86400, prune_interval: float = 3600):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.hourly_retention = hourly_retention
+        self.prune_interval = prune_interval
+        self._next_prune = 0.0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {'recorded': 0, 'written': 0, 'dropped': 0, 'flushes': 0, 'failures': 0, 'pruned': 0}
+
+    def start(self):
+        """書き込みスレッドを起動"""
+        with self._lock:
+            if self._thread:
+                return
+            self._thread = threading.Thread(target=self._run, name='redemption-events', daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, event_type: str, link_id: str, guild_id: int, role_id: int, user_id: int,
+               occurred_at_unix: int = None) -> bool:
+        """
+        イベントをキューに積む
+
+        Returns:
+            bool: キューに積めた場合True（満杯で破棄した場合False）
+        """
+        event = (event_type, link_id, guild_id, role_id, user_id, occurred_at_unix or int(time.time()))
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.stats['dropped'] += 1
+            # 満杯の間は破棄が続くため、ログは最初と1000件ごとにだけ出す
+            if self.stats['dropped'] % 1000 == 1:
+                logger.warning(f"Redemption event queue full, {self.stats['dropped']} events dropped so far")
+            return False
+        self.stats['recorded'] += 1
+        return True
+
+    def close(self, timeout: float = 10.0):
+        """書き込みスレッドを止め、残りのイベントを書き込む"""
+        self._stop.set()
+        thread = self._thread
+        if thread and thread.is_alive():
+            thread.join(timeout)
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._collect_batch()
+            if batch:
+                self._flush(batch)
+            self._prune_if_due()
+
+    def _collect_batch(self) -> list:
+        """batch_size件たまるか、最初の1件からflush_interval秒経つまで集める"""
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            if deadline is None:
+                timeout = self.flush_interval
+            else:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+            # 停止要求後はキューに残っている分だけを即座に回収する
+            if self._stop.is_set():
+                timeout = 0
+            try:
+                event = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(event)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+        return batch
+
+    def _flush(self, batch: list):
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                write_redemption_events(batch)
+                self.stats['written'] += len(batch)
+                self.stats['flushes'] += 1
+                return
+            except Exception as e:
+                self.stats['failures'] += 1
+                logger.error(f"Failed to write {len(batch)} redemption events (attempt {attempt}): {e}")
+                if self._stop.is_set():
+                    break
+                time.sleep(min(2 ** attempt, 30))
+        self.stats['dropped'] += len(batch)
+
+    def _prune_if_due(self):
+        """前回からprune_interval秒経っていれば、古い1時間単位の集計を削除"""
+        if not self.hourly_retention or self._stop.is_set():
+            return
+        now = time.monotonic()
+        if now < self._next_prune:
+            return
+        self._next_prune = now + self.prune_interval
+        try:
+            self.stats['pruned'] += prune_hourly_rollups(int(time.time() - self.hourly_retention))
+        except Exception as e:
+            logger.error(f"Failed to prune hourly usage rollups: {e}")
+
+
+# イベントの書き込みと集計の差分更新を1つのSQL文で行う（%sにはexecute_valuesがVALUESを展開する）
+WRITE_EVENTS_SQL = f"""
+    WITH inserted AS (
+        INSERT INTO role_invite_redemption_events
+            (event_type, link_id, guild_id, role_id, user_id, occurred_at_unix)
+        VALUES %s
+        RETURNING event_type, link_id, guild_id, occurred_at_unix
+    )
+    INSERT INTO role_invite_link_usage_rollups (granularity, link_id, guild_id, bucket_start_unix, joins)
+    SELECT g.granularity, e.link_id, e.guild_id,
+           (e.occurred_at_unix + g.offset_seconds) / g.width_seconds * g.width_seconds - g.offset_seconds,
+           COUNT(*)
+    FROM inserted e
+    CROSS JOIN (VALUES ('h', 3600, 0), ('d', 86400, {JST_OFFSET_SECONDS})) AS g(granularity, width_seconds, offset_seconds)
+    WHERE e.event_type IN ('{EVENT_JOINED}', '{EVENT_ROLE_ADDED}')
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (granularity, link_id, bucket_start_unix)
+    DO UPDATE SET joins = role_invite_link_usage_rollups.joins + EXCLUDED.joins
+"""
+
+
+@observe_db
+def write_redemption_events(events: list):
+    """
+    イベントを複数行INSERTでまとめて書き込み、同じSQL文の中で集計テーブルも差分更新する
+
+    - 集計はこのバッチ分だけをGROUP BYして加算するため、過去のイベントは走査しない
+    - 1つのSQL文なので、イベントと集計がずれることはない
+
+    Args:
+        events: (event_type, link_id, guild_id, role_id, user_id, occurred_at_unix) のリスト
+    """
+    with get_db_cursor() as cursor:
+        execute_values(cursor, WRITE_EVENTS_SQL, events, page_size=len(events))
+
+
+@observe_db
+def prune_hourly_rollups(before_unix: int) -> int:
+    """
+    before_unixより前の1時間単位の集計を削除
+
+    Returns:
+        int: 削除した行数
+    """
+    with get_db_cursor() as cursor:
+        cursor.execute("""
+            DELETE FROM role_invite_link_usage_rollups
+            WHERE granularity = 'h' AND bucket_start_unix < %s
+        """, (before_unix,))
+        return cursor.rowcount
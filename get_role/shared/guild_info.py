@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+from .discord_http import DiscordHTTPClient, TRANSPORT_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# DiscordのID（snowflake）として妥当な最大桁数
+MAX_SNOWFLAKE_DIGITS = 20
+
+
+def parse_guild_id(value) -> int:
+    """
+    クエリ文字列などからギルドIDを取り出す
+
+    Returns:
+        int: ギルドID（snowflakeとして不正な場合はNone）
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    if not value.isdigit() or len(value) > MAX_SNOWFLAKE_DIGITS:
+        return None
+    guild_id = int(value)
+    return guild_id if guild_id > 0 else None
+
+
+class GuildInfoProvider:
+    """
+    ギルド情報（名前・アイコン・ロール名）をTTL付きでキャッシュして返すプロバイダ
+
+    - 同じギルドIDへの同時リクエストは1回のAPI呼び出しにまとめる
+    - 取得に失敗した結果も短いTTLでキャッシュし、Discordへの連打を防ぐ
+    - 1回の取得にはタイムアウト予算を設ける
+    - 使うのはDBの招待リンクに登録済みのギルドIDだけ（Gateway未接続時の参加ページ）
+      Bot導入完了ページはクエリのIDを信用できないため、このプロバイダを使わない
+    """
+
+    def __init__(self, http: DiscordHTTPClient, bot_token: str, ttl: float = 300,
+                 negative_ttl: float = 30, timeout: float = 2.0, max_entries: int = 1024):
+        self.http = http
+        self.bot_token = bot_token
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self._cache = {}
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, guild_id: int) -> dict:
+        """
+        ギルド情報を取得
+
+        Args:
+            guild_id: ギルドID
+
+        Returns:
+            dict: id, name, icon, roles（ロールID→ロール名）を含む辞書（取得できない場合はNone）
+        """
+        now = time.monotonic()
+        entry = self._cache.get(guild_id)
+        if entry and entry[0] > now:
+            self.hits += 1
+            return entry[1]
+
+        # 取得中のリクエストがあれば相乗りする
+        task = self._inflight.get(guild_id)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._load(guild_id))
+            self._inflight[guild_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(guild_id, None))
+        else:
+            self.hits += 1
+
+        # 呼び出し側がタイムアウトしても取得自体は継続させ、結果をキャッシュに残す
+        return await asyncio.shield(task)
+
+    async def _load(self, guild_id: int) -> dict:
+        info = await self._fetch(guild_id)
+        self._store(guild_id, info)
+        return info
+
+    async def _fetch(self, guild_id: int) -> dict:
+        try:
+            resp = await asyncio.wait_for(
+                self.http.request('GET', f'/guilds/{guild_id}',
+                                  headers={'Authorization': f'Bot {self.bot_token}'}),
+                self.timeout
+            )
+        except TRANSPORT_ERRORS as e:
+            logger.error(f"Failed to fetch guild {guild_id}: {e!r}")
+            return None
+
+        if resp.status_code != 200:
+            logger.warning(f"Discord API error fetching guild {guild_id}: {resp.status_code}")
+            return None
+
+        data = resp.json()
+        # キャッシュには表示に必要な項目だけを保持する
+        roles = {int(role['id']): role.get('name') for role in data.get('roles') or []}
+        return {'id': guild_id, 'name': data.get('name'), 'icon': data.get('icon'), 'roles': roles}
+
+    def peek(self, guild_id: int) -> dict:
+        """キャッシュ済みのギルド情報を取得（API呼び出しはせず、無ければNone）"""
+        entry = self._cache.get(guild_id)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    def _store(self, guild_id: int, info: dict):
+        ttl = self.ttl if info else self.negative_ttl
+        if guild_id not in self._cache and len(self._cache) >= self.max_entries:
+            self._evict(time.monotonic())
+        self._cache[guild_id] = (time.monotonic() + ttl, info)
+
+    def _evict(self, now: float):
+        """期限切れのエントリを削除し、それでも多ければ古いものから削除"""
+        for key in [k for k, (expires, _) in self._cache.items() if expires <= now]:
+            del self._cache[key]
+        while len(self._cache) >= self.max_entries:
+            self._cache.pop(next(iter(self._cache)))
@@ -0,0 +1,104 @@
+import os
+import time
+from .expiry import format_jst
+from .link_status import STATUS_ACTIVE, STATUS_EXPIRED, STATUS_EXHAUSTED, evaluate_status, describe_status
+
+
+class InviteLink:
+    """
+    role_invite_linksの1行を表す軽量なレコード
+
+    - __slots__で属性を固定し、行ごとの辞書を持たない
+    - 状態（有効期限切れ・使用回数上限）は作成時に一度だけ判定して保持する
+      （SQLの計算列で判定済みのstatus_flagsがあればそれを使う）
+    """
+
+    __slots__ = (
+        'id', 'guild_id', 'role_id', 'link_id', 'created_by_user_id', 'max_uses',
+        'current_uses', 'expires_at', 'expires_at_unix', 'created_at', 'created_at_unix',
+        'status_flags'
+    )
+
+    def __init__(self, guild_id: int, role_id: int, link_id: str, created_by_user_id: int,
+                 max_uses: int = None, current_uses: int = 0, expires_at: str = None,
+                 expires_at_unix: int = None, created_at: str = None, created_at_unix: int = None,
+                 id: int = None, status_flags: int = None, now: int = None):
+        self.id = id
+        self.guild_id = guild_id
+        self.role_id = role_id
+        self.link_id = link_id
+        self.created_by_user_id = created_by_user_id
+        self.max_uses = max_uses
+        self.current_uses = current_uses or 0
+        self.expires_at = expires_at
+        self.expires_at_unix = expires_at_unix
+        self.created_at = created_at
+        self.created_at_unix = created_at_unix
+        if status_flags is None:
+            status_flags = self.evaluate(now)
+        self.status_flags = status_flags
+
+    @classmethod
+    def from_row(cls, row, now: int = None) -> 'InviteLink':
+        """DBの行（辞書またはnamedtuple）から作成（余分な列は無視する）"""
+        if hasattr(row, '_asdict'):
+            row = row._asdict()
+        return cls(now=now, **{name: row.get(name) for name in cls.__slots__})
+
+    @classmethod
+    def from_rows(cls, rows, now: int = None) -> list:
+        """複数の行から作成（状態は同じ現在時刻で判定する）"""
+        if now is None:
+            now = int(time.time())
+        return [cls.from_row(row, now) for row in rows]
+
+    def evaluate(self, now: int = None) -> int:
+        """現在時刻での状態フラグを判定（保持している状態は更新しない）"""
+        if now is None:
+            now = int(time.time())
+        return evaluate_status(self.max_uses, self.current_uses, self.expires_at_unix, now)
+
+    @property
+    def is_expired(self) -> bool:
+        """有効期限が切れているか（期限なしの場合はFalse）"""
+        return bool(self.status_flags & STATUS_EXPIRED)
+
+    @property
+    def is_exhausted(self) -> bool:
+        """使用回数が上限に達しているか（上限なしの場合はFalse）"""
+        return bool(self.status_flags & STATUS_EXHAUSTED)
+
+    @property
+    def is_usable(self) -> bool:
+        """リンクが使用可能か"""
+        return self.status_flags == STATUS_ACTIVE
+
+    @property
+    def status(self) -> str:
+        """状態の表示文字列（例: 有効、有効期限切れ/使用回数上限）"""
+        return describe_status(self.status_flags)
+
+    @property
+    def status_icon(self) -> str:
+        return "✅" if self.is_usable else "❌"
+
+    @property
+    def uses_text(self) -> str:
+        """使用回数の表示文字列（例: 3/10、3/無制限）"""
+        return f"{self.current_uses}/{self.max_uses or '無制限'}"
+
+    @property
+    def expires_text(self) -> str:
+        """有効期限の表示文字列（日本時間、期限なしの場合は「無期限」）"""
+        # 状態の判定（evaluate_status / LINK_STATUS_SQL）と同じく、NULLと0は無期限として扱う
+        if not self.expires_at_unix:
+            return "無期限"
+        return format_jst(self.expires_at_unix)
+
+    @property
+    def join_url(self) -> str:
+        """参加ページのURL（BASE_URLは.envの読み込み後に参照する）"""
+        return f"{os.getenv('BASE_URL', 'http://localhost:5000')}/join/{self.link_id}"
+
+    def __repr__(self) -> str:
+        return f"InviteLink(link_id={self.link_id!r}, guild_id={self.guild_id}, role_id={self.role_id})"
@@ -0,0 +1,135 @@
+import math
+import os
+import secrets
+import string
+
+#######################
+# 招待リンクのlink ID
+# - 乱数は secrets.randbelow(基数**桁数) の1回だけ取り出し、それを固定桁数の文字列に変換する
+#   （1文字ずつsecrets.choiceを呼ぶより速く、剰余による偏りも無い）
+# - 文字種は環境変数LINK_ID_ALPHABET（base36: 小文字+数字 / base62: 大文字も含む）、
+#   桁数は環境変数LINK_ID_LENGTHで変更できる
+# - 衝突はINSERT ... ON CONFLICT DO NOTHING RETURNING で検出し、IDを作り直して再試行する
+#######################
+
+LINK_ID_ALPHABETS = {
+    'base36': string.digits + string.ascii_lowercase,
+    'base62': string.digits + string.ascii_lowercase + string.ascii_uppercase,
+}
+DEFAULT_LINK_ID_ALPHABET = 'base36'
+DEFAULT_LINK_ID_LENGTH = 10
+
+# 衝突した場合にIDを作り直す最大回数
+LINK_ID_MAX_ATTEMPTS = 5
+
+
+def resolve_alphabet(name: str = None) -> str:
+    """文字種の名前（base36 / base62）から使用する文字列を取得"""
+    name = (name or os.getenv('LINK_ID_ALPHABET', DEFAULT_LINK_ID_ALPHABET)).lower()
+    if name not in LINK_ID_ALPHABETS:
+        raise ValueError(f"Unknown LINK_ID_ALPHABET: {name} (expected one of {', '.join(LINK_ID_ALPHABETS)})")
+    return LINK_ID_ALPHABETS[name]
+
+
+def resolve_length(length: int = None) -> int:
+    """link IDの桁数（省略時は環境変数LINK_ID_LENGTH）"""
+    length = int(length or os.getenv('LINK_ID_LENGTH', DEFAULT_LINK_ID_LENGTH))
+    if length < 6:
+        raise ValueError(f"LINK_ID_LENGTH must be at least 6: {length}")
+    return length
+
+
+def encode_fixed(value: int, alphabet: str, length: int) -> str:
+    """整数を指定の文字種で固定桁数の文字列に変換（上位桁は0に相当する文字で埋める）"""
+    base = len(alphabet)
+    chars = []
+    for _ in range(length):
+        value, digit = divmod(value, base)
+        chars.append(alphabet[digit])
+    return ''.join(reversed(chars))
+
+
+def generate_link_id(length: int = None, alphabet: str = None) -> str:
+    """
+    ランダムなlink IDを生成
+
+    Args:
+        length: 桁数（省略時は環境変数LINK_ID_LENGTH、既定10）
+        alphabet: 使用する文字列（省略時は環境変数LINK_ID_ALPHABET、既定base36）
+
+    Returns:
+        str: link ID
+    """
+    alphabet = alphabet or resolve_alphabet()
+    length = length or resolve_length()
+    return encode_fixed(secrets.randbelow(len(alphabet) ** length), alphabet, length)
+
+
+def id_space(length: int = None, alphabet: str = None) -> int:
+    """生成しうるlink IDの総数"""
+    alphabet = alphabet or resolve_alphabet()
+    length = length or resolve_length()
+    return len(alphabet) ** length
+
+
+def collision_probability(existing: int, new: int = 1, length: int = None, alphabet: str = None) -> float:
+    """
+    既存のexisting件に対して、new件を新しく生成したときに1件以上が既存（または互いに）衝突する確率
+
+    - 誕生日問題の近似 1 - exp(-(k(k-1)/2 - m(m-1)/2) / N) を使う（k = existing + new, m = existing）
+    """
+    space = id_space(length, alphabet)
+    total = existing + new
+    pairs = (total * (total - 1) - existing * (existing - 1)) / 2
+    return -math.expm1(-pairs / space)
+
+
+#######################
+# link IDのBIGINTキー（link_key）
+# - 10文字以下の英数字のlink IDを、全単射の62進数（各桁を1〜62として扱う）でBIGINTに変換する
+#   （先頭の'0'の有無で別のIDになるため、通常の62進数ではなく全単射の表記を使う）
+# - 10文字のbase62でも最大約8.5e17でBIGINTに収まる。11文字以上・英数字以外のIDはキーを持たない（NULL）
+# - DB側はshared/database.pyのrole_invite_link_key()関数（トリガーとバックフィルで使用）が同じ変換を行う
+# - LINK_KEY_LOOKUP=1 の場合、/joinなどのlink IDでの検索をlink_keyのインデックスで行う
+#   （バックフィルが完了してから有効にすること）
+#######################
+
+LINK_KEY_ALPHABET = LINK_ID_ALPHABETS['base62']
+LINK_KEY_MAX_LENGTH = 10
+_LINK_KEY_DIGITS = {char: value for value, char in enumerate(LINK_KEY_ALPHABET, 1)}
+
+LINK_KEY_LOOKUP = os.getenv('LINK_KEY_LOOKUP', '0') == '1'
+
+
+def link_key_for(link_id: str) -> int:
+    """
+    link IDからlink_keyを計算
+
+    Returns:
+        int: link_key（キーを持たないIDの場合はNone）
+    """
+    if not link_id or len(link_id) > LINK_KEY_MAX_LENGTH:
+        return None
+    key = 0
+    for char in link_id:
+        digit = _LINK_KEY_DIGITS.get(char)
+        if digit is None:
+            return None
+        key = key * len(LINK_KEY_ALPHABET) + digit
+    return key
+
+
+def link_lookup_condition(link_id: str, column_prefix: str = '') -> tuple:
+    """
+    link IDで1件を検索するWHERE条件とパラメータを作成
+
+    - LINK_KEY_LOOKUPが有効でキーを計算できる場合はlink_keyのインデックスを使い、
+      念のためlink_idも一致することを確認する
+
+    Returns:
+        tuple: (条件のSQL, パラメータのタプル)
+    """
+    key = link_key_for(link_id) if LINK_KEY_LOOKUP else None
+    if key is None:
+        return f"{column_prefix}link_id = %s", (link_id,)
+    return f"{column_prefix}link_key = %s AND {column_prefix}link_id = %s", (key, link_id)
@@ -0,0 +1,68 @@
+import time
+
+#######################
+# 招待リンクの状態判定
+# - 有効期限切れ・使用回数上限の判定はここだけで行う
+# - 状態はビットフラグ（両方に該当する場合は STATUS_EXPIRED | STATUS_EXHAUSTED）
+# - 一覧などの複数件は、1つの「現在時刻」でまとめて判定する
+# - 同じ判定をSQLの計算列（LINK_STATUS_SQL）としても使える
+#######################
+
+STATUS_ACTIVE = 0
+STATUS_EXPIRED = 1    # 有効期限切れ（expires_at_unixがNULL/0の場合は無期限）
+STATUS_EXHAUSTED = 2  # 使用回数上限（max_usesがNULL/0の場合は無制限）
+
+# SQLで状態フラグを計算する式（%sには現在のUnix時刻を渡す）
+LINK_STATUS_SQL = """(
+    CASE WHEN COALESCE(expires_at_unix, 0) <> 0 AND %s > expires_at_unix THEN 1 ELSE 0 END
+  | CASE WHEN COALESCE(max_uses, 0) <> 0 AND current_uses >= max_uses THEN 2 ELSE 0 END
+)"""
+
+
+def evaluate_status(max_uses, current_uses, expires_at_unix, now: int) -> int:
+    """
+    1件の招待リンクの状態フラグを判定
+
+    Args:
+        max_uses: 最大使用回数（NULL/0は無制限）
+        current_uses: 現在の使用回数
+        expires_at_unix: 有効期限のUnix時刻（NULL/0は無期限）
+        now: 判定に使う現在のUnix時刻
+
+    Returns:
+        int: STATUS_*の組み合わせ
+    """
+    status = STATUS_ACTIVE
+    if expires_at_unix and now > expires_at_unix:
+        status |= STATUS_EXPIRED
+    if max_uses and (current_uses or 0) >= max_uses:
+        status |= STATUS_EXHAUSTED
+    return status
+
+
+def evaluate_statuses(links, now: int = None) -> list:
+    """
+    複数の招待リンクの状態フラグを同じ現在時刻でまとめて判定
+
+    Args:
+        links: max_uses, current_uses, expires_at_unix 属性を持つオブジェクトのイテラブル
+        now: 判定に使う現在のUnix時刻（省略時は呼び出し時点）
+
+    Returns:
+        list: linksと同じ順の状態フラグ
+    """
+    if now is None:
+        now = int(time.time())
+    return [evaluate_status(link.max_uses, link.current_uses, link.expires_at_unix, now) for link in links]
+
+
+def describe_status(status: int) -> str:
+    """状態フラグの表示文字列（例: 有効、有効期限切れ/使用回数上限）"""
+    if status == STATUS_ACTIVE:
+        return "有効"
+    reasons = []
+    if status & STATUS_EXPIRED:
+        reasons.append("有効期限切れ")
+    if status & STATUS_EXHAUSTED:
+        reasons.append("使用回数上限")
+    return '/'.join(reasons)
@@ -1,5 +1,12 @@
 import logging
+import time
 from .database import get_db_cursor
+from .invite_link import InviteLink
+from .link_status import LINK_STATUS_SQL
+from .link_id import link_lookup_condition
+from .metrics import observe_db
+from .tracing import traced
+from .token_cipher import encrypt_token, decrypt_token
 
 logger = logging.getLogger(__name__)
 
@@ -7,6 +14,8 @@ class RoleInviteLinks:
     """ロール招待リンクを管理するモデル"""
     
     @staticmethod
+    @observe_db
+    @traced('db.create_role_invite_link')
     def create_role_invite_link(role_id: int, link_id: str, created_by_user_id: int) -> bool:
         """
         ロール招待リンクを作成
@@ -44,6 +53,8 @@ class RoleInviteLinks:
             return False
     
     @staticmethod
+    @observe_db
+    @traced('db.get_all_role_invite_links')
     def get_all_role_invite_links() -> list:
         """
         すべてのロール招待リンクを取得
@@ -68,6 +79,8 @@ class RoleInviteLinks:
             return []
     
     @staticmethod
+    @observe_db
+    @traced('db.get_link_data_by_link_id')
     def get_link_data_by_link_id(link_id: str) -> dict:
         """
         リンクIDからロールリンクの全データを取得
@@ -98,6 +111,8 @@ class RoleInviteLinks:
             return None
     
     @staticmethod
+    @observe_db
+    @traced('db.delete_role_invite_link')
     def delete_role_invite_link(link_id: str) -> bool:
         """
         ロール招待リンクを削除
@@ -126,6 +141,8 @@ class RoleInviteLinks:
             return False
     
     @staticmethod
+    @observe_db
+    @traced('db.get_role_id_by_link_id')
     def get_role_id_by_link_id(link_id: str) -> int:
         """
         リンクIDからロールIDのみを取得
@@ -151,6 +168,8 @@ class RoleInviteLinks:
             return None
     
     @staticmethod
+    @observe_db
+    @traced('db.delete_role_invite_link_by_id')
     def delete_role_invite_link_by_id(record_id: int) -> bool:
         """
         IDでロール招待リンクを削除
@@ -187,37 +206,46 @@ delete_role_invite_link = RoleInviteLinks.delete_role_invite_link
 delete_role_invite_link_by_id = RoleInviteLinks.delete_role_invite_link_by_id
 
 # 新しいデータベーススキーマ用の関数
-def get_invite_link_full_info(link_id: str) -> dict:
+@observe_db
+@traced('db.get_invite_link_full_info')
+def get_invite_link_full_info(link_id: str) -> InviteLink:
     """新しいスキーマから招待リンクの詳細情報を取得"""
     try:
         with get_db_cursor() as cursor:
-            query = """
+            # LINK_KEY_LOOKUP=1 の場合はlink_keyのインデックスで検索する
+            condition, params = link_lookup_condition(link_id)
+            # 有効期限切れ・使用回数上限の判定もSQLの計算列として同時に行う
+            query = f"""
                 SELECT guild_id, role_id, link_id, created_by_user_id, max_uses, 
-                       current_uses, expires_at, expires_at_unix, created_at, created_at_unix
+                       current_uses, expires_at, expires_at_unix, created_at, created_at_unix,
+                       {LINK_STATUS_SQL} AS status_flags
                 FROM role_invite_links
-                WHERE link_id = %s
+                WHERE {condition}
             """
-            cursor.execute(query, (link_id,))
+            cursor.execute(query, (int(time.time()),) + params)
             result = cursor.fetchone()
             
             if result:
-                return dict(result)
+                return InviteLink.from_row(result)
             return None
             
     except Exception as e:
         logger.error(f"Failed to get invite link full info: {e}")
         return None
 
+@observe_db
+@traced('db.increment_invite_link_usage')
 def increment_invite_link_usage(link_id: str) -> bool:
     """招待リンクの使用回数を+1する"""
     try:
         with get_db_cursor() as cursor:
-            query = """
+            condition, params = link_lookup_condition(link_id)
+            query = f"""
                 UPDATE role_invite_links 
                 SET current_uses = current_uses + 1
-                WHERE link_id = %s
+                WHERE {condition}
             """
-            cursor.execute(query, (link_id,))
+            cursor.execute(query, params)
             
             updated_count = cursor.rowcount
             if updated_count > 0:
@@ -229,4 +257,428 @@ def increment_invite_link_usage(link_id: str) -> bool:
                 
     except Exception as e:
         logger.error(f"Failed to increment invite link usage: {e}")
-        return False
\ No newline at end of file
+        return False
+
+class RoleAssignmentJobs:
+    """サーバー参加・ロール付与ジョブのキューを管理するモデル"""
+    
+    JOB_COLUMNS = """
+        id, job_token, link_id, guild_id, role_id, user_id, username, access_token,
+        status, is_returning, attempts, max_attempts, last_error, run_after_unix, trace_id
+    """
+    
+    @staticmethod
+    @observe_db
+    @traced('db.enqueue_role_assignment_job')
+    def enqueue_role_assignment_job(job_token: str, link_id: str, guild_id: int, role_id: int, user_id: int,
+                                    username: str, access_token: str, max_attempts: int, trace_id: str = None) -> str:
+        """
+        ロール付与ジョブを登録
+        
+        - 同じリンク×ユーザーの未完了ジョブが既にある場合は新規登録せず、そのジョブを返す
+        
+        Args:
+            job_token: ステータス確認用の推測不能なトークン
+            link_id: 招待リンクID
+            guild_id: 参加先のギルドID
+            role_id: 付与するロールID
+            user_id: 対象ユーザーID
+            username: 表示用のユーザー名
+            access_token: サーバー参加に使うOAuthアクセストークン（JOB_TOKEN_KEY設定時は暗号化して保存、参加後に削除）
+            max_attempts: 最大試行回数
+            trace_id: 参加フローの相関ID（ワーカーでの処理のトレースに使う）
+            
+        Returns:
+            str: 登録済みジョブのトークン（失敗した場合はNone）
+        """
+        try:
+            with get_db_cursor() as cursor:
+                now_unix = int(time.time())
+                insert_query = """
+                    INSERT INTO role_assignment_jobs (job_token, link_id, guild_id, role_id, user_id, username,
+                                                      access_token, status, max_attempts, run_after_unix,
+                                                      created_at_unix, updated_at_unix, trace_id)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, 'pending', %s, %s, %s, %s, %s)
+                    ON CONFLICT (link_id, user_id) WHERE status IN ('pending', 'running') DO NOTHING
+                    RETURNING job_token
+                """
+                select_query = """
+                    SELECT job_token FROM role_assignment_jobs
+                    WHERE link_id = %s AND user_id = %s AND status IN ('pending', 'running')
+                """
+                # 既存ジョブが直後に完了した場合に備えて一度だけやり直す
+                for _ in range(2):
+                    cursor.execute(insert_query, (job_token, link_id, guild_id, role_id, user_id, username,
+                                                  encrypt_token(access_token), max_attempts, now_unix, now_unix,
+                                                  now_unix, trace_id))
+                    result = cursor.fetchone()
+                    if result:
+                        return result['job_token']
+                    
+                    cursor.execute(select_query, (link_id, user_id))
+                    result = cursor.fetchone()
+                    if result:
+                        logger.info(f"Role assignment job already queued: link_id={link_id}, user_id={user_id}")
+                        return result['job_token']
+                return None
+                
+        except Exception as e:
+            logger.error(f"Failed to enqueue role assignment job: {e}")
+            return None
+    
+    @staticmethod
+    @observe_db
+    def claim_role_assignment_jobs(limit: int = 1, lease_seconds: int = 60, token_ttl: int = 900) -> list:
+        """
+        実行可能なジョブを取り出して実行中にする
+        
+        - FOR UPDATE SKIP LOCKEDで他のワーカーが取り出し中の行は飛ばす
+        - リース期限を過ぎた実行中ジョブ（ワーカー停止など）も再取得する
+        - 登録からtoken_ttl秒を過ぎたジョブはアクセストークンを削除してから返す
+          （再試行やリース切れで残っていても、トークンを保存しておくのはこの時間まで）
+        - 返すジョブのaccess_tokenは復号済み
+        
+        Args:
+            limit: 取り出す最大件数
+            lease_seconds: 実行中として確保する秒数
+            token_ttl: アクセストークンを保持する秒数（登録時から）
+            
+        Returns:
+            list: 取り出したジョブのリスト
+        """
+        try:
+            with get_db_cursor() as cursor:
+                now_unix = int(time.time())
+                query = f"""
+                    UPDATE role_assignment_jobs
+                    SET status = 'running',
+                        attempts = attempts + 1,
+                        locked_until_unix = %(now)s + %(lease)s,
+                        access_token = CASE WHEN created_at_unix < %(token_expiry)s THEN NULL ELSE access_token END,
+                        updated_at_unix = %(now)s
+                    WHERE id IN (
+                        SELECT id FROM role_assignment_jobs
+                        WHERE status IN ('pending', 'running')
+                          AND run_after_unix <= %(now)s
+                          AND (status = 'pending' OR locked_until_unix < %(now)s)
+                        ORDER BY run_after_unix
+                        LIMIT %(limit)s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING {RoleAssignmentJobs.JOB_COLUMNS}
+                """
+                cursor.execute(query, {'now': now_unix, 'lease': lease_seconds, 'limit': limit,
+                                       'token_expiry': now_unix - token_ttl})
+                jobs = [dict(row) for row in cursor.fetchall()]
+                for job in jobs:
+                    job['access_token'] = decrypt_token(job['access_token'])
+                return jobs
+                
+        except Exception as e:
+            logger.error(f"Failed to claim role assignment jobs: {e}")
+            return []
+    
+    @staticmethod
+    @observe_db
+    @traced('db.complete_role_assignment_job')
+    def complete_role_assignment_job(job_id: int, is_returning: bool) -> bool:
+        """ジョブを成功として完了（アクセストークンは削除）"""
+        try:
+            with get_db_cursor() as cursor:
+                query = """
+                    UPDATE role_assignment_jobs
+                    SET status = 'succeeded', is_returning = %s, access_token = NULL,
+                        locked_until_unix = NULL, last_error = NULL, updated_at_unix = %s
+                    WHERE id = %s
+                """
+                cursor.execute(query, (is_returning, int(time.time()), job_id))
+                return cursor.rowcount > 0
+                
+        except Exception as e:
+            logger.error(f"Failed to complete role assignment job: {e}")
+            return False
+    
+    @staticmethod
+    @observe_db
+    @traced('db.mark_role_assignment_job_joined')
+    def mark_role_assignment_job_joined(job_id: int, is_returning: bool) -> bool:
+        """
+        サーバー参加が済んだことを記録し、不要になったアクセストークンを削除する
+        
+        - 以降の再試行ではサーバー参加を飛ばしてロール付与だけを行う（is_returningがNULLでないことで判定）
+        """
+        try:
+            with get_db_cursor() as cursor:
+                query = """
+                    UPDATE role_assignment_jobs
+                    SET is_returning = %s, access_token = NULL, updated_at_unix = %s
+                    WHERE id = %s
+                """
+                cursor.execute(query, (is_returning, int(time.time()), job_id))
+                return cursor.rowcount > 0
+                
+        except Exception as e:
+            logger.error(f"Failed to mark role assignment job as joined: {e}")
+            return False
+    
+    @staticmethod
+    @observe_db
+    @traced('db.retry_role_assignment_job')
+    def retry_role_assignment_job(job_id: int, run_after_unix: int, error: str) -> bool:
+        """ジョブを指定時刻以降に再実行する"""
+        try:
+            with get_db_cursor() as cursor:
+                query = """
+                    UPDATE role_assignment_jobs
+                    SET status = 'pending', run_after_unix = %s, last_error = %s,
+                        locked_until_unix = NULL, updated_at_unix = %s
+                    WHERE id = %s
+                """
+                cursor.execute(query, (run_after_unix, error, int(time.time()), job_id))
+                return cursor.rowcount > 0
+                
+        except Exception as e:
+            logger.error(f"Failed to reschedule role assignment job: {e}")
+            return False
+    
+    @staticmethod
+    @observe_db
+    @traced('db.fail_role_assignment_job')
+    def fail_role_assignment_job(job_id: int, error: str) -> bool:
+        """ジョブを失敗として完了（アクセストークンは削除）"""
+        try:
+            with get_db_cursor() as cursor:
+                query = """
+                    UPDATE role_assignment_jobs
+                    SET status = 'failed', access_token = NULL, last_error = %s,
+                        locked_until_unix = NULL, updated_at_unix = %s
+                    WHERE id = %s
+                """
+                cursor.execute(query, (error, int(time.time()), job_id))
+                return cursor.rowcount > 0
+                
+        except Exception as e:
+            logger.error(f"Failed to mark role assignment job as failed: {e}")
+            return False
+    
+    @staticmethod
+    @observe_db
+    @traced('db.get_role_assignment_job')
+    def get_role_assignment_job(job_token: str) -> dict:
+        """
+        トークンからジョブの状態を取得
+        
+        Returns:
+            dict: status, username, guild_id, role_id, is_returning（存在しない場合はNone）
+        """
+        try:
+            with get_db_cursor() as cursor:
+                query = """
+                    SELECT status, username, guild_id, role_id, is_returning
+                    FROM role_assignment_jobs
+                    WHERE job_token = %s
+                """
+                cursor.execute(query, (job_token,))
+                result = cursor.fetchone()
+                
+                if result:
+                    return dict(result)
+                return None
+                
+        except Exception as e:
+            logger.error(f"Failed to get role assignment job: {e}")
+            return None
+
+# ロール付与ジョブ関数のエイリアス
+enqueue_role_assignment_job = RoleAssignmentJobs.enqueue_role_assignment_job
+claim_role_assignment_jobs = RoleAssignmentJobs.claim_role_assignment_jobs
+complete_role_assignment_job = RoleAssignmentJobs.complete_role_assignment_job
+mark_role_assignment_job_joined = RoleAssignmentJobs.mark_role_assignment_job_joined
+retry_role_assignment_job = RoleAssignmentJobs.retry_role_assignment_job
+fail_role_assignment_job = RoleAssignmentJobs.fail_role_assignment_job
+get_role_assignment_job = RoleAssignmentJobs.get_role_assignment_job
+
+
+class InviteRedemptions:
+    """招待リンクの利用履歴（リンク×ユーザー）を管理するモデル"""
+    
+    @staticmethod
+    @observe_db
+    @traced('db.has_redeemed_invite_link')
+    def has_redeemed_invite_link(link_id: str, user_id: int) -> bool:
+        """
+        ユーザーがこのリンクで既にロールを取得済みかどうか（付与前の予約は含まない）
+        
+        Args:
+            link_id: 招待リンクID
+            user_id: ユーザーID
+            
+        Returns:
+            bool: 取得済みの場合True
+        """
+        try:
+            with get_db_cursor() as cursor:
+                query = """
+                    SELECT 1 FROM role_invite_redemptions
+                    WHERE link_id = %s AND user_id = %s AND confirmed
+                """
+                cursor.execute(query, (link_id, user_id))
+                return cursor.fetchone() is not None
+                
+        except Exception as e:
+            logger.error(f"Failed to check invite redemption: {e}")
+            return False
+    
+    @staticmethod
+    @observe_db
+    @traced('db.reserve_invite_link_use')
+    def reserve_invite_link_use(link_id: str, user_id: int, guild_id: int, role_id: int) -> str:
+        """
+        ロール付与の前に使用回数を1つ予約する（未確定の利用履歴を追加して使用回数を+1する）
+        
+        - 上限の確認・使用回数の更新・履歴の追加を1つのSQL文で行うため、
+          最後の1回を複数のユーザーが同時に取り合っても上限を超えて付与されない
+        - ロール付与に成功したら confirm_invite_link_redemption() で確定し、
+          ジョブが失敗したら release_invite_link_use() で予約を取り消す
+        
+        Returns:
+            str: 'reserved' = 新たに予約した, 'held' = このユーザーの予約・履歴が既にある,
+                 'exhausted' = 使用回数の上限に達している, 'not_found' = リンクが存在しない,
+                 DBエラーの場合None
+        """
+        try:
+            with get_db_cursor() as cursor:
+                condition, params = link_lookup_condition(link_id)
+                query = f"""
+                    WITH claimed AS (
+                        UPDATE role_invite_links
+                        SET current_uses = current_uses + 1
+                        WHERE {condition}
+                          AND (COALESCE(max_uses, 0) = 0 OR current_uses < max_uses)
+                          AND NOT EXISTS (
+                              SELECT 1 FROM role_invite_redemptions
+                              WHERE link_id = %s AND user_id = %s
+                          )
+                        RETURNING current_uses
+                    ), inserted AS (
+                        INSERT INTO role_invite_redemptions
+                            (link_id, user_id, guild_id, role_id, redeemed_at_unix, confirmed)
+                        SELECT %s, %s, %s, %s, %s, FALSE FROM claimed
+                        ON CONFLICT (link_id, user_id) DO NOTHING
+                        RETURNING link_id
+                    )
+                    SELECT
+                        (SELECT COUNT(*) FROM claimed) AS claimed,
+                        (SELECT COUNT(*) FROM inserted) AS inserted,
+                        EXISTS (
+                            SELECT 1 FROM role_invite_redemptions
+                            WHERE link_id = %s AND user_id = %s
+                        ) AS held,
+                        EXISTS (SELECT 1 FROM role_invite_links WHERE {condition}) AS link_exists
+                """
+                cursor.execute(query, params + (link_id, user_id)
+                               + (link_id, user_id, guild_id, role_id, int(time.time()))
+                               + (link_id, user_id) + params)
+                result = cursor.fetchone()
+                
+                if result['inserted']:
+                    logger.info(f"Invite link use reserved: link_id={link_id}, user_id={user_id}")
+                    return 'reserved'
+                if result['claimed']:
+                    # 同じユーザーの予約が同時に行われ、履歴の追加だけが重複で無視された場合は+1を取り消す
+                    cursor.execute(f"""
+                        UPDATE role_invite_links
+                        SET current_uses = GREATEST(current_uses - 1, 0)
+                        WHERE {condition}
+                    """, params)
+                    return 'held'
+                if result['held']:
+                    return 'held'
+                if not result['link_exists']:
+                    logger.warning(f"Invite link not found for reservation: link_id={link_id}, user_id={user_id}")
+                    return 'not_found'
+                logger.info(f"Invite link exhausted: link_id={link_id}, user_id={user_id}")
+                return 'exhausted'
+                
+        except Exception as e:
+            logger.error(f"Failed to reserve invite link use: {e}")
+            return None
+    
+    @staticmethod
+    @observe_db
+    @traced('db.confirm_invite_link_redemption')
+    def confirm_invite_link_redemption(link_id: str, user_id: int) -> bool:
+        """
+        ロール付与の成功を記録し、予約（reserve_invite_link_use()）を確定する
+        
+        Returns:
+            bool: 今回確定した場合True（既に確定済み・予約が無い場合はFalse）
+        """
+        try:
+            with get_db_cursor() as cursor:
+                query = """
+                    UPDATE role_invite_redemptions
+                    SET confirmed = TRUE, redeemed_at_unix = %s
+                    WHERE link_id = %s AND user_id = %s AND NOT confirmed
+                """
+                cursor.execute(query, (int(time.time()), link_id, user_id))
+                
+                if cursor.rowcount > 0:
+                    logger.info(f"Invite link redeemed: link_id={link_id}, user_id={user_id}")
+                    return True
+                
+                cursor.execute("""
+                    SELECT 1 FROM role_invite_redemptions
+                    WHERE link_id = %s AND user_id = %s
+                """, (link_id, user_id))
+                if cursor.fetchone():
+                    logger.info(f"Repeat redemption ignored: link_id={link_id}, user_id={user_id}")
+                else:
+                    logger.warning(f"No reservation to confirm: link_id={link_id}, user_id={user_id}")
+                return False
+                
+        except Exception as e:
+            logger.error(f"Failed to record invite redemption: {e}")
+            return False
+    
+    @staticmethod
+    @observe_db
+    @traced('db.release_invite_link_use')
+    def release_invite_link_use(link_id: str, user_id: int) -> bool:
+        """
+        未確定の予約を取り消して使用回数を-1する（ジョブが失敗・断念した場合）
+        
+        - 確定済みの履歴は取り消さない
+        
+        Returns:
+            bool: 予約を取り消した場合True
+        """
+        try:
+            with get_db_cursor() as cursor:
+                condition, params = link_lookup_condition(link_id)
+                query = f"""
+                    WITH released AS (
+                        DELETE FROM role_invite_redemptions
+                        WHERE link_id = %s AND user_id = %s AND NOT confirmed
+                        RETURNING link_id
+                    )
+                    UPDATE role_invite_links
+                    SET current_uses = GREATEST(current_uses - 1, 0)
+                    WHERE {condition} AND EXISTS (SELECT 1 FROM released)
+                """
+                cursor.execute(query, (link_id, user_id) + params)
+                
+                if cursor.rowcount > 0:
+                    logger.info(f"Invite link reservation released: link_id={link_id}, user_id={user_id}")
+                    return True
+                return False
+                
+        except Exception as e:
+            logger.error(f"Failed to release invite link reservation: {e}")
+            return False
+
+# 利用履歴関数のエイリアス
+has_redeemed_invite_link = InviteRedemptions.has_redeemed_invite_link
+reserve_invite_link_use = InviteRedemptions.reserve_invite_link_use
+confirm_invite_link_redemption = InviteRedemptions.confirm_invite_link_redemption
+release_invite_link_use = InviteRedemptions.release_invite_link_use
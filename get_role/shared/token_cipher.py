@@ -0,0 +1,55 @@
+import logging
+import os
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+except ImportError:  # cryptographyが無い環境では暗号化せずに保存する（JOB_TOKEN_KEYも設定不可）
+    Fernet = InvalidToken = MultiFernet = None
+
+logger = logging.getLogger(__name__)
+
+#######################
+# ジョブに保存するOAuthアクセストークンの暗号化
+# - 環境変数JOB_TOKEN_KEY（Fernetの鍵、カンマ区切りで複数指定すると先頭で暗号化し、全ての鍵で復号する）
+#   を設定すると、role_assignment_jobs.access_token を暗号化して保存する
+#   - 鍵の作成: python -c "from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())"
+# - 暗号化した値は ENCRYPTED_PREFIX で始まるため、設定前に保存された平文のトークンもそのまま読める
+# - 復号できない値（鍵の入れ替え後など）はNoneとして扱い、ジョブ側でトークン切れとして失敗させる
+#######################
+
+ENCRYPTED_PREFIX = 'enc:v1:'
+
+JOB_TOKEN_KEY = os.getenv('JOB_TOKEN_KEY', '')
+
+
+def _build_cipher(keys: str):
+    keys = [key.strip() for key in keys.split(',') if key.strip()]
+    if not keys:
+        return None
+    if MultiFernet is None:
+        raise RuntimeError("JOB_TOKEN_KEY is set but the cryptography package is not installed")
+    return MultiFernet([Fernet(key) for key in keys])
+
+
+CIPHER = _build_cipher(JOB_TOKEN_KEY)
+
+
+def encrypt_token(token: str) -> str:
+    """保存用にトークンを暗号化（JOB_TOKEN_KEY未設定の場合はそのまま返す）"""
+    if token is None or CIPHER is None:
+        return token
+    return ENCRYPTED_PREFIX + CIPHER.encrypt(token.encode()).decode()
+
+
+def decrypt_token(value: str) -> str:
+    """保存されたトークンを復号（復号できない場合はNone）"""
+    if value is None or not value.startswith(ENCRYPTED_PREFIX):
+        return value
+    if CIPHER is None:
+        logger.error("Encrypted access token found but JOB_TOKEN_KEY is not set")
+        return None
+    try:
+        return CIPHER.decrypt(value[len(ENCRYPTED_PREFIX):].encode()).decode()
+    except InvalidToken:
+        logger.error("Failed to decrypt access token (JOB_TOKEN_KEY changed?)")
+        return None
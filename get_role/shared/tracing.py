@@ -0,0 +1,176 @@
+import functools
+import inspect
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+#######################
+# 参加フローのトレース（OpenTelemetryのspanに近い形式）
+# - spanは処理の名前・開始/終了時刻・属性・親のspanを持ち、同じtrace_idでつながる
+# - trace_idを参加フローの相関IDとして使う
+#   - /join/<link_id> で新しく発行してセッションに保存し、OAuthから戻った /callback で引き継ぐ
+#   - ロール付与ジョブにも保存し、ワーカーでの処理も同じtrace_idでつなげる
+# - 現在のspanはcontextvarsで保持する
+#   - run_coroutine()（run_coroutine_threadsafe）は呼び出し元のコンテキストを引き継ぐ
+#   - run_blocking()のスレッドプールには明示的にコンテキストを渡す（shared/async_runtime.py）
+# - 出力先は環境変数TRACE_EXPORTERで選ぶ
+#   - console: 1 spanを1行で標準出力に出力
+#   - file: TRACE_FILE（既定 traces.jsonl）にJSON Linesで追記
+#   - 未設定: 出力しない（相関IDの受け渡しだけ行う）
+#######################
+
+TRACE_EXPORTER = os.getenv('TRACE_EXPORTER', '').lower()
+TRACE_FILE = os.getenv('TRACE_FILE', 'traces.jsonl')
+
+_current_span = ContextVar('current_span', default=None)
+
+
+def new_trace_id() -> str:
+    """新しいtrace_id（相関ID、32桁の16進数）"""
+    return secrets.token_hex(16)
+
+
+class Span:
+    """1つの処理の区間"""
+
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'attributes', 'status',
+                 'start_unix', '_started', 'duration', '_token')
+
+    def __init__(self, name: str, trace_id: str, parent_id: str = None, attributes: dict = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes or {}
+        self.status = 'ok'
+        self.start_unix = time.time()
+        self._started = time.perf_counter()
+        self.duration = None
+        self._token = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException):
+        self.status = 'error'
+        self.attributes['error.type'] = type(error).__name__
+        self.attributes['error.message'] = str(error)[:200]
+
+    def end(self, error: BaseException = None):
+        """spanを終了して出力（begin_span()で開始したものは現在のspanを元に戻す）"""
+        if self.duration is not None:
+            return
+        if error is not None:
+            self.record_error(error)
+        self.duration = time.perf_counter() - self._started
+        if self._token is not None:
+            _current_span.reset(self._token)
+            self._token = None
+        EXPORTER.export(self)
+
+    def to_dict(self) -> dict:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_span_id': self.parent_id,
+            'name': self.name,
+            'start_unix': round(self.start_unix, 6),
+            'duration_ms': round(self.duration * 1000, 3),
+            'status': self.status,
+            'attributes': self.attributes,
+        }
+
+
+class SpanExporter:
+    """終了したspanをTRACE_EXPORTERの設定に従って出力"""
+
+    def __init__(self, kind: str = TRACE_EXPORTER, path: str = TRACE_FILE):
+        self.kind = kind
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def export(self, span: Span):
+        if self.kind == 'console':
+            attributes = ' '.join(f"{key}={value}" for key, value in span.attributes.items())
+            line = f"[trace {span.trace_id}] {span.name} {span.duration * 1000:.1f}ms {span.status} {attributes}".rstrip()
+            # 複数のスレッドから出力しても行が混ざらないよう、改行まで1回で書き込む
+            with self._lock:
+                print(line + '\n', end='', flush=True)
+        elif self.kind == 'file':
+            line = json.dumps(span.to_dict(), ensure_ascii=False, default=str) + '\n'
+            with self._lock:
+                try:
+                    if self._file is None:
+                        self._file = open(self.path, 'a', encoding='utf-8', buffering=1)
+                    self._file.write(line)
+                except OSError as e:
+                    print(f"Failed to write trace span: {e}")
+
+
+EXPORTER = SpanExporter()
+
+
+def current_span() -> Span:
+    """現在のspan（無ければNone）"""
+    return _current_span.get()
+
+
+def current_trace_id() -> str:
+    """現在の相関ID（spanの外ではNone）"""
+    span = _current_span.get()
+    return span.trace_id if span else None
+
+
+def begin_span(name: str, trace_id: str = None, **attributes) -> Span:
+    """
+    spanを開始して現在のspanにする（終了はspan.end()、同じコンテキストで呼ぶこと）
+
+    - trace_idを省略した場合は現在のspanのtrace_idを引き継ぎ、それも無ければ新しく発行する
+    - Flaskのbefore_request / teardown_request のように開始と終了が別の関数になる場合に使う
+    """
+    parent = _current_span.get()
+    if trace_id is None:
+        trace_id = parent.trace_id if parent else new_trace_id()
+    parent_id = parent.span_id if parent and parent.trace_id == trace_id else None
+    span = Span(name, trace_id, parent_id, attributes)
+    span._token = _current_span.set(span)
+    return span
+
+
+@contextmanager
+def start_span(name: str, trace_id: str = None, **attributes):
+    """withブロックをspanとして記録するコンテキストマネージャー"""
+    span = begin_span(name, trace_id, **attributes)
+    try:
+        yield span
+    except BaseException as e:
+        span.end(e)
+        raise
+    span.end()
+
+
+def traced(name: str = None):
+    """関数（asyncも可）の呼び出しをspanとして記録するデコレーター"""
+
+    def decorator(func):
+        span_name = name or func.__name__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with start_span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with start_span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator